@@ -1,14 +1,61 @@
 # eventlog package
+#
+# Submodules (and with them protobuf, prometheus_client, and ssl) are
+# imported on first use of a name exported here, so that 'import eventlog'
+# is fast for short-lived programs. On python < 3.7 (without module
+# __getattr__), everything is imported eagerly.
+import sys
 
-from .config import getConfigSetting, initMiddleware
-from .event import makeMessage, newEvent
-from .handler import ConsoleEventHandler, EventFormatter,\
-    EventHandler, format_console
-from .proto import formatTstampAsMillis, formatTstampAsNanos
-from .transport import NetTransport
+from .config import Config, getConfig, getConfigSetting, initMiddleware
 
 __version__ = "0.9.210"  # keep in sync with ../../setup.py
 
+# exported name -> submodule that defines it
+_LAZY = {
+    'eventContext': '.context',
+    'makeMessage': '.event',
+    'newEvent': '.event',
+    'Event': '.event_pb2',
+    'FanoutHandler': '.fanout',
+    'PriorityHandler': '.fanout',
+    'Sink': '.fanout',
+    'FileTransport': '.filetransport',
+    'DedupFilter': '.filters',
+    'LevelFilter': '.filters',
+    'NameDenyFilter': '.filters',
+    'ConsoleEventHandler': '.handler',
+    'EventFormatter': '.handler',
+    'EventHandler': '.handler',
+    'format_console': '.handler',
+    'EventMiddleware': '.middleware',
+    'formatTstampAsMillis': '.proto',
+    'formatTstampAsNanos': '.proto',
+    'FlightRecorderHandler': '.recorder',
+    'RouterHandler': '.routing',
+    'Route': '.routing',
+    'Rule': '.routing',
+    'NetTransport': '.transport',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(__import__(module[1:], globals(), None, [name], 1), name)
+    # cache, so later lookups don't come here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+if sys.version_info < (3, 7):
+    for _name in _LAZY:
+        __getattr__(_name)
+
 
 # internal global for default loger
 _systemDefaultEventHandler = None
@@ -17,6 +64,9 @@ _systemDefaultEventHandler = None
 # Return system default event logger, creating it if necessary
 # Uses configuration provided by environment variables
 def defaultEventHandler():
+    from .handler import ConsoleEventHandler, EventHandler
+    from .transport import NetTransport
+
     handler = _systemDefaultEventHandler
     if handler is None:
         # If connection fails, this throws an exception
@@ -44,26 +94,59 @@ def logEvent(e):
 
 __all__ = [
 
-    __version__,
-    defaultEventHandler,
-    logEvent,
-    setDefaultEventHandler,
+    '__version__',
+    'defaultEventHandler',
+    'logEvent',
+    'setDefaultEventHandler',
 
     # config
-    getConfigSetting,
-    initMiddleware,
+    'Config',
+    'getConfig',
+    'getConfigSetting',
+    'initMiddleware',
+
+    # context
+    'eventContext',
 
     # event
-    makeMessage,
-    newEvent,
+    'makeMessage',
+    'newEvent',
+    'Event',
+
+    # fanout
+    'FanoutHandler',
+    'PriorityHandler',
+    'Sink',
+
+    # filetransport
+    'FileTransport',
+
+    # filters
+    'DedupFilter',
+    'LevelFilter',
+    'NameDenyFilter',
 
     # handler
-    ConsoleEventHandler,
-    EventFormatter,
-    EventHandler,
-    format_console,
+    'ConsoleEventHandler',
+    'EventFormatter',
+    'EventHandler',
+    'format_console',
+
+    # middleware (for ASGI, see eventlog.asgi)
+    'EventMiddleware',
 
     # proto
-    formatTstampAsMillis,
-    formatTstampAsNanos,
+    'formatTstampAsMillis',
+    'formatTstampAsNanos',
+
+    # recorder
+    'FlightRecorderHandler',
+
+    # routing
+    'RouterHandler',
+    'Route',
+    'Rule',
+
+    # transport
+    'NetTransport',
 ]
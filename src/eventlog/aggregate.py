@@ -0,0 +1,277 @@
+# aggregate.py
+#
+# In-process aggregation of counters, gauges, and timers.
+# Instead of sending an event on every change or measurement, updates
+# are accumulated in memory per (name, target, fields) series, and one
+# summary event per series is sent each flush interval by a background thread.
+import functools
+import sys
+import threading
+import time
+
+import six
+
+from .config import getConfig
+from .event import newEvent
+from .histogram import Histogram
+from .loglevel import INFO
+
+# AGGREGATE_INTERVAL_SEC is the default time between flushes of aggregated values
+# (at import time; aggregators use the current setting when created)
+AGGREGATE_INTERVAL_SEC = getConfig().aggregate_interval_sec
+
+
+# _Summary accumulates updates for a single series between flushes
+class _Summary(object):
+
+    def __init__(self, name, target, fields):
+        self.name = name
+        self.target = target
+        self.fields = fields
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self.delta = 0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.level = INFO
+        self.message = None
+
+    # record an update
+    # @param value the new value
+    # @param delta change in value (for counters), 0 for gauges
+    def record(self, value, delta, level, message):
+        with self._lock:
+            self.count += 1
+            self.delta += delta
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            self.last = value
+            self.level = level
+            if message is not None:
+                self.message = message
+
+    # collect returns a list with the summary Event for updates
+    # since the last collect, or an empty list if there were no updates
+    def collect(self):
+        with self._lock:
+            if self.count == 0:
+                return []
+            (count, delta, vmin, vmax, last, level, message) = (
+                self.count, self.delta, self.min, self.max,
+                self.last, self.level, self.message)
+            self._reset()
+        f = dict(self.fields)
+        f['count'] = count
+        f['delta'] = delta
+        f['min'] = vmin
+        f['max'] = vmax
+        return [newEvent(self.name,
+                         self.target,
+                         level=level,
+                         value=last,
+                         fields=f,
+                         message=message)]
+
+
+# MetricAggregator holds aggregated series for an EventHandler and
+# flushes them periodically from a daemon thread.
+# A series is any object with a collect() method that returns a list
+# of events and resets its state.
+# The thread is started when the first series is created.
+class MetricAggregator(object):
+
+    # @param eventHandler handler that receives the summary events
+    # @param interval seconds between flushes; default from settings
+    def __init__(self, eventHandler, interval=None):
+        self.eventHandler = eventHandler
+        self.interval = interval or getConfig().aggregate_interval_sec
+        self._series = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    # getSeries returns the series for key, creating it with factory() if needed
+    def getSeries(self, key, factory):
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = factory()
+                    self._series[key] = series
+                    self._start()
+        return series
+
+    def _start(self):
+        if self._thread is None and not self._stopped.is_set():
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # keep the flush thread alive
+                sys.stderr.write("ERROR: aggregate flush failed: %s\n" % str(e))
+
+    # flush sends one summary event for each series updated since last flush
+    def flush(self):
+        with self._lock:
+            series = list(self._series.values())
+        for s in series:
+            for e in s.collect():
+                self.eventHandler.logEvent(e)
+
+    # close stops the flush thread and sends final summaries
+    def close(self):
+        self._stopped.set()
+        self.flush()
+
+
+# _AggregatingValue is a Counter or Gauge whose changes are aggregated
+# and logged once per flush interval, rather than once per change.
+# It has the same interface as handler._LoggingValue.
+# Updates are thread-safe.
+class _AggregatingValue(object):
+
+    def __init__(self,
+                 aggregator,
+                 name,
+                 target='',
+                 initialValue=0,
+                 fields={}
+                 ):
+        self.aggregator = aggregator
+        self.name = name
+        self.target = target
+        self.value = initialValue
+        self.fields = fields
+        self._lock = threading.Lock()
+        self._series = None
+
+    def _getSeries(self, params):
+        if not params:
+            # common case: series cached on this value
+            if self._series is None:
+                self._series = self._lookup(self.fields)
+            return self._series
+        f = dict(self.fields)
+        f.update(params)
+        return self._lookup(f)
+
+    def _lookup(self, fields):
+        key = ('value', self.name, self.target, frozenset(six.iteritems(fields)))
+        return self.aggregator.getSeries(
+            key, lambda: _Summary(self.name, self.target, dict(fields)))
+
+    # Set a new value. The value is logged at the next flush
+    def set(self, value, params={}, message=None, level=INFO):
+        series = self._getSeries(params)
+        with self._lock:
+            self.value = value
+            series.record(value, 0, level, message)
+
+    # get returns the current value of the counter or gauge
+    def get(self):
+        return self.value
+
+    # Increment Counter
+    # @param delta amount to increment, default 1
+    # @param params optional additional fields, used to select the series
+    # @param message optional message
+    def inc(self, delta=1, params={}, message=None):
+        series = self._getSeries(params)
+        with self._lock:
+            self.value += delta
+            series.record(self.value, delta, INFO, message)
+
+
+# _clock is a high-resolution clock for measuring durations
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+# _TimerSeries collects durations for a single series into a histogram
+class _TimerSeries(object):
+
+    def __init__(self, name, target, fields):
+        self.name = name
+        self.target = target
+        self.fields = fields
+        self.histogram = Histogram()
+
+    def record(self, seconds):
+        self.histogram.record(seconds)
+
+    # collect returns a list with one event summarizing durations since
+    # the last collect (count, sum, p50, p90, p99, max in fields;
+    # mean duration in event.duration), or an empty list if there were none
+    def collect(self):
+        h = self.histogram.snapshot()
+        if h.count == 0:
+            return []
+        f = dict(self.fields)
+        f['count'] = h.count
+        f['sum'] = h.sum
+        f['p50'] = h.percentile(0.5)
+        f['p90'] = h.percentile(0.9)
+        f['p99'] = h.percentile(0.99)
+        f['max'] = h.max
+        return [newEvent(self.name,
+                         self.target,
+                         value=h.count,
+                         duration=h.sum / h.count,
+                         fields=f)]
+
+
+# _Timer measures durations and records them in an aggregated histogram.
+# It can be used as a context manager or as a function decorator,
+# and is safe to share between threads and to nest.
+#
+#    timer = handler.timer("db_query", "users")
+#    with timer:
+#        ...
+#
+#    @handler.timer("render", "home_page")
+#    def render():
+#        ...
+class _Timer(object):
+
+    def __init__(self, aggregator, name, target='', fields={}):
+        # timers and values with the same name and target are separate series
+        key = ('timer', name, target, frozenset(six.iteritems(fields)))
+        self._series = aggregator.getSeries(
+            key, lambda: _TimerSeries(name, target, dict(fields)))
+        self._local = threading.local()
+
+    # record a duration, in seconds
+    def record(self, seconds):
+        self._series.record(seconds)
+
+    def __enter__(self):
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = self._local.starts = []
+        starts.append(_clock())
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self._series.record(_clock() - self._local.starts.pop())
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = _clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._series.record(_clock() - start)
+        return timed
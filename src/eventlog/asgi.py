@@ -0,0 +1,44 @@
+# asgi.py
+#
+# ASGI middleware that attaches the request's HttpInfo to all events logged
+# while handling a request, and logs one event when it completes
+# (see eventlog.middleware):
+#
+#    app = AsgiEventMiddleware(app)
+#
+# Requires python 3.5 or later
+from .context import eventContext
+from .middleware import _clock, httpInfoFromScope, logRequest
+
+
+# AsgiEventMiddleware is ASGI (3.0) middleware
+class AsgiEventMiddleware(object):
+
+    # @param app ASGI application
+    # @param handler EventHandler for request completion events;
+    #       default is the default event handler (eventlog.defaultEventHandler)
+    def __init__(self, app, handler=None):
+        self.app = app
+        self.handler = handler
+
+    async def __call__(self, scope, receive, send):
+        if scope.get('type') != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = _clock()
+        info = httpInfoFromScope(scope)
+        status = [500]
+
+        async def sendMessage(message):
+            if message.get('type') == 'http.response.start':
+                status[0] = message.get('status', 200)
+            await send(message)
+
+        with eventContext(http=info):
+            try:
+                await self.app(scope, receive, sendMessage)
+            except Exception:
+                status[0] = 500
+                raise
+            finally:
+                logRequest(self.handler, info, status[0], start)
@@ -0,0 +1,172 @@
+# collector.py
+#
+# Minimal event collector: accepts connections from event senders,
+# decodes the events, and appends them to rotating files.
+# Used as a local forwarder endpoint and for load-testing senders.
+#
+#   python -m eventlog.collector --port 9000 --output /var/log/events/events.log
+#
+# Requires python 3.7 or later (asyncio.BufferedProtocol)
+import argparse
+import asyncio
+import os
+import sys
+
+from .decoder import FORMATS, StreamDecoder
+from .wire import FRAME_EVENT, makeFrame
+
+try:
+    from google.protobuf.json_format import MessageToDict
+except ImportError:
+    MessageToDict = None
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+
+# RotatingFileWriter appends data to a file, rotating it when it
+# reaches maxBytes: path -> path.1 -> path.2 ... up to backupCount
+class RotatingFileWriter(object):
+
+    # @param path output file
+    # @param maxBytes rotate when the file would exceed this size; 0 never rotates
+    # @param backupCount number of rotated files to keep
+    def __init__(self, path, maxBytes=0, backupCount=5):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self._file = open(path, 'ab')
+        self._size = self._file.tell()
+
+    def write(self, data):
+        if self.maxBytes and self._size and self._size + len(data) > self.maxBytes:
+            self.rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def rotate(self):
+        self._file.close()
+        for i in range(self.backupCount - 1, 0, -1):
+            src = "%s.%d" % (self.path, i)
+            if os.path.exists(src):
+                os.replace(src, "%s.%d" % (self.path, i + 1))
+        if self.backupCount > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'ab')
+        self._size = 0
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# encodeEvent encodes a decoded event for the output file
+# @param outFormat 'frames' (FRAME_EVENT frames) or 'json' (JSON lines)
+def encodeEvent(e, outFormat):
+    if isinstance(e, dict):
+        # received as json
+        if outFormat == 'frames':
+            raise ValueError("json input can only be written as json")
+        return (json.dumps(e) + '\n').encode('utf-8')
+    if outFormat == 'frames':
+        return makeFrame(FRAME_EVENT, e.SerializeToString())
+    if hasattr(e, 'to_dict'):
+        # capnp reader
+        return (json.dumps(e.to_dict()) + '\n').encode('utf-8')
+    return (json.dumps(MessageToDict(e)) + '\n').encode('utf-8')
+
+
+# CollectorProtocol receives and decodes events from one connection.
+# Data is received directly into the decoder's buffer
+class CollectorProtocol(asyncio.BufferedProtocol):
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.decoder = StreamDecoder(collector.format)
+
+    def get_buffer(self, sizehint):
+        return self.decoder.getBuffer(max(sizehint, 0))
+
+    def buffer_updated(self, nbytes):
+        self.decoder.bufferUpdated(nbytes)
+        try:
+            for e in self.decoder.events():
+                self.collector.write(e)
+        except Exception as e:
+            sys.stderr.write("ERROR: collector: bad data from %s: %s\n"
+                             % (self.transport.get_extra_info('peername'), repr(e)))
+            self.transport.close()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if self.decoder.pending():
+            sys.stderr.write("ERROR: collector: connection closed with %d bytes of partial data\n"
+                             % self.decoder.pending())
+        self.collector.writer.flush()
+
+
+# Collector writes all events received on its connections to one writer
+class Collector(object):
+
+    # @param writer RotatingFileWriter (or any object with write and flush)
+    # @param format input format (see decoder.FORMATS)
+    # @param outFormat 'frames' or 'json'
+    def __init__(self, writer, format='auto', outFormat='frames'):
+        self.writer = writer
+        self.format = format
+        self.outFormat = outFormat
+        self.count = 0
+
+    def write(self, e):
+        self.writer.write(encodeEvent(e, self.outFormat))
+        self.count += 1
+
+    def protocol(self):
+        return CollectorProtocol(self)
+
+    # start listening; returns the asyncio server
+    async def start(self, host, port):
+        loop = asyncio.get_running_loop()
+        return await loop.create_server(self.protocol, host, port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m eventlog.collector",
+                                     description="Collect events and write them to rotating files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--format", choices=FORMATS, default="auto", help="input format")
+    parser.add_argument("--output", default="events.log", help="output file")
+    parser.add_argument("--output-format", choices=("frames", "json"), default="frames")
+    parser.add_argument("--max-bytes", type=int, default=100 * 1024 * 1024,
+                        help="rotate output file at this size (0 never rotates)")
+    parser.add_argument("--backup-count", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    writer = RotatingFileWriter(args.output, args.max_bytes, args.backup_count)
+    collector = Collector(writer, args.format, args.output_format)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(collector.start(args.host, args.port))
+    sys.stderr.write("collector listening on %s:%d\n" % (args.host, args.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        writer.close()
+        sys.stderr.write("collector: %d events\n" % collector.count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# columnar.py
+#
+# Columnar encoding of a batch of events, for analytics sinks
+# (such as ClickHouse) that insert blocks of rows without parsing
+# each event.
+#
+# Block layout:
+#   row count (varint) | column count (varint) | columns...
+# Column layout:
+#   name len (varint) | name (utf-8) | type (1 byte) | data len (varint) | data
+#
+# Column types:
+#   'd'  little-endian float64 per row
+#   'Q'  little-endian uint64 per row
+#   'I'  little-endian uint32 per row
+#   'S'  strings: for each row, len (varint) | utf-8
+#   'B'  byte strings: for each row, len (varint) | bytes
+#   'D'  dictionary-encoded strings: dictionary size (varint),
+#        dictionary entries (as 'S'), then uint32 index per row
+#   'X'  dictionary-encoded byte strings, same layout as 'D'
+#
+# Fields and labels are stored as a per-row count column ('fields.count',
+# 'labels.count') plus columns with one entry per field or label.
+# Field values are serialized Extra messages without the key, so typed
+# values are preserved. Everything not stored in its own column is kept
+# in 'rest' (the protobuf Event without those fields), so decoding is lossless.
+# 'level' and 'host' are copied from the log and server sub-messages for
+# convenience; the sub-messages themselves remain in 'rest'.
+#
+# decodeColumns returns numeric columns as NumPy arrays if NumPy is
+# installed (without copying), otherwise as array.array.
+import struct
+import sys
+from array import array
+
+import six
+
+from .event_pb2 import Event, Extra
+from .wire import FRAME_COLUMN_BLOCK, FRAME_EVENT, decodeVarint, encodeVarint, makeFrame, \
+    stripFields
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Event field numbers stored in their own columns
+_COLUMN_FIELDS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 14, 15)
+# protobuf field number of Extra.key
+_EXTRA_KEY = 1
+
+_STRUCT_TYPES = {'d': 'd', 'Q': 'Q', 'I': 'I'}
+_NUMPY_TYPES = {'d': '<f8', 'Q': '<u8', 'I': '<u4'}
+
+
+def _packNumbers(code, values):
+    return struct.pack('<%d%s' % (len(values), _STRUCT_TYPES[code]), *values)
+
+
+def _packStrings(values):
+    out = bytearray()
+    for v in values:
+        if isinstance(v, six.text_type):
+            v = v.encode('utf-8')
+        out += encodeVarint(len(v))
+        out += v
+    return bytes(out)
+
+
+def _packDict(values):
+    index = {}
+    keys = []
+    rows = []
+    for v in values:
+        i = index.get(v)
+        if i is None:
+            i = index[v] = len(keys)
+            keys.append(v)
+        rows.append(i)
+    return encodeVarint(len(keys)) + _packStrings(keys) + _packNumbers('I', rows)
+
+
+def _column(name, code, data):
+    name = name.encode('utf-8')
+    return b''.join((encodeVarint(len(name)), name, six.int2byte(ord(code)),
+                     encodeVarint(len(data)), data))
+
+
+# encodeColumns encodes a list of Events as a column block
+def encodeColumns(events):
+    n = len(events)
+    fieldCounts = []
+    fieldKeys = []
+    fieldValues = []
+    labelCounts = []
+    labels = []
+    rest = []
+    for e in events:
+        fieldCounts.append(len(e.fields))
+        for f in e.fields:
+            fieldKeys.append(f.key)
+            fieldValues.append(stripFields(f.SerializeToString(), (_EXTRA_KEY,)))
+        labelCounts.append(len(e.labels))
+        labels.extend(e.labels)
+        rest.append(stripFields(e.SerializeToString(), _COLUMN_FIELDS))
+
+    columns = [
+        _column('tstamp', 'd', _packNumbers('d', [e.tstamp for e in events])),
+        _column('eid', 'Q', _packNumbers('Q', [e.eid for e in events])),
+        _column('name', 'D', _packDict([e.name for e in events])),
+        _column('target', 'D', _packDict([e.target for e in events])),
+        _column('level', 'I', _packNumbers('I', [e.log.level for e in events])),
+        _column('value', 'd', _packNumbers('d', [e.value for e in events])),
+        _column('duration', 'd', _packNumbers('d', [e.duration for e in events])),
+        _column('session', 'D', _packDict([e.session for e in events])),
+        _column('user', 'D', _packDict([e.user for e in events])),
+        _column('host', 'D', _packDict([e.server.host for e in events])),
+        _column('message', 'S', _packStrings([e.message for e in events])),
+        _column('labels.count', 'I', _packNumbers('I', labelCounts)),
+        _column('labels', 'D', _packDict(labels)),
+        _column('fields.count', 'I', _packNumbers('I', fieldCounts)),
+        _column('fields.key', 'D', _packDict(fieldKeys)),
+        _column('fields.value', 'B', _packStrings(fieldValues)),
+        _column('rest', 'X', _packDict(rest)),
+    ]
+    return encodeVarint(n) + encodeVarint(len(columns)) + b''.join(columns)
+
+
+def _unpackNumbers(code, data):
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype=_NUMPY_TYPES[code])
+    if six.PY3:
+        a = array(code)
+        a.frombytes(data)
+        if sys.byteorder == 'big':
+            a.byteswap()
+        return a
+    return list(struct.unpack('<%d%s' % (len(data) // struct.calcsize(code), code), bytes(data)))
+
+
+def _unpackStrings(data, count, decode):
+    values = []
+    pos = 0
+    for i in range(count):
+        (length, pos) = decodeVarint(data, pos)
+        v = bytes(data[pos:pos + length])
+        values.append(v.decode('utf-8') if decode else v)
+        pos += length
+    return (values, pos)
+
+
+def _unpackColumn(code, data, count):
+    if code in _STRUCT_TYPES:
+        return _unpackNumbers(code, data)
+    if code in ('S', 'B'):
+        return _unpackStrings(data, count, code == 'S')[0]
+    if code in ('D', 'X'):
+        (nkeys, pos) = decodeVarint(data, 0)
+        (keys, used) = _unpackStrings(data[pos:], nkeys, code == 'D')
+        rows = _unpackNumbers('I', data[pos + used:])
+        return [keys[i] for i in rows]
+    raise ValueError("unknown column type %s" % code)
+
+
+# decodeColumns decodes a column block
+# Returns (number of rows, dict of column name -> column values)
+def decodeColumns(buf):
+    buf = memoryview(buf)
+    (nrows, pos) = decodeVarint(buf, 0)
+    (ncols, pos) = decodeVarint(buf, pos)
+    raw = []
+    for i in range(ncols):
+        (length, pos) = decodeVarint(buf, pos)
+        name = bytes(buf[pos:pos + length]).decode('utf-8')
+        pos += length
+        code = chr(six.indexbytes(buf, pos))
+        (length, pos) = decodeVarint(buf, pos + 1)
+        raw.append((name, code, buf[pos:pos + length]))
+        pos += length
+    # numeric columns first: the number of entries in list columns
+    # (X or X.*) is the sum of the X.count column
+    cols = {}
+    for (name, code, data) in raw:
+        if code in _STRUCT_TYPES:
+            cols[name] = _unpackColumn(code, data, nrows)
+    for (name, code, data) in raw:
+        if code not in _STRUCT_TYPES:
+            counts = cols.get(name.split('.')[0] + '.count')
+            count = nrows if counts is None else int(sum(counts))
+            cols[name] = _unpackColumn(code, data, count)
+    return (nrows, cols)
+
+
+# columnsToEvents rebuilds the Events from decoded columns
+def columnsToEvents(nrows, cols):
+    events = []
+    fi = 0
+    li = 0
+    for i in range(nrows):
+        e = Event.FromString(cols['rest'][i])
+        e.tstamp = float(cols['tstamp'][i])
+        e.eid = int(cols['eid'][i])
+        e.name = cols['name'][i]
+        e.target = cols['target'][i]
+        e.value = float(cols['value'][i])
+        e.duration = float(cols['duration'][i])
+        e.session = cols['session'][i]
+        e.user = cols['user'][i]
+        e.message = cols['message'][i]
+        n = int(cols['labels.count'][i])
+        e.labels.extend(cols['labels'][li:li + n])
+        li += n
+        n = int(cols['fields.count'][i])
+        for j in range(fi, fi + n):
+            f = Extra.FromString(cols['fields.value'][j])
+            f.key = cols['fields.key'][j]
+            e.fields.extend([f])
+        fi += n
+        events.append(e)
+    return events
+
+
+# ColumnarFramer sends each batch of events as one column block frame.
+# Column blocks only pay off for batches: EventHandler sends one event
+# per send(), so use a Sink with batchSize (see eventlog.fanout) between
+# the handler and the transport. Batches of fewer than minRows events
+# are sent as FRAME_EVENT frames, which are smaller for a single row.
+class ColumnarFramer(object):
+
+    def __init__(self, minRows=2):
+        self.minRows = minRows
+
+    def frame(self, messages, state):
+        if len(messages) < self.minRows:
+            return [(makeFrame(FRAME_EVENT, e.SerializeToString()), 1) for e in messages]
+        return [(makeFrame(FRAME_COLUMN_BLOCK, encodeColumns(messages)), len(messages))]
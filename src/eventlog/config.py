@@ -1,5 +1,8 @@
-import inspect
 import os
+import sys
+import types
+
+import six
 
 _getUserContext = None
 
@@ -11,7 +14,7 @@ _getUserContext = None
 # If _getUserContext isn't set, the event will not be populated automatically
 # with these fields: reqid, user, session
 def initMiddleware(getUserContext):
-    if (inspect.isfunction(getUserContext)):
+    if isinstance(getUserContext, types.FunctionType):
         global _getUserContext
         _getUserContext = getUserContext
 
@@ -20,6 +23,7 @@ def initMiddleware(getUserContext):
 #  or, if in django, from django.settings
 #  If defined in both, environment takes precedence
 #  If defined in neither, returns defaultVal
+#  Settings used by this package are read once, with getConfig() (below)
 def getConfigSetting(key, defaultVal=None):
     val = os.environ.get(key, None)
     if val is None and os.environ.get('DJANGO_SETTINGS_MODULE', None):
@@ -29,3 +33,208 @@ def getConfigSetting(key, defaultVal=None):
         except ImportError:
             pass
     return val or defaultVal
+
+
+# Config settings are resolved once, parsed, and validated, and are read
+# from a snapshot afterwards. Settings come from the environment or,
+# if DJANGO_SETTINGS_MODULE is set, from django.conf.settings
+# (environment takes precedence).
+#
+# Values are available as attributes, named without the EVENTLOG_ prefix,
+# in lower case:   getConfig().socket_timeout
+#
+# reload() resolves the settings again; components that cache settings
+# register with onReload(). installReloadSignal() reloads on SIGHUP.
+
+def _parseBool(s):
+    if isinstance(s, bool):
+        return s
+    v = str(s).strip().lower()
+    if v in ('1', 'true', 'yes', 'on'):
+        return True
+    if v in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError("not a boolean: %s" % s)
+
+
+def _choice(*choices):
+    def parse(s):
+        if s not in choices:
+            raise ValueError("must be one of %s" % ", ".join(choices))
+        return s
+    return parse
+
+
+def _positive(parse):
+    def check(s):
+        v = parse(s)
+        if v <= 0:
+            raise ValueError("must be positive")
+        return v
+    return check
+
+
+def _deployType(s):
+    from .event_pb2 import DeployType
+    if isinstance(s, int):
+        return s
+    return DeployType.Value(str(s).upper())
+
+
+def _nodeId(s):
+    v = int(s)
+    if not 0 <= v <= 1023:
+        raise ValueError("must be between 0 and 1023")
+    return v
+
+
+# setting name, parser, default value
+SETTINGS = [
+    # log receiver connection
+    ("EVENTLOG_HOST", str, None),
+    ("EVENTLOG_PORT", int, 0),
+    ("EVENTLOG_MAX_SEND_ATTEMPTS", _positive(int), 3),
+    ("EVENTLOG_PEAK_CONNECTIONS", _positive(int), 5),
+    # overrides of the above for NetTransport.createFromEnv
+    ("EVENTLOG_SEND_ATTEMPTS", _positive(int), None),
+    ("EVENTLOG_CPOOL_SIZE", _positive(int), None),
+    ("EVENTLOG_SOCKET_TIMEOUT", _positive(float), 5.0),
+    ("EVENTLOG_MAX_MESSAGE_LEN", _positive(int), 32 * 1024),
+    ("EVENTLOG_HEALTHCHECK_INTERVAL_SEC", _positive(int), 3),
+    ("EVENTLOG_HEALTHCHECK_PRINT_INTERVAL_SEC", _positive(int), 60),
+    # TLS
+    ("EVENTLOG_TLS_ENABLE", _parseBool, False),
+    ("EVENTLOG_TLS_VERIFY", _parseBool, False),
+    ("EVENTLOG_TLS_KEYFILE", str, None),
+    ("EVENTLOG_TLS_CERTFILE", str, None),
+    ("EVENTLOG_TLS_CA_CERTS", str, None),
+    # batching and queueing of events for sinks
+    ("EVENTLOG_BATCH_SIZE", _positive(int), 100),
+    ("EVENTLOG_QUEUE_SIZE", _positive(int), 10000),
+    # compression of rotated files
+    ("EVENTLOG_COMPRESSION", _choice('none', 'gzip'), 'none'),
+    # exception stack traces: full trace sent once per window per fingerprint
+    ("EVENTLOG_TRACE_WINDOW_SEC", _positive(float), 60.0),
+    ("EVENTLOG_TRACE_CACHE_SIZE", _positive(int), 1024),
+    # aggregated metrics
+    ("EVENTLOG_AGGREGATE_INTERVAL_SEC", _positive(float), 10.0),
+    # event source identification
+    ("EVENTLOG_CLIENT", six.text_type, u''),
+    ("EVENTLOG_DATACTR", six.text_type, u''),
+    ("EVENTLOG_CLUSTER", six.text_type, u''),
+    ("EVENTLOG_DEPLOY", _deployType, 0),
+    # event ids
+    ("EVENTLOG_ID_SCHEME", _choice('counter', 'snowflake'), 'counter'),
+    ("EVENTLOG_NODE_ID", _nodeId, None),
+]
+
+
+# _djangoSettings returns django.conf.settings, or None if not using django
+def _djangoSettings():
+    if not os.environ.get('DJANGO_SETTINGS_MODULE', None):
+        return None
+    try:
+        from django.conf import settings
+        return settings
+    except ImportError:
+        return None
+
+
+class Config(object):
+
+    # @param source optional dict of settings to use instead of the
+    #       environment and django settings
+    # @param strict if True, invalid settings raise ValueError; otherwise
+    #       an error is printed and the default value is used
+    def __init__(self, source=None, strict=True):
+        self._source = source
+        self._values = {}
+        self._listeners = []
+        self.reload(strict=strict)
+
+    # _resolve returns the raw value of a setting, or None if not set
+    def _resolve(self, key, django):
+        if self._source is not None:
+            val = self._source.get(key)
+        else:
+            val = os.environ.get(key, None)
+            if val is None and django is not None:
+                val = getattr(django, key, None)
+        if val is None or val == '':
+            return None
+        return val
+
+    # reload resolves all settings and replaces the current snapshot.
+    # Listeners registered with onReload are called with this Config.
+    # If strict and any setting is invalid, raises ValueError and keeps
+    # the current settings
+    def reload(self, strict=True):
+        django = _djangoSettings() if self._source is None else None
+        values = {}
+        errors = []
+        for (key, parse, default) in SETTINGS:
+            val = self._resolve(key, django)
+            if val is None:
+                values[key] = default
+                continue
+            try:
+                values[key] = parse(val)
+            except (ValueError, TypeError) as e:
+                errors.append("%s=%r: %s" % (key, val, str(e)))
+                values[key] = default
+        if errors:
+            msg = "invalid eventlog settings: " + "; ".join(errors)
+            if strict:
+                raise ValueError(msg)
+            sys.stderr.write("ERROR: %s\n" % msg)
+        # replace whole snapshot, so readers see either old or new settings
+        self._values = values
+        for fn in list(self._listeners):
+            fn(self)
+
+    # get returns the value of a setting by its full name (EVENTLOG_...)
+    def get(self, key, defaultVal=None):
+        val = self._values.get(key)
+        return defaultVal if val is None else val
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values["EVENTLOG_" + name.upper()]
+        except KeyError:
+            raise AttributeError(name)
+
+    # onReload registers fn(config) to be called after each reload
+    def onReload(self, fn):
+        self._listeners.append(fn)
+
+    # installReloadSignal reloads settings when the process receives sig
+    # (default SIGHUP). Must be called from the main thread
+    def installReloadSignal(self, sig=None):
+        import signal
+        if sig is None:
+            sig = signal.SIGHUP
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame):
+            try:
+                self.reload()
+            except ValueError as e:
+                sys.stderr.write("ERROR: settings not reloaded: %s\n" % str(e))
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+# internal global for configuration
+_config = None
+
+
+# getConfig returns the package configuration, loading it on first use
+def getConfig():
+    global _config
+    if _config is None:
+        _config = Config(strict=False)
+    return _config
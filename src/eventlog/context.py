@@ -0,0 +1,85 @@
+# context.py
+#
+# eventContext adds user, session, http request info, labels, and fields
+# to all events logged within a scope, for example, the handling of one
+# request (see also eventlog.middleware):
+#
+#    with eventContext(user=request.user.username, session=sessionId,
+#                      fields={'tenant': tenant}):
+#        ...
+#
+# The scope is encoded once, when it is entered, and its encoded bytes are
+# added to each event when it is serialized (see event.EncodedEvent), so
+# an event in a scope costs one context variable lookup. Scopes nest: an
+# inner scope adds to (and may override) the values of the outer scope,
+# and values set on an event take precedence over its scope. A field
+# overrides the field with the same key, and labels are not repeated
+# (see event.mergeEvents).
+#
+# The scope is kept in a contextvars.ContextVar, so each thread and asyncio
+# task has its own scope; tasks start with the scope in which they were
+# created. Use contextvars.copy_context().run() to carry a scope into a
+# thread pool. Without contextvars (python < 3.7), scopes are per thread.
+import contextlib
+
+from .event import _scopeVar, addFields, addLabels, mergeEvents
+from .event_pb2 import Event
+
+
+# _Scope holds the fields of an event scope, as a partial Event and
+# its serialization
+class _Scope(object):
+    __slots__ = ('message', 'data', '_keys', '_labels')
+
+    def __init__(self, message):
+        self.message = message
+        self.data = message.SerializeToString()
+        self._keys = frozenset(f.key for f in message.fields)
+        self._labels = frozenset(message.labels)
+
+    # overlaps returns True if event has a field key or label of this scope
+    def overlaps(self, event):
+        if self._keys and any(f.key in self._keys for f in event.fields):
+            return True
+        return bool(self._labels) and any(label in self._labels for label in event.labels)
+
+
+# newScope returns a scope with the fields of parent and the given values
+# @param parent scope, or None
+def newScope(parent=None, user=None, session=None, labels=None, fields=None,
+             http=None):
+    m = Event()
+    if user:
+        m.user = user
+    if session:
+        m.session = session
+    if http is not None:
+        m.http.MergeFrom(http)
+    if labels:
+        addLabels(m, labels)
+    if fields:
+        addFields(m, fields)
+    if parent is not None:
+        m = mergeEvents(parent.message, m)
+    return _Scope(m)
+
+
+# currentScope returns the current scope, or None
+def currentScope():
+    return _scopeVar.get()
+
+
+# eventContext adds values to events logged in its scope
+# @param user user name
+# @param session session id
+# @param labels list of labels
+# @param fields dict of fields (see event.addFields)
+# @param http HttpInfo of the current request
+@contextlib.contextmanager
+def eventContext(user=None, session=None, labels=None, fields=None, http=None):
+    scope = newScope(_scopeVar.get(), user, session, labels, fields, http)
+    token = _scopeVar.set(scope)
+    try:
+        yield scope
+    finally:
+        _scopeVar.reset(token)
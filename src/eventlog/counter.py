@@ -1,7 +1,23 @@
+import sys
 import time
 import itertools
 import platform
 import threading
+import zlib
+
+from six.moves import range
+
+# number of ids a thread reserves at a time in BlockCounter
+BLOCK_SIZE = 1024
+
+# SnowflakeCounter id layout, from the high bit:
+#   0 (1 bit) | milliseconds since SNOWFLAKE_EPOCH (41 bits) |
+#   node id (10 bits) | sequence within the millisecond (12 bits)
+SNOWFLAKE_EPOCH_MS = 1577836800000  # 2020-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+_MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
 
 
 # atomic counter for event id
@@ -33,42 +49,160 @@ class AtomicCounterP(object):
             return v
 
 
-if platform.python_implementation() == "CPython":
+# unique id generator in which each thread reserves a block of ids
+# from a shared counter and hands them out locally, so threads only
+# contend once per block. Ids are unique but not ordered across threads:
+# each thread's ids increase, and ids from different threads interleave.
+class BlockCounter(object):
+
+    # @param initial first id
+    # @param blockSize number of ids reserved by a thread at a time
+    def __init__(self, initial=0, blockSize=BLOCK_SIZE):
+        self._initial = initial
+        self._blockSize = blockSize
+        self._blocks = AtomicCounterP()
+        self._local = threading.local()
+
+    def nextVal(self):
+        try:
+            return next(self._local.ids)
+        except (AttributeError, StopIteration):
+            start = self._initial + self._blocks.nextVal() * self._blockSize
+            self._local.ids = iter(range(start, start + self._blockSize))
+            return next(self._local.ids)
+
+
+# snowflake node id for a host and process: a 10-bit hash of host and pid.
+# Hashes of different processes can collide; set EVENTLOG_NODE_ID
+# to assign unique node ids explicitly
+def nodeId(host, pid):
+    return zlib.crc32(("%s:%d" % (host, pid)).encode('utf-8')) & MAX_NODE_ID
+
+
+# time-sortable unique 64-bit ids (similar to Twitter's Snowflake):
+# a millisecond timestamp, node id, and per-millisecond sequence.
+# Ids from one node always increase. If more than 4096 ids are requested
+# in one millisecond, or the clock moves backwards, the counter continues
+# from the last timestamp used, so it never blocks or repeats.
+class SnowflakeCounter(object):
+
+    # @param node node id, 0..MAX_NODE_ID
+    # @param clock function returning the current time in seconds
+    def __init__(self, node, clock=time.time):
+        if not 0 <= node <= MAX_NODE_ID:
+            raise ValueError("node id must be between 0 and %d" % MAX_NODE_ID)
+        self._node = node << SEQUENCE_BITS
+        self._clock = clock
+        self._lastMs = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def nextVal(self):
+        ms = int(self._clock() * 1000) - SNOWFLAKE_EPOCH_MS
+        with self._lock:
+            if ms > self._lastMs:
+                self._lastMs = ms
+                self._seq = 0
+            elif self._seq < _MAX_SEQUENCE:
+                self._seq += 1
+            else:
+                self._lastMs += 1
+                self._seq = 0
+            return (self._lastMs << (NODE_BITS + SEQUENCE_BITS)) | self._node | self._seq
+
+
+# snowflakeParts returns (unix time in ms, node id, sequence) of a snowflake id
+def snowflakeParts(eid):
+    return ((eid >> (NODE_BITS + SEQUENCE_BITS)) + SNOWFLAKE_EPOCH_MS,
+            (eid >> SEQUENCE_BITS) & MAX_NODE_ID,
+            eid & _MAX_SEQUENCE)
+
+
+# gilEnabled returns True if threads are serialized by a global lock
+# (CPython, except free-threaded builds with the GIL disabled)
+def gilEnabled():
+    isEnabled = getattr(sys, '_is_gil_enabled', None)
+    if isEnabled is not None:
+        return isEnabled()
+    return platform.python_implementation() == "CPython"
+
+
+# AtomicCounter generates consecutive ids.
+# IdCounter generates unique ids with the least contention between threads.
+if gilEnabled():
     AtomicCounter = AtomicCounterC
+    IdCounter = AtomicCounterC
 else:
     AtomicCounter = AtomicCounterP
+    IdCounter = BlockCounter
 
 
-__all__ = [AtomicCounter]
+__all__ = ['AtomicCounter', 'BlockCounter', 'IdCounter', 'SnowflakeCounter']
 
 
-# perf benchmark and threading test for counter class
-def testCounter(numThreads, maxval, clz):
+# perf benchmark and threading test for counter class.
+# Returns (class name, elapsed seconds, True if all ids were unique)
+# @param check collect ids and verify they are unique (slower)
+def testCounter(numThreads, maxval, clz, check=False):
     counter = clz()
+    results = []
+    ready = threading.Barrier(numThreads + 1) if hasattr(threading, 'Barrier') else None
 
     def threadCounter():
-        for i in range(maxval):
-            counter.nextVal()
+        nextVal = counter.nextVal
+        if ready is not None:
+            ready.wait()
+        if check:
+            results.append([nextVal() for i in range(maxval)])
+        else:
+            for i in range(maxval):
+                nextVal()
 
     threads = []
     for i in range(numThreads):
         thread = threading.Thread(target=threadCounter)
         thread.start()
         threads.append(thread)
+    if ready is not None:
+        ready.wait()
+    startT = time.time()
     for thread in threads:
         thread.join()
-    return (counter.__class__.__name__, counter.nextVal())
-
-
-# run benchmarks to compare results
-def runTests():
-    for clz in (AtomicCounterC, AtomicCounterP):
-        startT = time.time()
-        (kind, val) = testCounter(5, 1000000, clz)
-        endT = time.time()
-        delta = int((endT - startT) * 1000)
-        print("%s: final=%d, time=%d ms" % (kind, val, delta))
+    elapsed = time.time() - startT
+    unique = True
+    if check:
+        ids = set()
+        for r in results:
+            ids.update(r)
+        unique = len(ids) == numThreads * maxval
+    return (counter.__class__.__name__, elapsed, unique)
+
+
+# run benchmarks to compare counters at increasing thread counts
+# @param threadCounts list of thread counts
+# @param maxval ids generated per thread
+def runTests(threadCounts=(1, 2, 4, 8), maxval=1000000):
+    print("python %s %s, gil %s" % (platform.python_implementation(),
+                                    platform.python_version(),
+                                    "enabled" if gilEnabled() else "disabled"))
+    counters = [AtomicCounterP, BlockCounter]
+    if gilEnabled():
+        # not thread-safe without the GIL
+        counters.insert(0, AtomicCounterC)
+    for numThreads in threadCounts:
+        for clz in counters:
+            (kind, elapsed, unique) = testCounter(numThreads, maxval, clz)
+            rate = numThreads * maxval / max(elapsed, 1e-9)
+            print("%-15s threads=%-3d time=%6d ms  %8.2f M ids/sec" %
+                  (kind, numThreads, int(elapsed * 1000), rate / 1e6))
 
 
 if __name__ == '__main__':
-    runTests()
+    # usage: python -m eventlog.counter [ids per thread] [thread counts...]
+    args = [int(a) for a in sys.argv[1:]]
+    if len(args) > 1:
+        runTests(args[1:], args[0])
+    elif args:
+        runTests(maxval=args[0])
+    else:
+        runTests()
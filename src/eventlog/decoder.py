@@ -0,0 +1,195 @@
+# decoder.py
+#
+# Streaming decoder for the event wire formats, for collectors, forwarders,
+# and tests.
+#
+# StreamDecoder accepts data in arbitrary chunks (partial frames are kept
+# until the rest arrives). Data can be received directly into the decoder's
+# buffer, without an intermediate copy:
+#
+#    dec = StreamDecoder()
+#    while True:
+#        n = sock.recv_into(dec.getBuffer())
+#        if n == 0:
+#            break
+#        dec.bufferUpdated(n)
+#        for e in dec.events():
+#            ...
+#
+# Formats:
+#   'frames'    eventlog.wire frames (events, messages, interned events, batches)
+#   'protobuf'  protobuf Events, each preceded by its length (varint)
+#   'json'      JSON lines (as written by proto.format_json); yields dicts
+#   'capnp'     unpacked capnp messages with standard segment table framing
+#               (requires the pycapnp package and event_capnp schema)
+#   'auto'      'json' if the stream starts with '{', otherwise 'frames'
+import struct
+
+import six
+
+from .event_pb2 import Event
+from .proto import HAVE_CAPNP
+from .wire import FrameDecoder, decodeVarint, readFrame
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+FORMATS = ('auto', 'frames', 'protobuf', 'json', 'capnp')
+
+# default initial buffer size
+BUFFER_SIZE = 64 * 1024
+
+
+class StreamDecoder(object):
+
+    # @param format one of FORMATS
+    # @param bufsize initial buffer size. The buffer grows if a single
+    #       record is larger
+    def __init__(self, format='auto', bufsize=BUFFER_SIZE):
+        if format not in FORMATS:
+            raise ValueError("unknown format %s" % format)
+        if format == 'capnp' and not HAVE_CAPNP:
+            raise ValueError("capnp format requires pycapnp and event_capnp")
+        self.format = format
+        self._buf = bytearray(bufsize)
+        self._start = 0
+        self._end = 0
+        self._frames = FrameDecoder()
+
+    # getBuffer returns a writable memoryview of free buffer space,
+    # for socket.recv_into or file.readinto. After writing n bytes
+    # into it, call bufferUpdated(n).
+    # @param sizeHint minimum free space wanted
+    def getBuffer(self, sizeHint=0):
+        size = len(self._buf)
+        free = size - self._end
+        if free < max(sizeHint, 1) or free < size // 4:
+            self._compact(sizeHint)
+        return memoryview(self._buf)[self._end:]
+
+    def bufferUpdated(self, n):
+        self._end += n
+
+    # feed copies data into the buffer
+    def feed(self, data):
+        n = len(data)
+        self.getBuffer(n)[:n] = data
+        self.bufferUpdated(n)
+
+    # pending returns the number of buffered bytes not yet decoded
+    def pending(self):
+        return self._end - self._start
+
+    # _compact moves undecoded data to the start of the buffer,
+    # growing the buffer if needed
+    def _compact(self, need):
+        n = self._end - self._start
+        if n + need > len(self._buf) // 2:
+            buf = bytearray(max(len(self._buf) * 2, n + need))
+            buf[:n] = memoryview(self._buf)[self._start:self._end]
+            self._buf = buf
+        elif self._start:
+            mv = memoryview(self._buf)
+            mv[:n] = mv[self._start:self._end]
+        self._start = 0
+        self._end = n
+
+    # records yields the complete records in the buffer, without decoding
+    # them: (frameType, payload) for 'frames', otherwise the payload.
+    # Payloads are memoryviews into the buffer, valid only until the next
+    # call to getBuffer or feed
+    def records(self):
+        if self.format == 'auto':
+            if self._end == self._start:
+                return
+            first = six.indexbytes(self._buf, self._start)
+            self.format = 'json' if first == ord('{') else 'frames'
+        reader = getattr(self, '_read_' + self.format)
+        mv = memoryview(self._buf)
+        while True:
+            rec = reader(mv)
+            if rec is None:
+                return
+            yield rec
+
+    def _read_frames(self, mv):
+        frame = readFrame(mv[:self._end], self._start)
+        if frame is None:
+            return None
+        (frameType, payload, self._start) = frame
+        return (frameType, payload)
+
+    def _read_protobuf(self, mv):
+        try:
+            (length, pos) = decodeVarint(mv, self._start)
+        except IndexError:
+            return None
+        if pos + length > self._end:
+            return None
+        self._start = pos + length
+        return mv[pos:self._start]
+
+    def _read_json(self, mv):
+        pos = self._buf.find(b'\n', self._start, self._end)
+        if pos < 0:
+            return None
+        line = mv[self._start:pos]
+        self._start = pos + 1
+        return line
+
+    def _read_capnp(self, mv):
+        avail = self._end - self._start
+        if avail < 4:
+            return None
+        nseg = struct.unpack_from('<I', self._buf, self._start)[0] + 1
+        tableLen = (4 + 4 * nseg + 7) & ~7
+        if avail < tableLen:
+            return None
+        sizes = struct.unpack_from('<%dI' % nseg, self._buf, self._start + 4)
+        end = self._start + tableLen + 8 * sum(sizes)
+        if end > self._end:
+            return None
+        rec = mv[self._start:end]
+        self._start = end
+        return rec
+
+    # events yields the decoded events from complete records in the buffer:
+    # Event objects for 'frames' and 'protobuf', dicts for 'json',
+    # and capnp readers for 'capnp'
+    def events(self):
+        for rec in self.records():
+            if self.format == 'frames':
+                for e in self._frames.decode(*rec):
+                    yield e
+            elif self.format == 'protobuf':
+                yield Event.FromString(bytes(rec))
+            elif self.format == 'json':
+                if len(rec):
+                    yield json.loads(bytes(rec).decode('utf-8'))
+            else:
+                from .proto import event_capnp
+                yield event_capnp.Event.from_bytes(bytes(rec))
+
+
+# iterEvents reads and decodes all events from a source until end of stream
+# @param source a socket, a binary file object, or a bytes-like object
+# @param format one of FORMATS
+def iterEvents(source, format='auto', bufsize=BUFFER_SIZE):
+    dec = StreamDecoder(format, bufsize)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        dec.feed(source)
+        for e in dec.events():
+            yield e
+    else:
+        readinto = getattr(source, 'recv_into', None) or source.readinto
+        while True:
+            n = readinto(dec.getBuffer())
+            if not n:
+                break
+            dec.bufferUpdated(n)
+            for e in dec.events():
+                yield e
+    if dec.pending():
+        raise ValueError("stream ended with %d bytes of incomplete data" % dec.pending())
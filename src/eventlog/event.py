@@ -1,22 +1,26 @@
+import hashlib
 import os
 import random
 import six
 import socket
 import sys
+import threading
 import time
 import traceback
+import warnings
+from collections import OrderedDict
 
 from .loglevel import INFO, NOTSET, OK
 from .event_pb2 import DeployType, EventHeader, Extra, Event, LogLevel
-from google.protobuf.json_format import MessageToJson
 
-from .config import _getUserContext, getConfigSetting
-from .counter import AtomicCounter
+from . import config as _config
+from .config import getConfig
+from .counter import IdCounter, SnowflakeCounter, nodeId
 
 try:
-    import ujson as json
+    import contextvars
 except ImportError:
-    import json
+    contextvars = None
 
 
 _EVENT_SCHEMA_VERSION = (0, 1)
@@ -25,26 +29,87 @@ _EVENT_SCHEMA_VERSION = (0, 1)
 _isnumeric = lambda x: isinstance(x, six.integer_types) or isinstance(x, float)
 
 
+# _newIdGenerator returns the event id generator selected by EVENTLOG_ID_SCHEME
+def _newIdGenerator(config, host, pid):
+    if config.id_scheme == 'snowflake':
+        node = config.node_id
+        if node is None:
+            warnings.warn("EVENTLOG_NODE_ID is not set: snowflake node ids are a hash "
+                          "of host and pid, and may collide between processes",
+                          RuntimeWarning)
+            node = nodeId(host, pid)
+        return SnowflakeCounter(node)
+    # from os.urandom, so forked children don't share a random state
+    return IdCounter(random.SystemRandom().getrandbits(48))
+
+
 class EventSettings(object):
 
     # static variables calculated once and cached
     host = socket.gethostname()
     pid = os.getpid()
-    # client, datactr and cluster can be defined in environment or settings
-    # (if both, environment takes precedence)
-    # if neither, an error message is printed
-    client = getConfigSetting('EVENTLOG_CLIENT') or u''
-    datactr = getConfigSetting('EVENTLOG_DATACTR') or u''
-    cluster = getConfigSetting('EVENTLOG_CLUSTER') or u''
-    deploy = getConfigSetting('EVENTLOG_DEPLOY') or DeployType.Value('PROD')
+    # client, datactr, cluster and deploy can be defined in environment
+    # or settings (if both, environment takes precedence).
+    # They are updated when settings are reloaded (see configure)
+    client = u''
+    datactr = u''
+    cluster = u''
+    deploy = DeployType.Value('PROD')
 
     # idgen creates a unique event id within this VM/insance.
     # It could be considered globally unique but doesn't need to be.
     # The main purposes are to disambiguate events with the same
     # millisecond timestamp, and to support end-to-end debug tracing
     # It can also be used to measure how many events are generated
-    # by each server over a time period
-    _idgen = AtomicCounter(random.getrandbits(48))
+    # by each server over a time period (approximately, without the GIL:
+    # see counter.IdCounter)
+    #
+    # With EVENTLOG_ID_SCHEME=snowflake, ids combine a millisecond timestamp,
+    # node id, and sequence (see counter.SnowflakeCounter), so they are
+    # sortable by time, and unique across processes if each process has
+    # its own EVENTLOG_NODE_ID (0-1023). Without it, the node id is a 10-bit
+    # hash of host and pid, and ids of different processes may collide
+    # (half the time among 38 processes), so a RuntimeWarning is issued.
+    # Prefork servers should set EVENTLOG_NODE_ID in each worker, for
+    # example in a post-fork hook, and reload settings: the id generator
+    # is replaced when the id scheme or node id changes.
+    #
+    # In a forked child, the pid and id generator are reset, so children
+    # don't repeat their parent's ids (with a hashed node id, it is
+    # derived from the child's pid).
+    _idgen = _newIdGenerator(getConfig(), host, pid)
+    _idConfig = (getConfig().id_scheme, getConfig().node_id)
+
+    # configure updates settings from config
+    @staticmethod
+    def configure(config):
+        EventSettings.client = config.client
+        EventSettings.datactr = config.datactr
+        EventSettings.cluster = config.cluster
+        EventSettings.deploy = config.deploy
+        if (config.id_scheme, config.node_id) != EventSettings._idConfig:
+            EventSettings.resetIds(config)
+
+    # resetIds replaces the id generator
+    @staticmethod
+    def resetIds(config):
+        EventSettings._idConfig = (config.id_scheme, config.node_id)
+        EventSettings._idgen = _newIdGenerator(config, EventSettings.host, EventSettings.pid)
+
+    # afterFork resets the pid and id generator in a forked child process
+    @staticmethod
+    def afterFork():
+        EventSettings.pid = os.getpid()
+        EventSettings.resetIds(getConfig())
+
+
+EventSettings.configure(getConfig())
+getConfig().onReload(EventSettings.configure)
+
+# without os.register_at_fork (python < 3.7), newEvent compares the pid
+_checkFork = not hasattr(os, 'register_at_fork')
+if not _checkFork:
+    os.register_at_fork(after_in_child=EventSettings.afterFork)
 
 
 # newEvent create a new Event
@@ -76,6 +141,8 @@ def newEvent(name,
              logFrame=False,
              duration=0,
              ):
+    if _checkFork and os.getpid() != EventSettings.pid:
+        EventSettings.afterFork()
     e = Event(
         name=name,
         tstamp=time.time(),
@@ -98,9 +165,10 @@ def newEvent(name,
     if logFrame:
         addCodeFrame(e)
 
-    # collect user context, if middleware hook is installed
-    if _getUserContext:
-        e.user, e.session = _getUserContext()
+    # collect user context, if middleware hook is installed.
+    # (eventContext is cheaper: see eventlog.context)
+    if _config._getUserContext:
+        e.user, e.session = _config._getUserContext()
 
     if fields:
         addFields(e, fields)
@@ -113,10 +181,44 @@ def addLabels(e, labels):
         e.labels.append(l)
 
 
+# Extra value field for each python type.
+# Values of other types are converted with str()
+_EXTRA_VALUE_FIELD = {
+    six.text_type: 'value',
+    bool: 'bool_value',
+    float: 'double_value',
+}
+for _t in six.integer_types:
+    _EXTRA_VALUE_FIELD[_t] = 'int_value'
+_EXTRA_VALUE_FIELD[six.binary_type] = 'bytes_value' if six.PY3 else 'value'
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+# makeExtra creates an Extra (event field) with a typed value,
+# so numbers are sent without string formatting and parsing
+def makeExtra(k, v):
+    name = _EXTRA_VALUE_FIELD.get(type(v))
+    if name is None or (name == 'int_value' and not _INT64_MIN <= v <= _INT64_MAX):
+        return Extra(key=k, value=str(v))
+    return Extra(key=k, **{name: v})
+
+
+# fieldValue returns the value of an Extra as a python value
+# (str, int, float, bool, or bytes). Fields without a value return ''
+def fieldValue(extra):
+    name = extra.WhichOneof('val')
+    if name is None:
+        return u''
+    return getattr(extra, name)
+
+
 # addFields adds fields to the event.
-# @param fields - dict of key-value pairs
+# @param fields - dict of key-value pairs. Values may be
+#       strings, integers, floats, booleans, or bytes
 def addFields(e, fields):
-    e.fields.extend([Extra(key=k, value=v) for k, v in six.iteritems(fields)])
+    e.fields.extend([makeExtra(k, v) for k, v in six.iteritems(fields)])
 
 
 # get file and lineno of caller from stack frame
@@ -138,6 +240,7 @@ def addCodeFrame(e):
 
 
 def eventToJson(e):
+    from google.protobuf.json_format import MessageToJson
     return MessageToJson(e)
 
 
@@ -145,6 +248,102 @@ def eventToBuffer(e):
     return e.SerializeToString()
 
 
+# _LocalVar is a per-thread substitute for contextvars.ContextVar
+# on python versions without contextvars
+class _LocalVar(object):
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+# _scopeVar holds the current event scope (see eventlog.context)
+if contextvars is not None:
+    _scopeVar = contextvars.ContextVar('eventlog_scope', default=None)
+else:
+    _scopeVar = _LocalVar()
+
+
+# EncodedEvent holds an Event with its encodings, so that each serializer
+# runs at most once per event, however many handlers, replicas, or sinks
+# the event is sent to. Encodings are keyed by serializer, so serializers
+# must be functions of the event only. The event must not be modified
+# after it is logged.
+#
+# EncodedEvent also holds the event scope that was current when the event
+# was logged (see eventlog.context). Values set on the event take
+# precedence over the scope's (see mergeEvents). Unless the event has a
+# field key or label that is also in the scope, the scope's serialized
+# fields are prepended to the output of eventToBuffer, which protobuf
+# decodes as the same merge; otherwise, and for other serializers, the
+# merged event is serialized (see full).
+class EncodedEvent(object):
+    __slots__ = ('event', 'scope', '_full', '_encodings')
+
+    def __init__(self, event):
+        self.event = event
+        self.scope = _scopeVar.get()
+        self._full = None
+        self._encodings = {}
+
+    # encode returns serializer(event), computing it only once
+    def encode(self, serializer):
+        data = self._encodings.get(serializer)
+        if data is None:
+            if self.scope is None:
+                data = serializer(self.event)
+            elif serializer is eventToBuffer and not self.scope.overlaps(self.event):
+                data = self.scope.data + eventToBuffer(self.event)
+            else:
+                data = serializer(self.full())
+            self._encodings[serializer] = data
+        return data
+
+    # full returns the event with the fields of its scope
+    def full(self):
+        if self.scope is None:
+            return self.event
+        if self._full is None:
+            self._full = mergeEvents(self.scope.message, self.event)
+        return self._full
+
+
+# mergeEvents returns a new Event with the values of base and event.
+# Values set on event take precedence: base fields with the same key as
+# an event field, and base labels that are also event labels, are dropped
+def mergeEvents(base, event):
+    e = Event()
+    e.MergeFrom(base)
+    if base.fields and event.fields:
+        keys = set(f.key for f in event.fields)
+        fields = [f for f in base.fields if f.key not in keys]
+        del e.fields[:]
+        e.fields.extend(fields)
+    if base.labels and event.labels:
+        labels = set(event.labels)
+        kept = [label for label in base.labels if label not in labels]
+        del e.labels[:]
+        e.labels.extend(kept)
+    e.MergeFrom(event)
+    return e
+
+
+# encoded returns e as an EncodedEvent
+# @param e Event or EncodedEvent
+def encoded(e):
+    return e if isinstance(e, EncodedEvent) else EncodedEvent(e)
+
+
 def makeMessage(e, category):
     buf = eventToBuffer(e)
     header = EventHeader(
@@ -159,24 +358,128 @@ def makeMessage(e, category):
     return(hbuf, buf)
 
 
-def newLogRecord(record):
+# TraceDedup sends the full stack trace of an exception only once per
+# window for each distinct traceback. Tracebacks are identified by a
+# fingerprint of the exception type and the code objects and line numbers
+# of the traceback frames, and of the exceptions it was chained from
+# (__cause__ or __context__), which is computed without formatting the trace.
+# Repeated exceptions within the window are logged with only the exception
+# line, the fingerprint, and the number of occurrences in the window.
+# The first exception of the next window also has the number of occurrences
+# in the previous window that were logged without the trace (exc_suppressed).
+# At most maxsize fingerprints are tracked (least recently seen evicted first).
+class TraceDedup(object):
+
+    # @param window length of window, in seconds
+    # @param maxsize max number of distinct tracebacks tracked
+    def __init__(self, window=60.0, maxsize=1024):
+        self.window = window
+        self.maxsize = maxsize
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.window = config.trace_window_sec
+        self.maxsize = config.trace_cache_size
+
+    # _key returns a tuple of (exception type, frames) for the exception
+    # and each exception it was chained from, in the order that
+    # traceback.format_exception follows them
+    @staticmethod
+    def _key(excType, val, tb):
+        key = []
+        seen = set()
+        while True:
+            frames = []
+            while tb is not None:
+                frames.append((tb.tb_frame.f_code, tb.tb_lineno))
+                tb = tb.tb_next
+            key.append((excType, tuple(frames)))
+            seen.add(id(val))
+            cause = getattr(val, '__cause__', None)
+            if cause is None and not getattr(val, '__suppress_context__', False):
+                cause = getattr(val, '__context__', None)
+            if cause is None or id(cause) in seen:
+                return tuple(key)
+            (excType, val, tb) = (type(cause), cause, cause.__traceback__)
+
+    # _fingerprint returns a hex digest of a key that is stable across processes
+    @staticmethod
+    def _fingerprint(key):
+        text = '<'.join(getattr(excType, '__name__', str(excType)) + ''.join(
+            '|%s:%s:%d' % (code.co_filename, code.co_name, line) for (code, line) in frames)
+            for (excType, frames) in key)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+    # addTrace sets the stack trace and fingerprint fields of an event
+    # @param e Event
+    # @param excInfo (type, value, traceback) tuple, from sys.exc_info()
+    def addTrace(self, e, excInfo):
+        (excType, val, tb) = excInfo
+        key = self._key(excType, val, tb)
+        now = time.time()
+        suppressed = 0
+        with self._lock:
+            entry = self._seen.pop(key, None)
+            if entry is not None and now - entry[0] < self.window:
+                entry[2] += 1
+            else:
+                # first occurrence, or window expired: start new window
+                if entry is not None:
+                    fingerprint = entry[1]
+                    suppressed = entry[2] - 1
+                else:
+                    fingerprint = self._fingerprint(key)
+                entry = [now, fingerprint, 1]
+            self._seen[key] = entry
+            if len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+            (fingerprint, count) = (entry[1], entry[2])
+        if count == 1:
+            lines = traceback.format_exception(excType, val, tb)
+        else:
+            lines = traceback.format_exception_only(excType, val)
+        e.log.stack_trace = ''.join(lines)
+        fields = {'exc_fingerprint': fingerprint, 'exc_count': count}
+        if suppressed:
+            fields['exc_suppressed'] = suppressed
+        addFields(e, fields)
+
+
+_traceDedup = TraceDedup()
+_traceDedup.configure(getConfig())
+getConfig().onReload(_traceDedup.configure)
+
+
+# newLogRecord converts a logging.LogRecord to an Event
+# @param recordLocation if True, the code location is taken from the record;
+#       otherwise it is found on the current stack. Use it for records
+#       converted after the logging call has returned
+def newLogRecord(record, recordLocation=False):
     e = newEvent(name='log',
                  target='logger:' + record.name,
                  level=LogLevel.Value(record.levelname),
                  message=record.getMessage(),
-                 logFrame=True)
+                 logFrame=not recordLocation)
+    if recordLocation:
+        e.log.code_file = record.pathname
+        e.log.code_line = record.lineno
+        e.log.code_func = record.funcName
     if record.created:
         e.tstamp = record.created
     tags = getattr(record, 'tags', [])
     if tags:
-        e.addLabels(tags)
+        addLabels(e, tags)
     extra = getattr(record, 'extra', {})
     if extra:
-        e.addFields(extra)
-    if getattr(record, 'exc_info', None) is not None:
-        (excType, val, tb) = record.exc_info
-        tbdata = traceback.extract_tb(tb)
-        e.log.stack_trace = json.dumps((excType, val, tbdata))
+        addFields(e, extra)
+    # set by eventlog.filters.DedupFilter
+    suppressed = getattr(record, 'dedup_suppressed', 0)
+    if suppressed:
+        addFields(e, {'dedup_suppressed': suppressed})
+    excInfo = getattr(record, 'exc_info', None)
+    if excInfo is not None and excInfo[0] is not None:
+        _traceDedup.addTrace(e, excInfo)
     if e.log.level == NOTSET:
         e.log.level = INFO
     return e
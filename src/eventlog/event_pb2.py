@@ -20,7 +20,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   package='',
   syntax='proto3',
   serialized_options=None,
-  serialized_pb=_b('\n\x0b\x65vent.proto\"\xe1\x01\n\x08HttpInfo\x12\x0e\n\x06status\x18\x01 \x01(\r\x12\x1b\n\x06method\x18\x02 \x01(\x0e\x32\x0b.HttpMethod\x12\x0c\n\x04path\x18\x03 \x01(\t\x12\r\n\x05query\x18\x04 \x01(\t\x12\x13\n\x0bremote_host\x18\x05 \x01(\t\x12\x13\n\x0bremote_addr\x18\x06 \x01(\t\x12\x0f\n\x07referer\x18\x07 \x01(\t\x12\x12\n\nuser_agent\x18\x08 \x01(\t\x12\x0c\n\x04\x62ody\x18\t \x01(\t\x12\x17\n\x0f\x66orwarded_proto\x18\n \x01(\t\x12\x15\n\rforwarded_for\x18\x0b \x01(\t\"r\n\x06Server\x12\x1b\n\x06\x64\x65ploy\x18\x01 \x01(\x0e\x32\x0b.DeployType\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0e\n\x06\x63lient\x18\x03 \x01(\t\x12\x0f\n\x07\x64\x61tactr\x18\x04 \x01(\t\x12\x0f\n\x07\x63luster\x18\x05 \x01(\t\x12\x0b\n\x03pid\x18\x06 \x01(\r\"q\n\x07LogInfo\x12\x18\n\x05level\x18\x01 \x01(\x0e\x32\t.LogLevel\x12\x11\n\tcode_file\x18\x02 \x01(\t\x12\x11\n\tcode_func\x18\x03 \x01(\t\x12\x11\n\tcode_line\x18\x04 \x01(\r\x12\x13\n\x0bstack_trace\x18\x05 \x01(\t\"#\n\x05\x45xtra\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"-\n\rSchemaVersion\x12\r\n\x05major\x18\x01 \x01(\r\x12\r\n\x05minor\x18\x02 \x01(\r\"m\n\x0b\x45ventHeader\x12\x0b\n\x03\x65id\x18\x01 \x01(\x06\x12\x0e\n\x06tsnano\x18\x02 \x01(\x06\x12\x1f\n\x07version\x18\x03 \x01(\x0b\x32\x0e.SchemaVersion\x12\x10\n\x08\x63\x61tegory\x18\x04 \x01(\t\x12\x0e\n\x06msglen\x18\x06 \x01(\r\"\xa5\x02\n\x05\x45vent\x12\x1f\n\x07version\x18\x01 \x01(\x0b\x32\x0e.SchemaVersion\x12\x0e\n\x06tstamp\x18\x02 \x01(\x01\x12\x0b\n\x03\x65id\x18\x03 \x01(\x06\x12\x0c\n\x04name\x18\x04 \x01(\t\x12\r\n\x05value\x18\x05 \x01(\x01\x12\x10\n\x08\x64uration\x18\x06 \x01(\x01\x12\x0e\n\x06target\x18\x07 \x01(\t\x12\x0f\n\x07session\x18\x08 \x01(\t\x12\x0c\n\x04user\x18\t \x01(\t\x12\x0f\n\x07message\x18\n \x01(\t\x12\x17\n\x06server\x18\x0b \x01(\x0b\x32\x07.Server\x12\x17\n\x04http\x18\x0c \x01(\x0b\x32\t.HttpInfo\x12\x15\n\x03log\x18\r \x01(\x0b\x32\x08.LogInfo\x12\x0e\n\x06labels\x18\x0e \x03(\t\x12\x16\n\x06\x66ields\x18\x0f \x03(\x0b\x32\x06.Extra*\x7f\n\x08LogLevel\x12\n\n\x06NOTSET\x10\x00\x12\t\n\x05TRACE\x10\x05\x12\t\n\x05\x44\x45\x42UG\x10\n\x12\x08\n\x04INFO\x10\x14\x12\x06\n\x02OK\x10\x19\x12\x0b\n\x07WARNING\x10\x1e\x12\x08\n\x04WARN\x10\x1e\x12\t\n\x05\x45RROR\x10(\x12\x0c\n\x08\x43RITICAL\x10\x32\x12\x0b\n\x07\x45XTREME\x10<\x1a\x02\x10\x01*I\n\nDeployType\x12\x08\n\x04PROD\x10\x00\x12\t\n\x05STAGE\x10\x01\x12\x07\n\x03\x44\x45V\x10\x02\x12\x08\n\x04TEST\x10\x03\x12\x08\n\x04\x44\x45MO\x10\x04\x12\t\n\x05PILOT\x10\x05*s\n\nHttpMethod\x12\t\n\x05UNSET\x10\x00\x12\x07\n\x03GET\x10\x01\x12\x08\n\x04POST\x10\x02\x12\x07\n\x03PUT\x10\x03\x12\x08\n\x04HEAD\x10\x04\x12\x0b\n\x07OPTIONS\x10\x05\x12\n\n\x06\x44\x45LETE\x10\x06\x12\x0b\n\x07\x43ONNECT\x10\x07\x12\x0e\n\nHTTP_TRACE\x10\x08\x62\x06proto3')
+  serialized_pb=_b('\n\x0b\x65vent.proto\"\xe1\x01\n\x08HttpInfo\x12\x0e\n\x06status\x18\x01 \x01(\r\x12\x1b\n\x06method\x18\x02 \x01(\x0e\x32\x0b.HttpMethod\x12\x0c\n\x04path\x18\x03 \x01(\t\x12\r\n\x05query\x18\x04 \x01(\t\x12\x13\n\x0bremote_host\x18\x05 \x01(\t\x12\x13\n\x0bremote_addr\x18\x06 \x01(\t\x12\x0f\n\x07referer\x18\x07 \x01(\t\x12\x12\n\nuser_agent\x18\x08 \x01(\t\x12\x0c\n\x04\x62ody\x18\t \x01(\t\x12\x17\n\x0f\x66orwarded_proto\x18\n \x01(\t\x12\x15\n\rforwarded_for\x18\x0b \x01(\t\"r\n\x06Server\x12\x1b\n\x06\x64\x65ploy\x18\x01 \x01(\x0e\x32\x0b.DeployType\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0e\n\x06\x63lient\x18\x03 \x01(\t\x12\x0f\n\x07\x64\x61tactr\x18\x04 \x01(\t\x12\x0f\n\x07\x63luster\x18\x05 \x01(\t\x12\x0b\n\x03pid\x18\x06 \x01(\r\"q\n\x07LogInfo\x12\x18\n\x05level\x18\x01 \x01(\x0e\x32\t.LogLevel\x12\x11\n\tcode_file\x18\x02 \x01(\t\x12\x11\n\tcode_func\x18\x03 \x01(\t\x12\x11\n\tcode_line\x18\x04 \x01(\r\x12\x13\n\x0bstack_trace\x18\x05 \x01(\t\"\x86\x01\n\x05\x45xtra\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\x0f\n\x05value\x18\x02 \x01(\tH\x00\x12\x13\n\tint_value\x18\x03 \x01(\x12H\x00\x12\x16\n\x0c\x64ouble_value\x18\x04 \x01(\x01H\x00\x12\x14\n\nbool_value\x18\x05 \x01(\x08H\x00\x12\x15\n\x0b\x62ytes_value\x18\x06 \x01(\x0cH\x00\x42\x05\n\x03val\"-\n\rSchemaVersion\x12\r\n\x05major\x18\x01 \x01(\r\x12\r\n\x05minor\x18\x02 \x01(\r\"m\n\x0b\x45ventHeader\x12\x0b\n\x03\x65id\x18\x01 \x01(\x06\x12\x0e\n\x06tsnano\x18\x02 \x01(\x06\x12\x1f\n\x07version\x18\x03 \x01(\x0b\x32\x0e.SchemaVersion\x12\x10\n\x08\x63\x61tegory\x18\x04 \x01(\t\x12\x0e\n\x06msglen\x18\x06 \x01(\r\"\xa5\x02\n\x05\x45vent\x12\x1f\n\x07version\x18\x01 \x01(\x0b\x32\x0e.SchemaVersion\x12\x0e\n\x06tstamp\x18\x02 \x01(\x01\x12\x0b\n\x03\x65id\x18\x03 \x01(\x06\x12\x0c\n\x04name\x18\x04 \x01(\t\x12\r\n\x05value\x18\x05 \x01(\x01\x12\x10\n\x08\x64uration\x18\x06 \x01(\x01\x12\x0e\n\x06target\x18\x07 \x01(\t\x12\x0f\n\x07session\x18\x08 \x01(\t\x12\x0c\n\x04user\x18\t \x01(\t\x12\x0f\n\x07message\x18\n \x01(\t\x12\x17\n\x06server\x18\x0b \x01(\x0b\x32\x07.Server\x12\x17\n\x04http\x18\x0c \x01(\x0b\x32\t.HttpInfo\x12\x15\n\x03log\x18\r \x01(\x0b\x32\x08.LogInfo\x12\x0e\n\x06labels\x18\x0e \x03(\t\x12\x16\n\x06\x66ields\x18\x0f \x03(\x0b\x32\x06.Extra*\x7f\n\x08LogLevel\x12\n\n\x06NOTSET\x10\x00\x12\t\n\x05TRACE\x10\x05\x12\t\n\x05\x44\x45\x42UG\x10\n\x12\x08\n\x04INFO\x10\x14\x12\x06\n\x02OK\x10\x19\x12\x0b\n\x07WARNING\x10\x1e\x12\x08\n\x04WARN\x10\x1e\x12\t\n\x05\x45RROR\x10(\x12\x0c\n\x08\x43RITICAL\x10\x32\x12\x0b\n\x07\x45XTREME\x10<\x1a\x02\x10\x01*I\n\nDeployType\x12\x08\n\x04PROD\x10\x00\x12\t\n\x05STAGE\x10\x01\x12\x07\n\x03\x44\x45V\x10\x02\x12\x08\n\x04TEST\x10\x03\x12\x08\n\x04\x44\x45MO\x10\x04\x12\t\n\x05PILOT\x10\x05*s\n\nHttpMethod\x12\t\n\x05UNSET\x10\x00\x12\x07\n\x03GET\x10\x01\x12\x08\n\x04POST\x10\x02\x12\x07\n\x03PUT\x10\x03\x12\x08\n\x04HEAD\x10\x04\x12\x0b\n\x07OPTIONS\x10\x05\x12\n\n\x06\x44\x45LETE\x10\x06\x12\x0b\n\x07\x43ONNECT\x10\x07\x12\x0e\n\nHTTP_TRACE\x10\x08\x62\x06proto3')
 )
 
 _LOGLEVEL = _descriptor.EnumDescriptor(
@@ -72,8 +72,8 @@ _LOGLEVEL = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   serialized_options=_b('\020\001'),
-  serialized_start=965,
-  serialized_end=1092,
+  serialized_start=1065,
+  serialized_end=1192,
 )
 _sym_db.RegisterEnumDescriptor(_LOGLEVEL)
 
@@ -111,8 +111,8 @@ _DEPLOYTYPE = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   serialized_options=None,
-  serialized_start=1094,
-  serialized_end=1167,
+  serialized_start=1194,
+  serialized_end=1267,
 )
 _sym_db.RegisterEnumDescriptor(_DEPLOYTYPE)
 
@@ -162,8 +162,8 @@ _HTTPMETHOD = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   serialized_options=None,
-  serialized_start=1169,
-  serialized_end=1284,
+  serialized_start=1269,
+  serialized_end=1384,
 )
 _sym_db.RegisterEnumDescriptor(_HTTPMETHOD)
 
@@ -443,6 +443,34 @@ _EXTRA = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='int_value', full_name='Extra.int_value', index=2,
+      number=3, type=18, cpp_type=2, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='double_value', full_name='Extra.double_value', index=3,
+      number=4, type=1, cpp_type=5, label=1,
+      has_default_value=False, default_value=float(0),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='bool_value', full_name='Extra.bool_value', index=4,
+      number=5, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
+    _descriptor.FieldDescriptor(
+      name='bytes_value', full_name='Extra.bytes_value', index=5,
+      number=6, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR),
   ],
   extensions=[
   ],
@@ -454,9 +482,12 @@ _EXTRA = _descriptor.Descriptor(
   syntax='proto3',
   extension_ranges=[],
   oneofs=[
+    _descriptor.OneofDescriptor(
+      name='val', full_name='Extra.val',
+      index=0, containing_type=None, fields=[]),
   ],
-  serialized_start=474,
-  serialized_end=509,
+  serialized_start=475,
+  serialized_end=609,
 )
 
 
@@ -493,8 +524,8 @@ _SCHEMAVERSION = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=511,
-  serialized_end=556,
+  serialized_start=611,
+  serialized_end=656,
 )
 
 
@@ -552,8 +583,8 @@ _EVENTHEADER = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=558,
-  serialized_end=667,
+  serialized_start=658,
+  serialized_end=767,
 )
 
 
@@ -681,8 +712,8 @@ _EVENT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=670,
-  serialized_end=963,
+  serialized_start=770,
+  serialized_end=1063,
 )
 
 _HTTPINFO.fields_by_name['method'].enum_type = _HTTPMETHOD
@@ -694,6 +725,21 @@ _EVENT.fields_by_name['server'].message_type = _SERVER
 _EVENT.fields_by_name['http'].message_type = _HTTPINFO
 _EVENT.fields_by_name['log'].message_type = _LOGINFO
 _EVENT.fields_by_name['fields'].message_type = _EXTRA
+_EXTRA.oneofs_by_name['val'].fields.append(
+  _EXTRA.fields_by_name['value'])
+_EXTRA.fields_by_name['value'].containing_oneof = _EXTRA.oneofs_by_name['val']
+_EXTRA.oneofs_by_name['val'].fields.append(
+  _EXTRA.fields_by_name['int_value'])
+_EXTRA.fields_by_name['int_value'].containing_oneof = _EXTRA.oneofs_by_name['val']
+_EXTRA.oneofs_by_name['val'].fields.append(
+  _EXTRA.fields_by_name['double_value'])
+_EXTRA.fields_by_name['double_value'].containing_oneof = _EXTRA.oneofs_by_name['val']
+_EXTRA.oneofs_by_name['val'].fields.append(
+  _EXTRA.fields_by_name['bool_value'])
+_EXTRA.fields_by_name['bool_value'].containing_oneof = _EXTRA.oneofs_by_name['val']
+_EXTRA.oneofs_by_name['val'].fields.append(
+  _EXTRA.fields_by_name['bytes_value'])
+_EXTRA.fields_by_name['bytes_value'].containing_oneof = _EXTRA.oneofs_by_name['val']
 DESCRIPTOR.message_types_by_name['HttpInfo'] = _HTTPINFO
 DESCRIPTOR.message_types_by_name['Server'] = _SERVER
 DESCRIPTOR.message_types_by_name['LogInfo'] = _LOGINFO
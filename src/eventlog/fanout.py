@@ -0,0 +1,323 @@
+# fanout.py
+#
+# FanoutHandler sends each event to several sinks (for example, a local
+# file and a remote collector). Each Sink has its own bounded queue,
+# worker thread, serializer, and failure handling, so a slow or failing
+# sink delays, drops, or spills only its own events; logEvent only
+# appends the event to each queue.
+#
+#    h = FanoutHandler([Sink(netTransport, name="remote", spill=fileTransport),
+#                       Sink(ConsoleEventHandler(), name="console")])
+#
+# A sink target is either a transport (with send) or an EventHandler
+# (with logEvent). Events are serialized by the sink's worker thread;
+# sinks with the same serializer share one encoding of each event
+# (see event.EncodedEvent).
+#
+# PriorityHandler sends each event to one of several lanes (sinks) by
+# priority, so errors are not queued behind, or dropped with, a flood of
+# debug events:
+#
+#    h = PriorityHandler([(ERROR, Sink(alertTransport, name="high")),
+#                         (WARNING, Sink(netTransport, name="mid")),
+#                         (NOTSET, Sink(netTransport, name="low"))])
+import collections
+import sys
+import threading
+import time
+
+from .config import getConfig
+from .event import encoded, eventToBuffer
+from .handler import EventHandler, _forward, _reaches
+from .stats import StatsCollector
+
+SINK_STATS_PREFIX = "eventlog_sink_"
+
+# overflow policies: when a sink's queue is full, drop the new event,
+# or drop the oldest queued event to make room
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+
+
+class SinkStats(StatsCollector):
+    def __init__(self, prefix, instance=None):
+        super(SinkStats, self).__init__(prefix, instance)
+        self._sent = self.counter(prefix + "sent_total", "events delivered")
+        self._dropped = self.counter(prefix + "dropped_total",
+                                     "events dropped (queue full or send failed)")
+        self._spilled = self.counter(prefix + "spilled_total",
+                                     "events sent to spill transport")
+        self._errors = self.counter(prefix + "errors_total", "failed sends")
+        self._all.extend([self._sent, self._dropped, self._spilled, self._errors])
+
+    def sent(self, n):
+        self._sent.inc(n)
+
+    def dropped(self, n=1):
+        self._dropped.inc(n)
+
+    def spilled(self, n):
+        self._spilled.inc(n)
+
+    def error(self):
+        self._errors.inc(1)
+
+
+# Sink delivers events to one target from its own worker thread
+class Sink(object):
+
+    # @param target transport (send), or handler (logEvent, see handler._forward)
+    # @param serializer converts an Event to a buffer for a transport target.
+    #       Not used if the transport has a framer, or for handler targets
+    # @param name name of the sink, used as the 'instance' label of its stats
+    # @param queueSize max number of queued events; default EVENTLOG_QUEUE_SIZE
+    # @param batchSize max number of events per send; default EVENTLOG_BATCH_SIZE
+    # @param overflow DROP_NEWEST or DROP_OLDEST
+    # @param spill optional transport that receives batches the target
+    #       failed to send. If None, those events are dropped
+    def __init__(self, target, serializer=eventToBuffer, name=None,
+                 queueSize=None, batchSize=None, overflow=DROP_NEWEST, spill=None):
+        config = getConfig()
+        self.target = target
+        self.serializer = serializer
+        self.name = name
+        self.queueSize = queueSize or config.queue_size
+        self.batchSize = batchSize or config.batch_size
+        self.overflow = overflow
+        self.spill = spill
+        self.stats = SinkStats(SINK_STATS_PREFIX, name)
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    # put queues an event (Event or EncodedEvent); never blocks
+    def put(self, event):
+        with self._cond:
+            if self._closed:
+                self.stats.dropped()
+                return
+            if len(self._queue) >= self.queueSize:
+                self.stats.dropped()
+                if self.overflow != DROP_OLDEST:
+                    return
+                self._queue.popleft()
+            self._queue.append(encoded(event))
+            self._cond.notify()
+
+    def _run(self):
+        queue = self._queue
+        while True:
+            with self._cond:
+                while not queue and not self._closed:
+                    self._cond.wait()
+                if not queue:
+                    return
+                batch = [queue.popleft() for i in range(min(len(queue), self.batchSize))]
+                self._inflight = len(batch)
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                # keep the worker alive
+                sys.stderr.write("ERROR: sink %s: %s\n" % (self.name, str(e)))
+            finally:
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
+
+    # deliver a batch of EncodedEvents
+    def _deliver(self, batch):
+        target = self.target
+        if hasattr(target, 'logEvent'):
+            for e in batch:
+                try:
+                    _forward(target, e)
+                    self.stats.sent(1)
+                except Exception:
+                    self.stats.error()
+                    self.stats.dropped()
+            return
+        if getattr(target, 'framer', None) is not None:
+            data = [e.full() for e in batch]
+        else:
+            data = [e.encode(self.serializer) for e in batch]
+        if target.checkStatus():
+            try:
+                target.send(data)
+                self.stats.sent(len(batch))
+                return
+            except Exception:
+                self.stats.error()
+        self._spill(batch, data)
+
+    # _spill sends a batch that could not be delivered to the spill transport
+    def _spill(self, batch, data):
+        if self.spill is not None:
+            if getattr(self.spill, 'framer', None) is not None:
+                data = [e.full() for e in batch]
+            elif getattr(self.target, 'framer', None) is not None:
+                data = [e.encode(self.serializer) for e in batch]
+            try:
+                self.spill.send(data)
+                self.stats.spilled(len(batch))
+                return
+            except Exception as e:
+                sys.stderr.write("ERROR: sink %s: spill failed: %s\n" % (self.name, str(e)))
+        self.stats.dropped(len(batch))
+
+    # dropOldest drops the oldest queued event, to make room in another sink.
+    # Returns True if an event was dropped
+    def dropOldest(self):
+        with self._cond:
+            if not self._queue:
+                return False
+            self._queue.popleft()
+        self.stats.dropped()
+        return True
+
+    # pending returns the number of events queued or being delivered
+    def pending(self):
+        return len(self._queue) + self._inflight
+
+    # flush waits until all queued events have been delivered
+    # @param timeout max seconds to wait, or None to wait indefinitely
+    # Returns True if the queue was drained
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._queue or self._inflight:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # close delivers queued events, stops the worker thread, and releases stats
+    def close(self, timeout=None):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self.stats.close()
+
+    def get_stats(self):
+        return self.stats.get_stats()
+
+
+# FanoutHandler is an EventHandler that queues each event to all its sinks
+class FanoutHandler(EventHandler):
+
+    # @param sinks list of Sink
+    # @param filters optional list of logging filters (see EventHandler)
+    # @param name optional name, used as the 'instance' label of stats
+    def __init__(self, sinks=(), filters=None, name=None):
+        super(FanoutHandler, self).__init__(transport=None, filters=filters, name=name)
+        self.sinks = []
+        for s in sinks:
+            self.addSink(s)
+
+    def addSink(self, sink):
+        if _reaches(sink.target, self):
+            raise Exception("Invalid sink. Loops not allowed.")
+        self.sinks.append(sink)
+
+    def logEvent(self, event):
+        self.stats.event()
+        enc = encoded(event)
+        for s in self.sinks:
+            s.put(enc)
+        if self.replica:
+            _forward(self.replica, enc)
+
+    # flush waits until all sinks have delivered their queued events
+    def flush(self, timeout=None):
+        for s in self.sinks:
+            s.flush(timeout)
+
+    def close(self):
+        for s in self.sinks:
+            s.close()
+        super(FanoutHandler, self).close()
+
+    def get_stats(self):
+        stats = super(FanoutHandler, self).get_stats()
+        for s in self.sinks:
+            stats.extend(s.get_stats())
+        return stats
+
+
+# PriorityHandler is an EventHandler that queues each event to the lane for
+# its priority. Each lane is a Sink, with its own queue and worker thread,
+# so an event is only queued behind events of the same lane. Lanes that
+# share a NetTransport send on separate pooled connections; a lane may
+# also have its own transport.
+#
+# The priority of an event is its log.level, unless another priority is
+# given to logEvent. When the total number of queued events reaches
+# capacity, the oldest event of the lowest-priority non-empty lane below
+# the new event's lane is dropped to make room; if there is none, the new
+# event is dropped. Each lane's own queueSize and overflow policy also apply.
+class PriorityHandler(FanoutHandler):
+
+    # @param lanes list of (minPriority, Sink). An event goes to the lane
+    #       with the highest minPriority not above the event's priority.
+    #       Events below all lanes go to the lowest lane
+    # @param capacity max number of events queued in all lanes;
+    #       default EVENTLOG_QUEUE_SIZE
+    # @param filters optional list of logging filters (see EventHandler)
+    # @param name optional name, used as the 'instance' label of stats
+    def __init__(self, lanes, capacity=None, filters=None, name=None):
+        super(PriorityHandler, self).__init__(filters=filters, name=name)
+        self.capacity = capacity or getConfig().queue_size
+        self._levels = []
+        for (minPriority, sink) in lanes:
+            self.addLane(minPriority, sink)
+
+    # addLane adds a lane for events with priority >= minPriority
+    def addLane(self, minPriority, sink):
+        self.addSink(sink)
+        self._levels.append(minPriority)
+        # keep lanes in order of decreasing priority
+        order = sorted(range(len(self.sinks)), key=lambda i: -self._levels[i])
+        self.sinks = [self.sinks[i] for i in order]
+        self._levels = [self._levels[i] for i in order]
+
+    # lane returns the index of the lane for a priority (0 is highest)
+    def lane(self, priority):
+        for (i, level) in enumerate(self._levels):
+            if priority >= level:
+                return i
+        return len(self._levels) - 1
+
+    # @param event Event or EncodedEvent
+    # @param priority optional priority, on the same scale as log levels
+    #       (eventlog.loglevel); default is the event's log.level
+    def logEvent(self, event, priority=None):
+        self.stats.event()
+        enc = encoded(event)
+        if priority is None:
+            priority = enc.event.log.level
+        sink = self.sinks[self.lane(priority)]
+        if sum(s.pending() for s in self.sinks) >= self.capacity \
+                and not self._makeRoom(sink):
+            sink.stats.dropped()
+        else:
+            sink.put(enc)
+        if self.replica:
+            _forward(self.replica, enc)
+
+    # _makeRoom drops the oldest event of the lowest lane below sink's lane.
+    # Returns False if those lanes are empty
+    def _makeRoom(self, sink):
+        for s in reversed(self.sinks):
+            if s is sink:
+                return False
+            if s.dropOldest():
+                return True
+        return False
@@ -0,0 +1,283 @@
+# filetransport.py
+#
+# FileTransport appends events to a local file, for log shippers that tail
+# files, or as a fallback transport when the log receiver is down:
+#
+#    handler = EventHandler(netTransport,
+#                           fallbackTx=FileTransport('/var/log/app/events.log'))
+#
+# Events are written as FRAME_EVENT frames (see eventlog.wire) or as JSON
+# lines. Encoded events are collected in a buffer, which is written with
+# one write() on a file opened with O_APPEND when it reaches bufferSize,
+# and at least every flushInterval seconds. If writes fail, at most
+# maxBufferSize bytes are buffered; further events are refused.
+#
+# The file is rotated when it reaches maxBytes, or is older than
+# rotateInterval seconds: it is renamed to path.YYYYmmdd-HHMMSS, and a new
+# file is started. Rotated files are compressed (EVENTLOG_COMPRESSION) by
+# a background thread, so writers never wait for compression; at most
+# backupCount rotated files are kept.
+#
+# A file must have a single writer: one FileTransport, in one process.
+# Rotation renames the file without coordinating with other writers, which
+# would keep appending to the rotated file, and rotate it again.
+import gzip
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+import six
+from google.protobuf.message import DecodeError
+
+from .config import getConfig
+from .event_pb2 import Event
+from .transport import BaseTransport
+from .wire import FRAME_EVENT, EventFramer, makeFrame
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+FORMAT_FRAMES = 'frames'
+FORMAT_JSON = 'json'
+
+DEFAULT_BUFFER_SIZE = 256 * 1024
+
+# suffix of rotated files: timestamp, sequence within the second, and .gz
+_ROTATED = re.compile(r'^(\d{8}-\d{6})(?:\.(\d+))?(?:\.gz)?$')
+
+
+# _JsonFramer encodes events as JSON lines
+class _JsonFramer(object):
+
+    def frame(self, messages, state):
+        from google.protobuf.json_format import MessageToDict
+        return [((json.dumps(MessageToDict(e)) + '\n').encode('utf-8'), 1) for e in messages]
+
+
+# _parseEvent returns the Event serialized in data
+def _parseEvent(data):
+    try:
+        return Event.FromString(data)
+    except DecodeError:
+        raise ValueError("FileTransport: data is not a serialized Event")
+
+
+# _checkEvent returns data, if it is a serialized Event
+def _checkEvent(data):
+    _parseEvent(data)
+    return data
+
+
+class FileTransport(BaseTransport):
+
+    # @param path output file
+    # @param fileFormat FORMAT_FRAMES or FORMAT_JSON
+    # @param maxBytes rotate when the file would exceed this size; 0 disables
+    # @param rotateInterval rotate files older than this many seconds; 0 disables
+    # @param backupCount number of rotated files to keep; 0 keeps all
+    # @param compression 'gzip' or 'none'; default EVENTLOG_COMPRESSION
+    # @param bufferSize bytes buffered before they are written
+    # @param flushInterval max seconds that events are buffered
+    # @param maxBufferSize max bytes buffered while writes fail;
+    #       default 4 * bufferSize
+    # @param name optional name, used as the 'instance' label of stats
+    def __init__(self, path, fileFormat=FORMAT_FRAMES, maxBytes=0, rotateInterval=0,
+                 backupCount=10, compression=None, bufferSize=DEFAULT_BUFFER_SIZE,
+                 flushInterval=1.0, maxBufferSize=None, name=None):
+        super(FileTransport, self).__init__(name)
+        if fileFormat not in (FORMAT_FRAMES, FORMAT_JSON):
+            raise ValueError("invalid file format: %s" % fileFormat)
+        self.path = path
+        self.fileFormat = fileFormat
+        self.maxBytes = maxBytes
+        self.rotateInterval = rotateInterval
+        self.backupCount = backupCount
+        self.compression = compression or getConfig().compression
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.maxBufferSize = maxBufferSize or 4 * bufferSize
+        # events are passed to send() unserialized, and encoded here
+        self.framer = EventFramer() if fileFormat == FORMAT_FRAMES else _JsonFramer()
+        self._buf = bytearray()
+        self._count = 0
+        # True if a write failed after writing part of the buffer
+        self._partial = False
+        self._lock = threading.Lock()
+        self._lastRotated = (None, 0)
+        self._open()
+        # rotated files waiting to be compressed
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._openedAt = time.time()
+
+    # send appends messages to the buffer. Messages are Events, or Events
+    # serialized with eventToBuffer (handlers give this transport Events,
+    # whatever their serializer). Data that does not decode as an Event,
+    # such as JSON or console text, raises ValueError
+    def send(self, messages):
+        if self.fileFormat == FORMAT_FRAMES:
+            data = [makeFrame(FRAME_EVENT, _checkEvent(m) if isinstance(m, six.binary_type)
+                              else m.SerializeToString()) for m in messages]
+        else:
+            events = [_parseEvent(m) if isinstance(m, six.binary_type)
+                      else m for m in messages]
+            data = [buf for (buf, n) in self.framer.frame(events, None)]
+        with self._lock:
+            if self._fd is None:
+                raise Exception("FileTransport is closed")
+            if len(self._buf) >= self.maxBufferSize:
+                # earlier writes failed: refuse messages while the file
+                # is not writable, rather than buffering them without limit
+                self._flush()
+            for d in data:
+                self._buf += d
+            self._count += len(data)
+            if len(self._buf) >= self.bufferSize:
+                self._flush()
+
+    # _flush writes the buffer. Must be called with the lock held
+    def _flush(self):
+        if not self._buf:
+            return
+        full = self.maxBytes and self._size + len(self._buf) > self.maxBytes
+        old = self.rotateInterval and time.time() - self._openedAt >= self.rotateInterval
+        # the rest of a partly written frame goes to the same file
+        if self._size and (full or old) and not self._partial:
+            self._rotate()
+        view = memoryview(self._buf)
+        written = 0
+        try:
+            while written < len(view):
+                written += os.write(self._fd, view[written:])
+        except OSError:
+            self.stats.socket_error()
+            self.setStatus(False)
+            # a partial write is not written again. The buffer is copied,
+            # as views of it may still be referenced by the traceback
+            self._buf = self._buf[written:]
+            self._partial = self._partial or written > 0
+            self._size += written
+            self.stats.bytes_sent(written)
+            raise
+        finally:
+            # release the view, so the buffer can be resized
+            if hasattr(view, 'release'):
+                view.release()
+        self.setStatus(True)
+        self._partial = False
+        self._size += len(self._buf)
+        self.stats.bytes_sent(len(self._buf))
+        self.stats.events_sent(self._count)
+        self._buf = bytearray()
+        self._count = 0
+
+    # _rotate renames the current file and queues it for compression.
+    # Must be called with the lock held
+    def _rotate(self):
+        os.close(self._fd)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        # sequence number for files rotated in the same second
+        n = self._lastRotated[1] + 1 if stamp == self._lastRotated[0] else 0
+        while True:
+            dest = "%s.%s" % (self.path, stamp) + (".%d" % n if n else "")
+            if not (os.path.exists(dest) or os.path.exists(dest + '.gz')):
+                break
+            n += 1
+        self._lastRotated = (stamp, n)
+        os.rename(self.path, dest)
+        self._open()
+        with self._cond:
+            self._pending.append(dest)
+            self._cond.notify()
+
+    # flush writes buffered events to the file
+    def flush(self):
+        with self._lock:
+            if self._fd is not None:
+                self._flush()
+
+    # _run flushes the buffer every flushInterval, and compresses rotated files
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait(self.flushInterval)
+                pending = self._pending
+                self._pending = []
+                closed = self._closed
+            try:
+                if not closed:
+                    self.flush()
+                for path in pending:
+                    self._compress(path)
+                if pending:
+                    self._removeOld()
+            except Exception as e:
+                # keep the thread alive
+                sys.stderr.write("ERROR: FileTransport %s: %s\n" % (self.path, str(e)))
+            if closed:
+                with self._cond:
+                    if not self._pending:
+                        return
+
+    def _compress(self, path):
+        if self.compression != 'gzip' or not os.path.exists(path):
+            # not compressed, or already removed by _removeOld
+            return
+        tmp = path + '.gz.tmp'
+        with open(path, 'rb') as src:
+            with gzip.open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.rename(tmp, path + '.gz')
+        os.remove(path)
+
+    # rotatedFiles returns the paths of rotated files, oldest first
+    def rotatedFiles(self):
+        (dirname, basename) = os.path.split(os.path.abspath(self.path))
+        files = []
+        for f in os.listdir(dirname):
+            m = _ROTATED.match(f[len(basename) + 1:]) if f.startswith(basename + '.') else None
+            if m:
+                files.append(((m.group(1), int(m.group(2) or 0)), os.path.join(dirname, f)))
+        return [path for (key, path) in sorted(files)]
+
+    # _removeOld removes the oldest rotated files, keeping backupCount
+    def _removeOld(self):
+        if self.backupCount:
+            for f in self.rotatedFiles()[:-self.backupCount]:
+                os.remove(f)
+
+    # close writes buffered events, and waits for rotated files to be compressed
+    # The file is closed, and the thread stopped, even if the last write fails
+    def close(self):
+        closing = False
+        try:
+            with self._lock:
+                if self._fd is None:
+                    return
+                closing = True
+                try:
+                    self._flush()
+                finally:
+                    os.close(self._fd)
+                    self._fd = None
+        finally:
+            if closing:
+                with self._cond:
+                    self._closed = True
+                    self._cond.notify()
+                self._thread.join()
+                super(FileTransport, self).close()
@@ -0,0 +1,131 @@
+# filters.py
+#
+# Cheap pre-filters for EventHandler, evaluated on the raw logging.LogRecord.
+# logging.Handler.handle() runs the handler's filters before emit(),
+# so records rejected here never pay for newLogRecord (protobuf construction,
+# stack walk, user context lookup).
+#
+# Usage:
+#    handler = EventHandler(transport, filters=[
+#        LevelFilter({'urllib3': logging.WARNING, 'botocore': logging.ERROR}),
+#        NameDenyFilter([r'^boto', r'\.chatty$']),
+#        DedupFilter(window=30),
+#    ])
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+# LevelFilter applies per-logger-name level thresholds.
+# Thresholds are inherited through the dotted logger hierarchy, so
+# a threshold for 'urllib3' also applies to 'urllib3.connectionpool',
+# unless overridden by a more specific name.
+# Thresholds are resolved once per logger name and cached.
+class LevelFilter(logging.Filter):
+
+    # @param levels dict of logger name -> minimum level (int)
+    # @param default minimum level for loggers not matched in levels
+    def __init__(self, levels, default=logging.NOTSET):
+        super(LevelFilter, self).__init__()
+        self._levels = dict(levels)
+        self._default = default
+        self._cache = {}
+
+    def _threshold(self, name):
+        # walk up the hierarchy: a.b.c, a.b, a
+        key = name
+        while key:
+            level = self._levels.get(key)
+            if level is not None:
+                return level
+            pos = key.rfind('.')
+            if pos < 0:
+                break
+            key = key[:pos]
+        return self._default
+
+    def filter(self, record):
+        threshold = self._cache.get(record.name)
+        if threshold is None:
+            threshold = self._threshold(record.name)
+            self._cache[record.name] = threshold
+        return record.levelno >= threshold
+
+
+# NameDenyFilter drops records whose logger name matches
+# any of a list of regular expressions.
+# The patterns are compiled into a single regex, and each logger name
+# is matched only once; subsequent lookups are a dict hit.
+class NameDenyFilter(logging.Filter):
+
+    # @param patterns list of regular expression strings (matched with search)
+    def __init__(self, patterns):
+        super(NameDenyFilter, self).__init__()
+        patterns = list(patterns)
+        if patterns:
+            self._regex = re.compile('|'.join('(?:%s)' % p for p in patterns))
+        else:
+            self._regex = None
+        self._cache = {}
+
+    def filter(self, record):
+        allow = self._cache.get(record.name)
+        if allow is None:
+            allow = self._regex is None or self._regex.search(record.name) is None
+            self._cache[record.name] = allow
+        return allow
+
+
+# DedupFilter suppresses repeated identical log records within a time window.
+# Records are identical if they come from the same logger, level,
+# and source line, and have the same message template and arguments.
+# The first record in each window is passed; when a window expires,
+# the next matching record is passed with attribute 'dedup_suppressed'
+# set to the number of records dropped in the previous window.
+# At most maxsize distinct keys are tracked (least recently seen evicted first).
+class DedupFilter(logging.Filter):
+
+    # @param window length of dedup window, in seconds
+    # @param maxsize max number of distinct records tracked
+    def __init__(self, window=60.0, maxsize=1024):
+        super(DedupFilter, self).__init__()
+        self._window = window
+        self._maxsize = maxsize
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(record):
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.msg)
+        args = record.args
+        if args:
+            try:
+                hash(args)
+                return key + (args,)
+            except TypeError:
+                return key + (record.getMessage(),)
+        return key
+
+    def filter(self, record):
+        key = self._key(record)
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable msg object - don't try to dedup it
+            return True
+        now = time.time()
+        with self._lock:
+            entry = self._seen.pop(key, None)
+            if entry is not None and now - entry[0] < self._window:
+                entry[1] += 1
+                self._seen[key] = entry
+                return False
+            # first record or window expired: start new window
+            self._seen[key] = [now, 0]
+            if len(self._seen) > self._maxsize:
+                self._seen.popitem(last=False)
+        if entry is not None and entry[1]:
+            record.dedup_suppressed = entry[1]
+        return True
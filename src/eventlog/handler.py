@@ -7,8 +7,12 @@ from copy import copy
 import six
 import json
 
-from .event import newEvent, newLogRecord, eventToBuffer, eventToJson
-from .event_pb2 import INFO
+from .aggregate import MetricAggregator, _AggregatingValue, _Timer
+from .event import encoded, newEvent, newLogRecord, eventToBuffer, eventToJson
+from .event_pb2 import INFO, Event
+from .stats import LogStats
+
+LOG_STATS_PREFIX = "eventlog_log_"
 
 
 # EventFormatter - turns a python logging record into an Event and formats it
@@ -54,28 +58,47 @@ class EventHandler(logging.Handler):
     #        (for example, to send to console)
     # @param fallbackTx optional fallback transport in case primary tx
     #        fails to send
+    # @param filters optional list of logging filters (see eventlog.filters)
+    #        applied to log records before they are converted to events
+    # @param name optional name, used as the 'instance' label of stats.
+    #        Unnamed handlers share their stats
     def __init__(self, transport,
                  serializer=eventToBuffer,
-                 replica=None, fallbackTx=None):
+                 replica=None, fallbackTx=None,
+                 filters=None, name=None):
         super(EventHandler, self).__init__()
         self.transport = transport
         self.serializer = serializer
         self.formatter = EventFormatter(self)
         self.replica = replica
         self.fallbackTx = fallbackTx
+        self.aggregator = None
+        self.stats = LogStats(LOG_STATS_PREFIX, name)
+        for f in (filters or []):
+            self.addFilter(f)
 
     # add event to queue for sending to log forwarder
     # queue is persistent locally (via sqlite) so this should work
     # even if the log forwarder is down briefly.
     # If either primary or replica transport hangs, it will block
     # the current thread.
+    # @param event Event, or EncodedEvent (from another handler), whose
+    #       encodings are shared with replicas so each serializer runs once.
+    #       The event must not be modified after it is logged: handlers
+    #       and sinks may serialize it later, or reuse an earlier encoding
     def logEvent(self, event):
-        data = self.getSerializer()(event)
+        self.stats.event()
+        enc = encoded(event)
+        if getattr(self.transport, 'framer', None) is not None:
+            # transport encodes events itself
+            data = enc.full()
+        else:
+            data = enc.encode(self.getSerializer())
         self._sendData(data)
 
         # if a replica handler has been set up, copy logs there
         if self.replica:
-            self.replica.logEvent(event)
+            _forward(self.replica, enc)
 
     # send byte stream through transport
     # Internal method that logs byte stream
@@ -90,6 +113,7 @@ class EventHandler(logging.Handler):
         if self.transport.checkStatus():
             try:
                 self.transport.send([data, ])
+                self.stats.send()
                 return
             except Exception:
                 if self.fallbackTx:
@@ -99,25 +123,67 @@ class EventHandler(logging.Handler):
 
         if self.fallbackTx:
             # try fallback, if transport is down or first attempt failed
+            if isinstance(data, Event) and getattr(self.fallbackTx, 'framer', None) is None:
+                data = self.getSerializer()(data)
             try:
                 # if fallback fails, then throw new exception
                 self.fallbackTx.send([data, ])
             except Exception:
+                self.stats.discard()
                 errLog.write("CRITICAL: Fallback event transport failed\n")
-                errLog.write(data)
+                # data may be an Event, or bytes, for a framing transport
+                errLog.write(data if isinstance(data, six.string_types) else repr(data))
+                errLog.write("\n")
                 t, v, tb = sys.exc_info()
                 traceback.print_exception(t, v, tb, None, errLog)
                 raise
+        else:
+            self.stats.discard()
 
     # override emit to make everything go through logEvent
+    # emit is only called for records that pass the handler's level
+    # and filters, so the Event is not built for rejected records.
     def emit(self, record):
         event = newLogRecord(record)
         self.logEvent(event)
 
     # Create a Counter/Gauge value that logs all changes.
-    def createTrackingValue(self, name, target, initialValue=0, fields={}):
+    # If aggregate is True, changes are accumulated in memory and
+    # one summary event (count, delta, min, max, last value) is logged
+    # per flush interval for each distinct set of fields.
+    def createTrackingValue(self, name, target, initialValue=0, fields={},
+                            aggregate=False):
+        if aggregate:
+            return _AggregatingValue(self.getAggregator(), name, target,
+                                     initialValue, fields)
         return _LoggingValue(self, name, target, initialValue, fields)
 
+    # Create a timer that records durations in an in-process histogram.
+    # One event per flush interval is logged, with count, sum, and
+    # p50/p90/p99/max durations (in seconds) in fields.
+    # The timer can be used as a context manager or decorator.
+    def timer(self, name, target='', fields={}):
+        return _Timer(self.getAggregator(), name, target, fields)
+
+    # getAggregator returns the aggregator for this handler, creating it if necessary
+    def getAggregator(self):
+        if self.aggregator is None:
+            self.acquire()
+            try:
+                if self.aggregator is None:
+                    self.aggregator = MetricAggregator(self)
+            finally:
+                self.release()
+        return self.aggregator
+
+    # close sends final summaries of aggregated values, and releases stats.
+    # logging.shutdown() calls this at exit
+    def close(self):
+        if self.aggregator is not None:
+            self.aggregator.close()
+        self.stats.close()
+        super(EventHandler, self).close()
+
     def getSerializer(self):
         return self.serializer
 
@@ -127,10 +193,9 @@ class EventHandler(logging.Handler):
     # add secondary handler (usually a ConsoleEventHandler)
     # if parameter is None, disables secondary handler
     def setReplica(self, replica):
-        # catch accidental loops (at 0 or 1-deep)
-        if replica is not None:
-            if replica == self or replica.replica == self:
-                raise Exception("Invalid parameter. Loops not allowed.")
+        # catch accidental loops, through any chain of replicas and sinks
+        if replica is not None and _reaches(replica, self):
+            raise Exception("Invalid parameter. Loops not allowed.")
         self.replica = replica
 
     def setFallbackTransport(self, fallback):
@@ -138,12 +203,42 @@ class EventHandler(logging.Handler):
             raise Exception("Fallback transport may not be the same as primary")
         self.fallbackTx = fallback
 
+    # get_stats returns list of (name, value) for this handler's counters
+    def get_stats(self):
+        return self.stats.get_stats()
+
     # isRemote returns True if there is a network transport,
     # or False if this is a console or file handler
     def isRemote(self):
         return self.transport is not None
 
 
+# _forward logs an EncodedEvent to handler. EventHandlers are given the
+# EncodedEvent, and share its encodings; other handlers (any object with
+# a logEvent method) are given the Event, with the fields of its scope
+def _forward(handler, enc):
+    if isinstance(handler, EventHandler):
+        handler.logEvent(enc)
+    else:
+        handler.logEvent(enc.full())
+
+
+# _reaches returns True if events logged to handler could reach target,
+# through replicas, fan-out sinks, routes, and targets
+# (see eventlog.fanout, eventlog.routing, eventlog.recorder)
+def _reaches(handler, target, seen=None):
+    if handler is target:
+        return True
+    seen = seen if seen is not None else set()
+    if handler is None or id(handler) in seen:
+        return False
+    seen.add(id(handler))
+    downstream = [getattr(handler, 'replica', None), getattr(handler, 'target', None)]
+    downstream.extend(s.target for s in getattr(handler, 'sinks', ()))
+    downstream.extend(r.handler for r in getattr(handler, 'routes', ()))
+    return any(_reaches(h, target, seen) for h in downstream)
+
+
 # LoggingValue can be used as a Counter or Gauge
 # that logs events for all changes to its value
 # It can be initialized with template event fields (target,fields)
@@ -246,6 +341,19 @@ def format_console(event, textFormat=_CONSOLE_FORMAT):
     return text
 
 
+# console serializers, by format string. Handlers with the same format
+# share a serializer, so an event's console text is formatted once
+_consoleSerializers = {}
+
+
+def _consoleSerializer(textFormat):
+    ser = _consoleSerializers.get(textFormat)
+    if ser is None:
+        ser = _consoleSerializers.setdefault(textFormat,
+                                             lambda e: format_console(e, textFormat))
+    return ser
+
+
 # log to console (or a writable stream) instead of sending to logstash
 # also doesn't create worker thread
 class ConsoleEventHandler(EventHandler):
@@ -253,7 +361,7 @@ class ConsoleEventHandler(EventHandler):
     def __init__(self, ch=sys.stdout, textFormat=_CONSOLE_FORMAT):
         super(ConsoleEventHandler, self).__init__(
             transport=None,
-            serializer=lambda e: format_console(e, textFormat),
+            serializer=_consoleSerializer(textFormat),
         )
         self.ch = ch
 
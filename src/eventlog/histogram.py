@@ -0,0 +1,95 @@
+# histogram.py
+#
+# Compact, array-backed histogram with log-linear buckets.
+# Each power of two is split into SUB_BUCKETS linear sub-buckets,
+# so the relative error of a reported percentile is at most
+# 1/(2*SUB_BUCKETS) (about 6% with the default 8 sub-buckets).
+# Recording a value is O(1) and allocates nothing.
+import math
+import threading
+from array import array
+
+# number of linear sub-buckets per power of two
+SUB_BUCKETS = 8
+
+# smallest and largest exponents tracked (values are in the range
+# 2**MIN_EXP .. 2**MAX_EXP); for durations in seconds that is 1us to ~68 min
+MIN_EXP = -20
+MAX_EXP = 12
+
+_NUM_BUCKETS = (MAX_EXP - MIN_EXP) * SUB_BUCKETS + 1
+
+
+# _bucketIndex returns the bucket for value v
+# bucket 0 holds zero, negative, and values below 2**MIN_EXP
+def _bucketIndex(v):
+    if v <= 0:
+        return 0
+    (m, e) = math.frexp(v)   # v = m * 2**e, 0.5 <= m < 1
+    if e <= MIN_EXP:
+        return 0
+    if e > MAX_EXP:
+        return _NUM_BUCKETS - 1
+    sub = int((m - 0.5) * 2 * SUB_BUCKETS)
+    return (e - MIN_EXP - 1) * SUB_BUCKETS + sub + 1
+
+
+# _bucketValue returns the representative (midpoint) value of bucket i
+def _bucketValue(i):
+    if i == 0:
+        return 0.0
+    i -= 1
+    e = i // SUB_BUCKETS + MIN_EXP + 1
+    sub = i % SUB_BUCKETS
+    lo = math.ldexp(0.5 + float(sub) / (2 * SUB_BUCKETS), e)
+    hi = math.ldexp(0.5 + float(sub + 1) / (2 * SUB_BUCKETS), e)
+    return (lo + hi) / 2
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self._counts = array('L', [0] * _NUM_BUCKETS)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    # record a value
+    def record(self, v):
+        i = _bucketIndex(v)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.sum += v
+            if self.min is None or v < self.min:
+                self.min = v
+            if self.max is None or v > self.max:
+                self.max = v
+
+    # percentile returns the approximate value at quantile q (0 <= q <= 1)
+    # Returns None if histogram is empty
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                # exact extremes are known, so clamp the estimate
+                return min(max(_bucketValue(i), self.min), self.max)
+        return self.max
+
+    # snapshot returns a copy of the histogram and resets this one
+    def snapshot(self):
+        h = Histogram()
+        with self._lock:
+            (h._counts, self._counts) = (self._counts, h._counts)
+            (h.count, h.sum, h.min, h.max) = (self.count, self.sum, self.min, self.max)
+            self.count = 0
+            self.sum = 0.0
+            self.min = None
+            self.max = None
+        return h
@@ -0,0 +1,153 @@
+# middleware.py
+#
+# WSGI middleware that attaches the request's HttpInfo to all events
+# logged while handling a request, and logs one event when it completes:
+#
+#    application = EventMiddleware(application)
+#
+# For ASGI, see eventlog.asgi.
+#
+# HttpInfo is extracted from the request once, and set in an event scope
+# (see eventlog.context), so it is serialized once per request.
+#
+# The completion event is named 'http_request', with the request path as
+# target, the response status as value (and in http.status), and the
+# request duration in seconds (until the response body has been sent).
+# Its level is ERROR for 5xx responses and unhandled exceptions, WARNING
+# for 4xx responses, and INFO otherwise.
+import time
+
+import six
+
+from .context import eventContext
+from .event import newEvent
+from .event_pb2 import HttpInfo, HttpMethod
+from .loglevel import ERROR, INFO, WARNING
+
+REQUEST_EVENT_NAME = 'http_request'
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+_METHODS = dict((name, HttpMethod.Value(name)) for name in HttpMethod.keys())
+_METHODS['TRACE'] = HttpMethod.Value('HTTP_TRACE')
+
+
+def _text(s):
+    if isinstance(s, six.binary_type):
+        return s.decode('latin-1')
+    return s
+
+
+# _newHttpInfo creates an HttpInfo from request values
+# @param headers dict of lower-case header name -> value
+def _newHttpInfo(method, path, query, remoteAddr, remoteHost, headers):
+    return HttpInfo(
+        method=_METHODS.get(method, HttpMethod.Value('UNSET')),
+        path=path,
+        query=query,
+        remote_addr=remoteAddr,
+        remote_host=remoteHost,
+        referer=headers.get('referer', u''),
+        user_agent=headers.get('user-agent', u''),
+        forwarded_proto=headers.get('x-forwarded-proto', u''),
+        forwarded_for=headers.get('x-forwarded-for', u''),
+    )
+
+
+# httpInfoFromEnviron returns the HttpInfo of a WSGI request
+def httpInfoFromEnviron(environ):
+    headers = {
+        'referer': environ.get('HTTP_REFERER', u''),
+        'user-agent': environ.get('HTTP_USER_AGENT', u''),
+        'x-forwarded-proto': environ.get('HTTP_X_FORWARDED_PROTO', u''),
+        'x-forwarded-for': environ.get('HTTP_X_FORWARDED_FOR', u''),
+    }
+    return _newHttpInfo(environ.get('REQUEST_METHOD', ''),
+                        environ.get('SCRIPT_NAME', u'') + environ.get('PATH_INFO', u''),
+                        environ.get('QUERY_STRING', u''),
+                        environ.get('REMOTE_ADDR', u''),
+                        environ.get('REMOTE_HOST', u''),
+                        headers)
+
+
+# httpInfoFromScope returns the HttpInfo of an ASGI http request
+def httpInfoFromScope(scope):
+    headers = dict((_text(k).lower(), _text(v)) for (k, v) in scope.get('headers', ()))
+    client = scope.get('client') or (u'', 0)
+    return _newHttpInfo(scope.get('method', ''),
+                        scope.get('root_path', u'') + scope.get('path', u''),
+                        _text(scope.get('query_string', b'')),
+                        client[0] or u'',
+                        u'',
+                        headers)
+
+
+# logRequest logs the completion event of a request
+# @param start request start time, from _clock()
+def logRequest(handler, info, status, start):
+    if status >= 500:
+        level = ERROR
+    elif status >= 400:
+        level = WARNING
+    else:
+        level = INFO
+    e = newEvent(REQUEST_EVENT_NAME, info.path, value=status, level=level,
+                 duration=_clock() - start)
+    e.http.CopyFrom(info)
+    e.http.status = status
+    if handler is None:
+        from . import logEvent
+        logEvent(e)
+    else:
+        handler.logEvent(e)
+
+
+# EventMiddleware is WSGI middleware. The HttpInfo scope covers the call
+# of the application; events logged while the response body is iterated
+# do not have it
+class EventMiddleware(object):
+
+    # @param app WSGI application
+    # @param handler EventHandler for request completion events;
+    #       default is the default event handler (eventlog.defaultEventHandler)
+    def __init__(self, app, handler=None):
+        self.app = app
+        self.handler = handler
+
+    def __call__(self, environ, start_response):
+        start = _clock()
+        info = httpInfoFromEnviron(environ)
+        status = [500]
+
+        def startResponse(statusLine, headers, excInfo=None):
+            status[0] = int(statusLine.split(' ', 1)[0])
+            if excInfo is None:
+                return start_response(statusLine, headers)
+            return start_response(statusLine, headers, excInfo)
+
+        with eventContext(http=info):
+            try:
+                result = self.app(environ, startResponse)
+            except Exception:
+                logRequest(self.handler, info, 500, start)
+                raise
+        return _ResponseBody(result, lambda: logRequest(self.handler, info, status[0], start))
+
+
+# _ResponseBody wraps a WSGI response body, to log the request
+# when the server closes it
+class _ResponseBody(object):
+
+    def __init__(self, body, onClose):
+        self._body = body
+        self._onClose = onClose
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._onClose()
@@ -0,0 +1,158 @@
+# recorder.py
+#
+# FlightRecorderHandler keeps the most recent events of each thread (or
+# request) in a ring, and sends nothing until an event at or above the
+# trigger level arrives. Then the ring contents, followed by the trigger
+# event, are sent to the target handler, so detailed (debug) context is
+# available for failures without sending debug events all the time:
+#
+#    recorder = FlightRecorderHandler(EventHandler(transport), size=200)
+#    recorder.setLevel(DEBUG)
+#    logging.getLogger().addHandler(recorder)
+#
+# Log records are kept as they are, and converted to Events only if they
+# are sent, so recording a record costs a list store. Their timestamp and
+# code location come from the record, but their event ids, and the user
+# and scope context (see eventlog.context), are assigned when the ring is
+# sent. Events logged with logEvent keep the scope they were logged in.
+import collections
+import logging
+import threading
+
+from .event import encoded, newLogRecord
+from .handler import EventHandler, _forward
+from .loglevel import ERROR
+
+# default max number of rings, when rings are keyed by request
+DEFAULT_MAX_RINGS = 1000
+
+
+# _Ring is a fixed-size buffer of the most recent items
+class _Ring(object):
+    __slots__ = ('items', 'count')
+
+    def __init__(self, size):
+        self.items = [None] * size
+        self.count = 0
+
+    # add an item. Returns True if the oldest item was overwritten
+    def add(self, item):
+        size = len(self.items)
+        self.items[self.count % size] = item
+        self.count += 1
+        return self.count > size
+
+    # drain returns items, oldest first, and empties the ring
+    def drain(self):
+        size = len(self.items)
+        if self.count <= size:
+            items = self.items[:self.count]
+        else:
+            start = self.count % size
+            items = self.items[start:] + self.items[:start]
+        self.items = [None] * size
+        self.count = 0
+        return items
+
+    def __len__(self):
+        return min(self.count, len(self.items))
+
+
+class FlightRecorderHandler(EventHandler):
+
+    # @param target EventHandler that receives events when triggered
+    # @param size max number of events kept per ring
+    # @param triggerLevel events with log.level (or log records with levelno)
+    #       at or above this level send the ring contents and themselves
+    # @param key optional function returning the key of the current ring,
+    #       for example a request id. If None, there is one ring per thread.
+    # @param maxRings max number of keyed rings; when exceeded, the least
+    #       recently created ring is discarded. Not used for per-thread rings
+    # @param filters optional list of logging filters (see EventHandler)
+    # @param name optional name, used as the 'instance' label of stats
+    def __init__(self, target, size=100, triggerLevel=ERROR, key=None,
+                 maxRings=DEFAULT_MAX_RINGS, filters=None, name=None):
+        super(FlightRecorderHandler, self).__init__(transport=None, filters=filters,
+                                                    name=name)
+        self.target = target
+        self.size = size
+        self.triggerLevel = triggerLevel
+        self.key = key
+        self.maxRings = maxRings
+        self._local = threading.local()
+        self._rings = collections.OrderedDict()
+        self._ringLock = threading.Lock()
+
+    # _ring returns the ring for the current thread or key
+    def _ring(self, create=True):
+        if self.key is None:
+            ring = getattr(self._local, 'ring', None)
+            if ring is None and create:
+                ring = self._local.ring = _Ring(self.size)
+            return ring
+        k = self.key()
+        with self._ringLock:
+            ring = self._rings.get(k)
+            if ring is None and create:
+                if len(self._rings) >= self.maxRings:
+                    (_, old) = self._rings.popitem(last=False)
+                    self.stats.discard(len(old))
+                    self.stats.unbuffer(len(old))
+                ring = self._rings[k] = _Ring(self.size)
+            return ring
+
+    def _record(self, item):
+        if self._ring().add(item):
+            self.stats.discard()
+        else:
+            self.stats.buffer()
+
+    # dump sends the contents of the current ring to the target
+    def dump(self):
+        ring = self._ring(create=False)
+        if ring is None:
+            return
+        items = ring.drain()
+        self.stats.unbuffer(len(items))
+        for item in items:
+            if isinstance(item, logging.LogRecord):
+                item = encoded(newLogRecord(item, recordLocation=True))
+            _forward(self.target, item)
+        self.stats.send(len(items))
+
+    # clear discards the contents of the current ring, for example,
+    # at the end of a request that completed normally
+    def clear(self):
+        if self.key is None:
+            ring = getattr(self._local, 'ring', None)
+            if ring is not None:
+                self._local.ring = None
+        else:
+            k = self.key()
+            with self._ringLock:
+                ring = self._rings.pop(k, None)
+        if ring is not None:
+            self.stats.discard(len(ring))
+            self.stats.unbuffer(len(ring))
+
+    def logEvent(self, event):
+        self.stats.event()
+        # wrap now, to keep the event's scope (see eventlog.context)
+        enc = encoded(event)
+        if enc.event.log.level >= self.triggerLevel:
+            self.dump()
+            _forward(self.target, enc)
+            self.stats.send()
+        else:
+            self._record(enc)
+        if self.replica:
+            _forward(self.replica, enc)
+
+    # emit records a log record without converting it to an Event,
+    # unless it triggers sending
+    def emit(self, record):
+        if record.levelno >= self.triggerLevel:
+            self.logEvent(newLogRecord(record))
+            return
+        self.stats.event()
+        self._record(record)
@@ -0,0 +1,148 @@
+# routing.py
+#
+# RouterHandler sends each event to the first Route whose Rule matches it,
+# for example, audit events to a durable transport, errors to a
+# low-latency transport, and everything else to a local file:
+#
+#    audit = Route(auditTransport, category="audit")
+#    alerts = Route(alertTransport, category="alert")
+#    router = RouterHandler([
+#        Rule(audit, name="audit."),
+#        Rule(alerts, minLevel=ERROR),
+#    ], default=Route(fileTransport))
+#
+# Rules are matched in order. A rule matches if all its conditions match:
+# name prefix, target prefix, level range (log.level), and required labels.
+# Rules are compiled into tables of bit sets (one bit per rule): per level,
+# and per distinct name and target prefix, so routing an event costs a few
+# dict lookups and integer ANDs, independent of the number of rules.
+from .event import encoded
+from .handler import EventHandler, _forward
+from .wire import messageSerializer
+
+# levels above this share the table entry for MAX_LEVEL
+MAX_LEVEL = 255
+
+
+# Route is a destination for events
+class Route(object):
+
+    # @param target transport or EventHandler
+    # @param category EventHeader category. If set, events for a transport
+    #       target are sent with an EventHeader, as FRAME_MESSAGE frames
+    #       (see wire.messageSerializer)
+    # @param name optional name, for diagnostics
+    def __init__(self, target, category='', name=None):
+        self.category = category
+        self.name = name or category
+        if hasattr(target, 'logEvent'):
+            self.handler = target
+        elif category:
+            self.handler = EventHandler(target, serializer=messageSerializer(category))
+        else:
+            self.handler = EventHandler(target)
+
+    def __repr__(self):
+        return "Route(%s)" % self.name
+
+
+# Rule selects a Route for matching events
+class Rule(object):
+
+    # @param route Route for events that match
+    # @param name event name prefix
+    # @param target event target prefix
+    # @param minLevel minimum log.level (inclusive)
+    # @param maxLevel maximum log.level (inclusive)
+    # @param labels labels that the event must all have
+    def __init__(self, route, name=None, target=None, minLevel=None, maxLevel=None,
+                 labels=None):
+        self.route = route
+        self.name = name
+        self.target = target
+        self.minLevel = minLevel if minLevel is not None else 0
+        self.maxLevel = maxLevel if maxLevel is not None else MAX_LEVEL
+        self.labels = frozenset(labels or ())
+
+
+# _PrefixTable maps a string to the bit set of rules whose prefix it starts with
+class _PrefixTable(object):
+
+    def __init__(self, prefixes):
+        # bits of rules without a prefix, which match everything
+        self._any = 0
+        # prefix length -> {prefix: bits}
+        self._byLength = {}
+        for (i, prefix) in prefixes:
+            if prefix is None:
+                self._any |= (1 << i)
+            else:
+                table = self._byLength.setdefault(len(prefix), {})
+                table[prefix] = table.get(prefix, 0) | (1 << i)
+        self._lengths = sorted(self._byLength.items())
+
+    def bits(self, s):
+        bits = self._any
+        n = len(s)
+        for (length, table) in self._lengths:
+            if length > n:
+                break
+            b = table.get(s[:length])
+            if b:
+                bits |= b
+        return bits
+
+
+class RouterHandler(EventHandler):
+
+    # @param rules list of Rule, in order of precedence
+    # @param default Route for events that match no rule; if None, they are discarded
+    # @param filters optional list of logging filters (see EventHandler)
+    # @param name optional name, used as the 'instance' label of stats
+    def __init__(self, rules, default=None, filters=None, name=None):
+        super(RouterHandler, self).__init__(transport=None, filters=filters, name=name)
+        self.rules = list(rules)
+        self.default = default
+        # all distinct routes, for loop detection
+        self.routes = []
+        for r in [rule.route for rule in self.rules] + [default]:
+            if r is not None and r not in self.routes:
+                self.routes.append(r)
+        self._compile()
+
+    def _compile(self):
+        rules = self.rules
+        self._names = _PrefixTable([(i, r.name) for (i, r) in enumerate(rules)])
+        self._targets = _PrefixTable([(i, r.target) for (i, r) in enumerate(rules)])
+        self._levels = [0] * (MAX_LEVEL + 1)
+        for (i, r) in enumerate(rules):
+            for level in range(max(r.minLevel, 0), min(r.maxLevel, MAX_LEVEL) + 1):
+                self._levels[level] |= (1 << i)
+        self._labelRules = 0
+        for (i, r) in enumerate(rules):
+            if r.labels:
+                self._labelRules |= (1 << i)
+
+    # route returns the Route for an Event, or the default route
+    def route(self, e):
+        level = e.log.level
+        bits = self._levels[level if level <= MAX_LEVEL else MAX_LEVEL]
+        bits &= self._names.bits(e.name) & self._targets.bits(e.target)
+        while bits:
+            low = bits & -bits
+            i = low.bit_length() - 1
+            if not (low & self._labelRules) or self.rules[i].labels.issubset(e.labels):
+                return self.rules[i].route
+            bits ^= low
+        return self.default
+
+    def logEvent(self, event):
+        self.stats.event()
+        enc = encoded(event)
+        route = self.route(enc.event)
+        if route is None:
+            self.stats.discard()
+        else:
+            _forward(route.handler, enc)
+        if self.replica:
+            _forward(self.replica, enc)
@@ -1,54 +1,271 @@
-# stat counters for logging handlers
+# stat counters for logging handlers and transports
+#
+# If prometheus_client is installed, stats are registered in its default
+# registry. Each StatsCollector has an 'instance' label, so several
+# handlers or transports can coexist without name collisions. Instance
+# names should be stable (for example, the name of a transport); collectors
+# with the same instance name share their values. Unnamed collectors each
+# get their own instance, the prefix and a sequence number. A value is
+# removed from the registry when the last collector using it is closed.
+# Without prometheus_client, a minimal built-in implementation is used.
+#
+# startMetricsServer() serves all stats in prometheus text format
+# on a local http port at /metrics, with or without prometheus_client.
+#
+# prometheus_client is imported when the first collector is created.
+import threading
+import weakref
 
-try:
-    from prometheus_client import Counter, Gauge
-except ImportError:
-    # to avoid a forced dependency on prometheus_client,
-    # use a super-minimalist implementation of counter.
-    # since these are used within same thread, no mutexes are needed.
-    class Value:
-        def __init__(self, name, desc=''):
-            self._name = name
-            self._desc = desc
-            self._value = 0
+from .histogram import Histogram
 
-        def inc(self, n=1):
-            self._value += n
+# prometheus_client module, False if not installed, or None if not yet imported
+_prometheus = None
 
-        def dec(self, n=1):
-            self._value -= n
 
-        def val(self):
-            return (self._name, self._value)
+# prometheus returns the prometheus_client module, or False if it is not installed
+def prometheus():
+    global _prometheus
+    if _prometheus is None:
+        try:
+            import prometheus_client
+            _prometheus = prometheus_client
+        except ImportError:
+            _prometheus = False
+    return _prometheus
 
-        def reset(self):
-            self._value = 0
 
-    class Counter(Value):
-        pass
+# _ThreadRef is kept in a thread's local storage, so a weak reference to
+# it is cleared when the thread exits
+class _ThreadRef(object):
+    pass
 
-    class Gauge(Value):
-        def set(self, n):
-            self._value = n
+
+# Counter is a per-thread-sharded counter, used when prometheus_client
+# is not installed. Each thread increments its own cell without locking;
+# a lock is taken only the first time a thread touches the counter, and
+# when the thread exits, to add its cell to the base value.
+# Reads may be slightly stale while other threads are incrementing.
+# reset and set adjust the base value, rather than clearing cells, so
+# concurrent increments count as made just before or just after them.
+class Counter(object):
+    def __init__(self, name, desc=''):
+        self._name = name
+        self._desc = desc
+        self._local = threading.local()
+        # cells of live threads, by weak reference to the thread's _ThreadRef
+        self._cells = {}
+        self._base = 0
+        self._lock = threading.Lock()
+
+    def _cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0]
+            owner = self._local.owner = _ThreadRef()
+            with self._lock:
+                self._cells[weakref.ref(owner, self._threadExit)] = cell
+            return cell
+
+    # _threadExit adds the cell of an exited thread to the base value
+    def _threadExit(self, ref):
+        with self._lock:
+            cell = self._cells.pop(ref, None)
+            if cell is not None:
+                self._base += cell[0]
+
+    def inc(self, n=1):
+        self._cell()[0] += n
+
+    def dec(self, n=1):
+        self._cell()[0] -= n
+
+    def _sum(self):
+        return self._base + sum(c[0] for c in list(self._cells.values()))
+
+    def get(self):
+        with self._lock:
+            return self._sum()
+
+    def val(self):
+        return (self._name, self.get())
+
+    def reset(self):
+        self._set(0)
+
+    def _set(self, n):
+        with self._lock:
+            self._base += n - self._sum()
+
+
+# Gauge is a counter that may also be set to an absolute value
+class Gauge(Counter):
+    def set(self, n):
+        self._set(n)
+
+
+# HistogramValue records observations in a log-linear Histogram,
+# used when prometheus_client is not installed.
+# It is exposed as a prometheus summary with p50/p90/p99 quantiles
+class HistogramValue(object):
+    def __init__(self, name, desc=''):
+        self._name = name
+        self._desc = desc
+        self.histogram = Histogram()
+        self.observe = self.histogram.record
+
+    def get(self):
+        return self.histogram.count
+
+    def val(self):
+        return (self._name + "_count", self.get())
+
+
+# _PromValue wraps a labelled child of a prometheus metric
+class _PromValue(object):
+    def __init__(self, family, name, instance):
+        self._family = family
+        self._name = name
+        self._instance = instance
+        # value when it was removed from the registry
+        self._final = None
+        child = self._child = family.labels(instance)
+        if hasattr(child, 'observe'):
+            self.observe = child.observe
+        else:
+            self.inc = child.inc
+        if hasattr(child, 'dec'):
+            self.dec = child.dec
+            self.set = child.set
+
+    # get returns the value of the counter or gauge, or the number of
+    # observations of a histogram, from the samples of the metric family
+    def get(self):
+        if self._final is not None:
+            return self._final
+        for metric in self._family.collect():
+            names = (metric.name + '_count',) if metric.type == 'histogram' \
+                else (metric.name, metric.name + '_total')
+            for s in metric.samples:
+                if s[0] in names and s[1].get('instance') == self._instance:
+                    return s[2]
+        return 0
+
+    def val(self):
+        return (self._name, self.get())
+
+    # remove removes this value from the prometheus registry. get then
+    # returns the value at removal
+    def remove(self):
+        self._final = self.get()
+        try:
+            self._family.remove(self._instance)
+        except KeyError:
+            pass
+
+
+# prometheus metric families, by name, shared by all collectors
+_families = {}
+
+# values by (name, instance): [value, number of collectors using it]
+_values = {}
+_valuesLock = threading.Lock()
+
+# number of unnamed collectors created, by prefix
+_unnamed = {}
+
+
+# _family returns the metric family for name. Must be called with _valuesLock held
+def _family(kind, name, desc):
+    family = _families.get(name)
+    if family is None:
+        family = kind(name, desc, ['instance'])
+        _families[name] = family
+    return family
 
 
 class StatsCollector(object):
-    def __init__(self, prefix):
+    # @param prefix prefix for stat names
+    # @param instance label value that distinguishes this collector
+    #       from others with the same prefix, such as the name of a
+    #       transport. Defaults to the prefix and a sequence number,
+    #       unique to this collector
+    def __init__(self, prefix, instance=None):
         self._all = []
+        self._histograms = []
+        self._keys = []
         self.prefix = prefix
+        if not instance:
+            with _valuesLock:
+                n = _unnamed[prefix] = _unnamed.get(prefix, 0) + 1
+            instance = "%s-%d" % (prefix.rstrip('_'), n)
+        self.instance = instance
+
+    # _value returns the value for name and this collector's instance,
+    # creating it with newValue if it does not exist
+    def _value(self, name, newValue):
+        key = (name, self.instance)
+        with _valuesLock:
+            entry = _values.get(key)
+            if entry is None:
+                entry = _values[key] = [newValue(), 0]
+            entry[1] += 1
+        self._keys.append(key)
+        return entry[0]
+
+    def counter(self, name, desc):
+        prom = prometheus()
+        if prom:
+            return self._value(name, lambda: _PromValue(
+                _family(prom.Counter, name, desc), name, self.instance))
+        return self._value(name, lambda: Counter(name, desc))
+
+    # histogram returns an object with an observe(value) method
+    # @param buckets upper bounds of buckets (prometheus_client only;
+    #       the built-in histogram uses log-linear buckets)
+    def histogram(self, name, desc, buckets=None):
+        prom = prometheus()
+        if prom:
+            kind = prom.Histogram
+            if buckets is not None:
+                kind = lambda n, d, labels: prom.Histogram(
+                    n, d, labels, buckets=buckets)
+            return self._value(name, lambda: _PromValue(
+                _family(kind, name, desc), name, self.instance))
+        return self._value(name, lambda: HistogramValue(name, desc))
+
+    def gauge(self, name, desc):
+        prom = prometheus()
+        if prom:
+            return self._value(name, lambda: _PromValue(
+                _family(prom.Gauge, name, desc), name, self.instance))
+        return self._value(name, lambda: Gauge(name, desc))
 
     def get_stats(self):
         return [v.val() for v in self._all]
 
+    # close releases this collector's values. Values that are not used
+    # by another collector are removed from the registry
+    def close(self):
+        with _valuesLock:
+            (keys, self._keys) = (self._keys, [])
+            for key in keys:
+                entry = _values[key]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del _values[key]
+                    if isinstance(entry[0], _PromValue):
+                        entry[0].remove()
+
 
 class LogStats(StatsCollector):
 
-    def __init__(self, prefix):
-        super(LogStats, self).__init__(prefix)
-        self._events = Counter(prefix + "events_total", "events received")
-        self._discarded = Counter(prefix + "discarded_total", "events discarded")
-        self._buffered = Gauge(prefix + "buffered_events", "events currently buffered")
-        self._sent = Counter(prefix + "sent_total", "events sent to upstream collector")
+    def __init__(self, prefix, instance=None):
+        super(LogStats, self).__init__(prefix, instance)
+        self._events = self.counter(prefix + "events_total", "events received")
+        self._discarded = self.counter(prefix + "discarded_total", "events discarded")
+        self._buffered = self.gauge(prefix + "buffered_events", "events currently buffered")
+        self._sent = self.counter(prefix + "sent_total", "events sent to upstream collector")
         self._all.extend([self._events, self._discarded, self._buffered, self._sent])
 
     def event(self, n=1):
@@ -64,7 +281,7 @@ class LogStats(StatsCollector):
         self._buffered.inc(n)
 
     def unbuffer(self, n=1):
-        self._buffered.dec(min(self._buffered.val()[1], n))
+        self._buffered.dec(min(self._buffered.get(), n))
 
 
 # lookup - finds stat with s in the name. s should be lower case. Used for testing
@@ -72,3 +289,63 @@ def lookup(stats, s):
     for (k, v) in stats:
         if k.lower().find(s) != -1:
             return v
+
+
+# generateMetrics returns all stats in prometheus text exposition format
+def generateMetrics():
+    prom = prometheus()
+    if prom:
+        return prom.generate_latest()
+    byName = {}
+    with _valuesLock:
+        for ((name, instance), (v, refs)) in sorted(_values.items()):
+            byName.setdefault(name, (v, []))[1].append((instance, v))
+    lines = []
+    for name in sorted(byName):
+        (v, values) = byName[name]
+        if isinstance(v, HistogramValue):
+            kind = 'summary'
+        elif isinstance(v, Gauge):
+            kind = 'gauge'
+        else:
+            kind = 'counter'
+        lines.append("# HELP %s %s" % (name, v._desc))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for (instance, v) in values:
+            if kind == 'summary':
+                h = v.histogram
+                for q in (0.5, 0.9, 0.99):
+                    lines.append('%s{instance="%s",quantile="%s"} %s' % (
+                        name, instance, q, float(h.percentile(q) or 0)))
+                lines.append('%s_sum{instance="%s"} %s' % (name, instance, float(h.sum)))
+                lines.append('%s_count{instance="%s"} %s' % (name, instance, float(h.count)))
+            else:
+                lines.append('%s{instance="%s"} %s' % (name, instance, float(v.get())))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+# startMetricsServer starts a daemon thread serving stats at http://addr:port/metrics
+# Returns the server; call shutdown() on it to stop.
+def startMetricsServer(port, addr='127.0.0.1'):
+    from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = generateMetrics()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((addr, port), MetricsHandler)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
@@ -0,0 +1,186 @@
+# testing.py
+#
+# Test support for transports: an in-process event sink server that can
+# inject collector failures, and a fake clock for NetTransport, so that
+# failover scenarios run in milliseconds:
+#
+#    sink = FaultSink()
+#    clock = FakeClock()
+#    tx = NetTransport(sink.socketFactory(), clock=clock.time, sleep=clock.sleep)
+#    sink.refuse()           # new connections are refused
+#    sink.dropConnections()  # open connections are reset
+#    sink.listen()           # accept connections again
+#
+# Faults are set with attributes of FaultSink, and apply from the next read:
+#   latency      seconds to wait before each read
+#   bandwidth    max bytes per second read by each connection; 0 is unlimited
+#   readSize     max bytes per read (small values cause partial reads)
+#   resetAfter   reset each connection after reading this many bytes; 0 never
+import socket
+import struct
+import threading
+import time
+
+from .transport import TCPSocketFactory
+
+
+class FaultSink(object):
+
+    # @param host address to listen on
+    # @param port port to listen on; 0 picks a free port
+    # @param keep if True, received data is kept in .data
+    def __init__(self, host='127.0.0.1', port=0, keep=False):
+        self.host = host
+        self.port = port
+        self.keep = keep
+        self.latency = 0.0
+        self.bandwidth = 0
+        self.readSize = 64 * 1024
+        self.resetAfter = 0
+        # counters
+        self.connections = 0
+        self.received = 0
+        self.resets = 0
+        self.data = bytearray()
+        self._lock = threading.Lock()
+        self._listener = None
+        self._conns = set()
+        self.listen()
+
+    # listen accepts connections (again, after refuse), on the same port
+    def listen(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((self.host, self.port))
+            s.listen(128)
+            self.port = s.getsockname()[1]
+            self._listener = s
+        t = threading.Thread(target=self._accept, args=(s,))
+        t.daemon = True
+        t.start()
+
+    # refuse stops listening, so new connections are refused.
+    # Open connections are not affected
+    def refuse(self):
+        with self._lock:
+            s = self._listener
+            self._listener = None
+        if s is not None:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            s.close()
+
+    # dropConnections resets all open connections
+    def dropConnections(self):
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            self._reset(conn)
+
+    def close(self):
+        self.refuse()
+        self.dropConnections()
+
+    # socketFactory returns a TCPSocketFactory for this sink
+    def socketFactory(self):
+        return TCPSocketFactory(self.host, self.port)
+
+    # waitFor waits until at least n bytes have been received.
+    # Returns True if they were received within timeout seconds
+    def waitFor(self, n, timeout=5.0):
+        deadline = time.time() + timeout
+        while self.received < n:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def _accept(self, listener):
+        while True:
+            try:
+                (conn, addr) = listener.accept()
+            except (socket.error, OSError):
+                # listener closed
+                return
+            with self._lock:
+                self.connections += 1
+                self._conns.add(conn)
+            t = threading.Thread(target=self._serve, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def _serve(self, conn):
+        count = 0
+        try:
+            while True:
+                if self.latency:
+                    time.sleep(self.latency)
+                data = conn.recv(self.readSize)
+                if not data:
+                    break
+                count += len(data)
+                with self._lock:
+                    self.received += len(data)
+                    if self.keep:
+                        self.data += data
+                if self.bandwidth:
+                    time.sleep(float(len(data)) / self.bandwidth)
+                if self.resetAfter and count >= self.resetAfter:
+                    self._reset(conn)
+                    break
+        except (socket.error, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._conns.discard(conn)
+            conn.close()
+
+    # _reset closes a connection with RST, as a failed collector would
+    def _reset(self, conn):
+        with self._lock:
+            if conn not in self._conns:
+                return
+            self._conns.discard(conn)
+            self.resets += 1
+        try:
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            conn.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+        conn.close()
+
+
+# FakeClock is a clock whose time advances only when sleep is called.
+# sleep yields the CPU briefly, so threads waiting in a loop
+# (such as the NetTransport health checker) don't spin
+class FakeClock(object):
+
+    # @param start initial time
+    # @param yieldSec real seconds slept by each call to sleep
+    def __init__(self, start=0.0, yieldSec=0.001):
+        self.now = start
+        self.yieldSec = yieldSec
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += seconds
+        time.sleep(self.yieldSec)
+
+    # waitUntil waits (in real time) until the clock reaches t.
+    # Returns True if it did within timeout real seconds
+    def waitUntil(self, t, timeout=5.0):
+        deadline = time.time() + timeout
+        while self.now < t:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
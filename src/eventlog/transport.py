@@ -3,34 +3,35 @@
 # This software may be modified and distributed under the terms
 # of the MIT license.  See the LICENSE file for details.
 import logging
+import os
 import six
 import socket
-import ssl
 import sys
 import threading
 import time
 from collections import deque
 
-from .config import getConfigSetting
-from .stats import Counter, StatsCollector
+from .config import getConfig
+from .stats import StatsCollector
 from .handler import ConsoleEventHandler
+from .wire import FrameArena
 
 # package constants
-SOCKET_TIMEOUT = int(getConfigSetting(
-                    "EVENTLOG_SOCKET_TIMEOUT", 5))
+# These are the settings at import time; transports read the current
+# settings (see config.getConfig) when they are created or used.
+_config = getConfig()
+SOCKET_TIMEOUT = _config.socket_timeout
 
 # MAX_SEND_ATTEMPTS is the number of times a message send will be attempted
 # before throwing an exception to the caller.
 # In development environments, this should be set to 1
-MAX_SEND_ATTEMPTS = int(getConfigSetting(
-                    "EVENTLOG_MAX_SEND_ATTEMPTS", 3))
+MAX_SEND_ATTEMPTS = _config.max_send_attempts
 
 # PEAK_CONNECTIONS is size of pool (open connections not in use).
 # because connections are used for a very short time window (in testing,
 # less than 1ms), the number of connections can be fewer than number of
 # worker threads
-PEAK_CONNECTIONS = int(getConfigSetting(
-                    "EVENTLOG_PEAK_CONNECTIONS", 5))
+PEAK_CONNECTIONS = _config.peak_connections
 
 # MAX_MESSAGE_LEN is length of longest message, above which tx will fail
 #
@@ -38,19 +39,33 @@ PEAK_CONNECTIONS = int(getConfigSetting(
 # of an rsyslog message according to its spec. This number is shorter,
 # to catch potential bugs. If the application requires longer messages,
 # this could be safely increased to 128 * 1024
-MAX_MESSAGE_LEN = int(getConfigSetting(
-                    "EVENTLOG_MAX_MESSAGE_LEN", 32 * 1024))
+MAX_MESSAGE_LEN = _config.max_message_len
 
 # HEALTH_INTERVAL_SEC is how long we want between checks for log receiver
 # This number should be an integer factor of 60: (2,3,4,5,6,10,12,15,20,30)
-HEALTHCHECK_INTERVAL_SEC = int(getConfigSetting(
-                    "EVENTLOG_HEALTHCHECK_INTERVAL_SEC", 3))
+HEALTHCHECK_INTERVAL_SEC = _config.healthcheck_interval_sec
 # this number should be a multiple of HEALTHCHECK_INTERVAL_SEC
-HEALTHCHECK_PRINT_INTERVAL_SEC = int(getConfigSetting(
-                    "EVENTLOG_HEALTHCHECK_PRINT_INTERVAL_SEC", 60))
+HEALTHCHECK_PRINT_INTERVAL_SEC = _config.healthcheck_print_interval_sec
 
 TRANSPORT_STATS_PREFIX = "eventlog_tx_"
 
+# seconds to wait before retrying a failed send
+RETRY_WAIT_SEC = 0.05
+
+# max number of buffers per sendmsg call
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+# histogram buckets (prometheus_client) for send phase latencies, in seconds
+LATENCY_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05,
+                   .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+# histogram buckets (prometheus_client) for messages per send
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
 
 def errlog(s):
     if six.PY3 and isinstance(s, bytes):
@@ -62,22 +77,36 @@ def errlog(s):
 
 # TransportStats holds counters for network messaging
 class TransportStats(StatsCollector):
-    def __init__(self, prefix):
-        super(TransportStats, self).__init__(prefix)
-        self._bytes_sent = Counter(prefix + "sent_bytes_total",
-                                   "bytes transmitted")
-        self._events_sent = Counter(prefix + "sent_msgs_total",
-                                    "events transmitted")
-        self._socket_errors = Counter(prefix + "socket_errors_total",
-                                      "socket disconnects")
-        self._time_elapsed = Counter(prefix + "time_elapsed_sec",
-                                     "time spent sending, in seconds")
-        self._socket_count = Counter(TRANSPORT_STATS_PREFIX + "sockets_created_total",
+    def __init__(self, prefix, instance=None):
+        super(TransportStats, self).__init__(prefix, instance)
+        self._bytes_sent = self.counter(prefix + "sent_bytes_total",
+                                        "bytes transmitted")
+        self._events_sent = self.counter(prefix + "sent_msgs_total",
+                                         "events transmitted")
+        self._socket_errors = self.counter(prefix + "socket_errors_total",
+                                           "socket disconnects")
+        self._time_elapsed = self.counter(prefix + "time_elapsed_sec",
+                                          "time spent sending, in seconds")
+        self._socket_count = self.counter(TRANSPORT_STATS_PREFIX + "sockets_created_total",
                             "total number of transport sockets created")
         self._all.extend([self._bytes_sent, self._events_sent,
                          self._socket_errors, self._time_elapsed,
                          self._socket_count])
 
+        # latency histograms for each phase of send
+        latency = lambda phase: self.histogram(
+            prefix + phase + "_seconds", "time spent in " + phase.replace('_', ' '),
+            LATENCY_BUCKETS)
+        self._pool_take = latency("pool_take")
+        self._connect = latency("connect")
+        self._tls_handshake = latency("tls_handshake")
+        self._sendall = latency("sendall")
+        self._retry_wait = latency("retry_wait")
+        self._batch_msgs = self.histogram(prefix + "batch_msgs",
+                                          "messages per send", BATCH_BUCKETS)
+        self._histograms.extend([self._pool_take, self._connect, self._tls_handshake,
+                                self._sendall, self._retry_wait, self._batch_msgs])
+
     def socket_error(self):
         self._socket_errors.inc(1)
 
@@ -90,6 +119,27 @@ class TransportStats(StatsCollector):
     def time_elapsed(self, t):
         self._time_elapsed.inc(t)
 
+    def pool_take(self, t):
+        self._pool_take.observe(t)
+
+    def connect(self, t):
+        self._connect.observe(t)
+
+    def tls_handshake(self, t):
+        self._tls_handshake.observe(t)
+
+    def sendall(self, t):
+        self._sendall.observe(t)
+
+    def retry_wait(self, t):
+        self._retry_wait.observe(t)
+
+    def batch_msgs(self, n):
+        self._batch_msgs.observe(n)
+
+    def socket_created(self):
+        self._socket_count.inc(1)
+
     def getSocketCounter(self):
         return self._socket_count
 
@@ -100,7 +150,9 @@ class TransportStats(StatsCollector):
 # removed first. Note that the pool only holds connections that are not
 # in use.
 class ConnectionPool:
-    def __init__(self, factory, max_size=PEAK_CONNECTIONS):
+    def __init__(self, factory, max_size=None):
+        if max_size is None:
+            max_size = getConfig().peak_connections
         self._pool = deque([], maxlen=max_size)
         self._factory = factory
 
@@ -145,16 +197,51 @@ class Connection(object):
     def __init__(self, sock):
         self._sock = sock
         self._ok = True
+        # per-connection framer state
+        self.state = {}
 
     def sendall(self, data):
-        if six.PY3 and isinstance(data, str):
-            data = bytes(data, 'UTF8')
         self._ok = False
         # if this throws exception, _ok==False will keep it from pool
         self._sock.sendall(data)
         # no errors yet
         self._ok = True
 
+    # sendArena writes all parts of a FrameArena, with as few system calls
+    # as possible (sendmsg, where supported).
+    # Returns the number of bytes sent. If an exception is raised, the
+    # number of bytes sent before the error is in arena.sent
+    def sendArena(self, arena):
+        self._ok = False
+        sock = self._sock
+        parts = arena.parts
+        arena.sent = 0
+        sendmsg = getattr(sock, 'sendmsg', None)
+        # ssl is imported only when a TLS connection is made
+        ssl = sys.modules.get('ssl')
+        if sendmsg is None or (ssl is not None and isinstance(sock, ssl.SSLSocket)):
+            for p in parts:
+                sock.sendall(p)
+                arena.sent += len(p)
+        else:
+            i = 0
+            while i < len(parts):
+                n = sendmsg(parts[i:i + IOV_MAX])
+                arena.sent += n
+                # skip the buffers that were written, and empty buffers
+                # (sendmsg returns 0 for them); on a partial write,
+                # continue with the rest of the last one
+                while i < len(parts):
+                    size = len(parts[i])
+                    if n < size:
+                        if n:
+                            parts[i] = memoryview(parts[i])[n:]
+                        break
+                    n -= size
+                    i += 1
+        self._ok = True
+        return arena.sent
+
     def isGood(self):
         return self._sock is not None and self._ok
 
@@ -176,14 +263,18 @@ class Connection(object):
 
 
 class BaseTransport(object):
-    def __init__(self):
-        self.stats = TransportStats(TRANSPORT_STATS_PREFIX)
+    # @param name optional name, used as the 'instance' label of stats
+    def __init__(self, name=None):
+        self.stats = TransportStats(TRANSPORT_STATS_PREFIX, name)
         self.log = logging.getLogger("eventlog_transport")
-        handler = ConsoleEventHandler()
+        handler = self._logHandler = ConsoleEventHandler()
         handler.setLevel(logging.DEBUG)
         self.log.addHandler(handler)
         self.status = True   # assume OK at start
         self.statusLock = threading.RLock()
+        # framer, if set, encodes Event objects for each connection
+        # (see eventlog.wire). If None, send() expects serialized buffers
+        self.framer = None
 
     def send(self, messages):
         raise Exception("not implemented")
@@ -200,80 +291,155 @@ class BaseTransport(object):
     def get_stats(self):
         return self.stats.get_stats()
 
+    # close releases the transport's stats and log handler
+    def close(self):
+        self.log.removeHandler(self._logHandler)
+        self._logHandler.close()
+        self.stats.close()
+
 
 class NetTransport(BaseTransport):
 
     # Construct Tranport with a socket factory and pool size.
     # if poolSize=0, connections aren't pooled and will be recreated each time
+    # If framer is set (see eventlog.wire), send() takes Event objects
+    # and the framer encodes them with per-connection state.
+    # pool_cap and max_attempts default to the current settings
+    # clock and sleep replace time.time and time.sleep for timing, retry
+    # waits, and health checks, so tests can run failover scenarios
+    # without waiting (see eventlog.testing.FakeClock)
     def __init__(self, socketFactory,
-                 pool_cap=PEAK_CONNECTIONS,
-                 max_attempts=MAX_SEND_ATTEMPTS):
-        super(NetTransport, self).__init__()
+                 pool_cap=None,
+                 max_attempts=None,
+                 name=None,
+                 framer=None,
+                 clock=None,
+                 sleep=None):
+        super(NetTransport, self).__init__(name)
+        if max_attempts is None:
+            max_attempts = getConfig().max_send_attempts
+        self.framer = framer
+        self._clock = clock or time.time
+        self._sleep = sleep or time.sleep
         self._socketFactory = socketFactory
         self._pool = ConnectionPool(self._socketFactory, pool_cap)
         self._max_attempts = max_attempts
-
-        # pass socket counter hook to Connection class
-        self._socketFactory.setCounter(self.stats.getSocketCounter())
+        # per-thread FrameArena for send
+        self._local = threading.local()
+        self.setHooks()
+
+        # pass stats and clock to socket factory for connect and handshake
+        # timing. Factories without setStats only count sockets created
+        setStats = getattr(self._socketFactory, 'setStats', None)
+        if setStats is not None:
+            setStats(self.stats)
+        else:
+            self._socketFactory.setCounter(self.stats.getSocketCounter())
+        setClock = getattr(self._socketFactory, 'setClock', None)
+        if setClock is not None:
+            setClock(self._clock)
 
     # check confirms that network server is listening by creating
     # one throw-away connection. Uses current conection timeout.
     # If connection is not made, throws exception
     def checkConnection(self):
-        self._socketFactory.create_socket(SOCKET_TIMEOUT, False).close()
+        self._socketFactory.create_socket(None, False).close()
 
-    # Construct NetTransport using environment variables
+    # Construct NetTransport using settings from environment variables
+    # or django settings (see config.Config)
     @staticmethod
     def createFromEnv():
-        # todo: tls not fully implemented
-        host = getConfigSetting('EVENTLOG_HOST')
-        port = int(getConfigSetting('EVENTLOG_PORT', 0))
-        if host and port:
-            factory = TCPSocketFactory(host, port)
-            max_attempts = int(getConfigSetting('EVENTLOG_SEND_ATTEMPTS',
-                                                MAX_SEND_ATTEMPTS))
-            psize = int(getConfigSetting('EVENTLOG_CPOOL_SIZE',
-                                                PEAK_CONNECTIONS))
+        config = getConfig()
+        if config.host and config.port:
+            factory = TCPSocketFactory(config.host, config.port,
+                                       tls_enable=config.tls_enable,
+                                       tls_verify=config.tls_verify,
+                                       keyfile=config.tls_keyfile,
+                                       certfile=config.tls_certfile,
+                                       ca_certs=config.tls_ca_certs)
+            max_attempts = config.send_attempts or config.max_send_attempts
+            psize = config.cpool_size or config.peak_connections
             transport = NetTransport(factory, psize, max_attempts)
             return transport
         return None
 
+    # setHooks registers optional callbacks for profiling the send path.
+    # Any callback may be None. When no callbacks are set, send has no
+    # additional overhead.
+    # @param on_send_start fn(transport, messages) called before sending
+    # @param on_send_end fn(transport, messages, elapsed_sec) called after
+    #       all messages were sent
+    # @param on_retry fn(transport, attemptNum, exception) called after a
+    #       failed attempt, before waiting to retry
+    # @param on_drop fn(transport, messages, numSent, errInfo) called when
+    #       send gives up and unsent messages are dropped
+    def setHooks(self, on_send_start=None, on_send_end=None,
+                 on_retry=None, on_drop=None):
+        self._onSendStart = on_send_start
+        self._onSendEnd = on_send_end
+        self._onRetry = on_retry
+        self._onDrop = on_drop
+
     # send - sends a list of messages using transport
     def send(self, messages):
         total_bytes = 0
         total_msgs = 0
-        start_time = time.time()
+        clock = self._clock
+        start_time = clock()
         attemptNum = 0
         exInfo = ""
+        stats = self.stats
         # in case we were accidentally called with a single message (byte arr),
         # don't be fooled by len(messages) in following loop
         if not isinstance(messages, list):
             messages = [messages]
+        if self._onSendStart is not None:
+            self._onSendStart(self, messages)
+        stats.batch_msgs(len(messages))
+        arena = getattr(self._local, 'arena', None)
+        if arena is None:
+            arena = self._local.arena = FrameArena()
         while total_msgs < len(messages) and attemptNum < self._max_attempts:
             # try to send messages, with retries
             # if there is any io error, create a new connection
             # and give load balance a chance to try alternate server
             conn = None
             try:
+                t0 = clock()
                 conn = self._pool.take()
-                for m in messages:
-                    conn.sendall(m)
-                    total_bytes += len(m)
-                    total_msgs += 1
+                t1 = clock()
+                stats.pool_take(t1 - t0)
+                # on retry, resume with the first unsent message
+                self._fillArena(arena, messages[total_msgs:], conn.state)
+                try:
+                    conn.sendArena(arena)
+                finally:
+                    total_bytes += arena.sent
+                    total_msgs += arena.messagesIn(arena.sent)
+                stats.sendall(clock() - t1)
             except Exception as e:
                 if conn is not None:
                     conn.reject()  # mark bad so it's not reused
                 exInfo = str(e)
                 attemptNum += 1
-                self.stats.socket_error()
+                stats.socket_error()
+                if attemptNum < self._max_attempts:
+                    if self._onRetry is not None:
+                        self._onRetry(self, attemptNum, e)
+                    t0 = clock()
+                    self._sleep(RETRY_WAIT_SEC)
+                    stats.retry_wait(clock() - t0)
             finally:
                 self._pool.release(conn)
-            if attemptNum < self._max_attempts:
-                time.sleep(0.05)
-        self.stats.events_sent(total_msgs)
-        self.stats.bytes_sent(total_bytes)
-        self.stats.time_elapsed(time.time() - start_time)
+        # don't hold references to messages until the next send
+        arena.reset()
+        elapsed = clock() - start_time
+        stats.events_sent(total_msgs)
+        stats.bytes_sent(total_bytes)
+        stats.time_elapsed(elapsed)
         if total_msgs < len(messages):
+            if self._onDrop is not None:
+                self._onDrop(self, messages, total_msgs, exInfo)
             # immediately after log receiver goes down, there could be
             # multiple threads that each get to this point and
             # try to launch the checker thread. The waitTillUp() method
@@ -281,12 +447,37 @@ class NetTransport(BaseTransport):
             self.waitTillUp()
             self.closePoolConnections()
             raise Exception("Too many failures trying to send events: %s" % exInfo)
+        if self._onSendEnd is not None:
+            self._onSendEnd(self, messages, elapsed)
+
+    # _fillArena adds messages to arena, framed for a connection
+    # with framer state
+    def _fillArena(self, arena, messages, state):
+        arena.reset()
+        framer = self.framer
+        if framer is None:
+            for m in messages:
+                if isinstance(m, six.text_type):
+                    m = m.encode('utf-8')
+                arena.add(m)
+                arena.endMessages(1)
+        elif hasattr(framer, 'frameInto'):
+            framer.frameInto(messages, state, arena)
+        else:
+            for (buf, n) in framer.frame(messages, state):
+                arena.add(buf)
+                arena.endMessages(n)
 
     # close all connections
     # next send operation will open a new connection
     def closePoolConnections(self):
         self._pool.closeAll()
 
+    # close closes all connections, and releases stats
+    def close(self):
+        self.closePoolConnections()
+        super(NetTransport, self).close()
+
     # The purpose of the checker thread is to keep the server running smoothly
     # if log receiver is down.  If every log attempt tried to contact
     # a failing receiver, this server would slow to a crawl as all
@@ -310,6 +501,7 @@ class NetTransport(BaseTransport):
         # As soon as connection is made, updates status to True and exits.
         def checker(transport):
             tick = 0
+            config = getConfig()
             while True:
                 err = ""
                 try:
@@ -323,10 +515,11 @@ class NetTransport(BaseTransport):
                 try:
                     # keep waiting, but log each minute as reminder
                     tick += 1
-                    if tick % (HEALTHCHECK_PRINT_INTERVAL_SEC // HEALTHCHECK_INTERVAL_SEC) == 0:
+                    interval = config.healthcheck_interval_sec
+                    if tick % max(config.healthcheck_print_interval_sec // interval, 1) == 0:
                         errlog("Retry: attempt to connect to %s failed: %s" %
                             (self._socketFactory.info(), err))
-                    time.sleep(HEALTHCHECK_INTERVAL_SEC)
+                    transport._sleep(interval)
                 except Exception as e:
                     errlog("checker internal error: %s" % str(e))
 
@@ -349,25 +542,49 @@ class TCPSocketFactory():
         self._certfile = certfile
         self._ca_certs = ca_certs
         self._counter = None
+        self._stats = None
+        self._clock = time.time
 
     def info(self):
         return "TCPSocketFactory(%s:%d)" % (self._host, self._port)
 
+    # setCounter sets a counter of sockets created. Not used if setStats is called
     def setCounter(self, ctr):
         self._counter = ctr
 
-    def create_socket(self, timeout=SOCKET_TIMEOUT, stats=True):
+    # setStats sets the TransportStats that count sockets created
+    # and record connect and TLS handshake times
+    def setStats(self, stats):
+        self._stats = stats
+
+    # setClock replaces time.time for connect and TLS handshake timing
+    def setClock(self, clock):
+        self._clock = clock
+
+    # @param timeout socket timeout; defaults to the current setting
+    def create_socket(self, timeout=None, stats=True):
+        if timeout is None:
+            timeout = getConfig().socket_timeout
+        counter = self._counter if stats else None
+        stats = self._stats if stats else None
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(timeout)
+        clock = self._clock
+        t0 = clock()
         sock.connect((self._host, self._port))
+        if stats is not None:
+            stats.connect(clock() - t0)
+            stats.socket_created()
+        elif counter is not None:
+            counter.inc(1)
 
         # non-SSL
         if not self._tls_enable:
-            if stats and self._counter is not None:
-                self._counter.inc(1)
             return sock
 
         # TLS
+        import ssl
+        t0 = clock()
         cert_reqs = ssl.CERT_REQUIRED
         if not self._tls_verify:
             if self._ca_certs:
@@ -380,6 +597,8 @@ class TCPSocketFactory():
             certfile=self._certfile,
             ca_certs=self._ca_certs,
             cert_reqs=cert_reqs)
+        if stats is not None:
+            stats.tls_handshake(clock() - t0)
         return sock
 
     def __repr__(self):
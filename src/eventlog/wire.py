@@ -0,0 +1,488 @@
+# wire.py
+#
+# Framed wire formats for sending events over a stream connection.
+#
+# Every frame is:  type (1 byte) | payload length (varint) | payload
+#
+# Frame types:
+#   FRAME_EVENT          payload is a serialized protobuf Event
+#   FRAME_MESSAGE        an Event with its EventHeader:
+#                        header len (varint) | EventHeader | Event
+#                        (see messageSerializer)
+#   FRAME_STRING_DEF     defines an interned string for this connection:
+#                        id (varint) | utf-8 bytes
+#   FRAME_INTERNED_EVENT an Event whose name, target, and field keys are
+#                        sent as string references (see InterningFramer)
+#   FRAME_COLUMN_BLOCK   a batch of events in columnar layout
+#                        (see eventlog.columnar)
+#   FRAME_DELTA_BATCH    a batch of events with delta-encoded timestamps
+#                        and ids (see makeBatchMessage)
+#
+# String references are a varint id > 0 for a string previously defined on
+# the same connection, or 0 followed by an inline string: len (varint) | utf-8
+#
+# Framers are used by NetTransport to encode events for a connection.
+# Framer state (such as the interned string table) is kept per connection,
+# so a new connection always starts with an empty dictionary; decoders
+# likewise keep one FrameDecoder per connection.
+#
+# Framers may also implement frameInto(messages, state, arena), which adds
+# frames to a FrameArena (below) instead of returning new buffers; NetTransport
+# sends the arena's parts with one scatter/gather write.
+import struct
+from bisect import bisect_right
+
+import six
+
+from .event import _EVENT_SCHEMA_VERSION, makeMessage
+from .event_pb2 import Event, EventHeader, Extra
+
+FRAME_EVENT = 0x01
+FRAME_MESSAGE = 0x02
+FRAME_STRING_DEF = 0x10
+FRAME_INTERNED_EVENT = 0x11
+FRAME_COLUMN_BLOCK = 0x20
+FRAME_DELTA_BATCH = 0x21
+
+# protobuf field numbers of Event fields that are interned
+_EVENT_NAME = 4
+_EVENT_TARGET = 7
+_EVENT_FIELDS = 15
+# protobuf field number of Extra.key
+_EXTRA_KEY = 1
+# protobuf field numbers of Event tstamp and eid
+_EVENT_TSTAMP = 2
+_EVENT_EID = 3
+
+# max number of strings interned per connection; strings seen after the
+# table is full are sent inline
+MAX_INTERNED_STRINGS = 4096
+
+# initial size of FrameArena buffer
+ARENA_SIZE = 16 * 1024
+
+
+def encodeVarint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+# decodeVarint returns (value, new position)
+# Raises IndexError if buf ends before the varint is complete
+def decodeVarint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = six.indexbytes(buf, pos)
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not (b & 0x80):
+            return (result, pos)
+        shift += 7
+
+
+def zigzag(n):
+    return (n << 1) if n >= 0 else ((-n) << 1) - 1
+
+
+def unzigzag(n):
+    return (n >> 1) if not (n & 1) else -((n + 1) >> 1)
+
+
+# _tstampBits returns the IEEE-754 bit pattern of a float timestamp.
+# Bit patterns of nearby timestamps differ by small amounts, so their
+# deltas encode in a few bytes, and the timestamp round-trips exactly
+def _tstampBits(t):
+    return struct.unpack('<Q', struct.pack('<d', t))[0]
+
+
+def _bitsTstamp(b):
+    return struct.unpack('<d', struct.pack('<Q', b))[0]
+
+
+def makeFrame(frameType, payload):
+    return six.int2byte(frameType) + encodeVarint(len(payload)) + payload
+
+
+# readFrame reads one frame from buf at pos
+# Returns (frameType, payload, new position), or None if buf does not
+# contain a complete frame
+def readFrame(buf, pos=0):
+    try:
+        frameType = six.indexbytes(buf, pos)
+        (length, start) = decodeVarint(buf, pos + 1)
+    except IndexError:
+        return None
+    end = start + length
+    if end > len(buf):
+        return None
+    return (frameType, buf[start:end], end)
+
+
+# messageSerializer returns a serializer that encodes an Event with its
+# EventHeader (see event.makeMessage) as a FRAME_MESSAGE, so streams of
+# these messages can be read with decoder.iterEvents.
+# Serializers are shared per category, so encodings of an event are shared
+# by all handlers with the same category (see event.EncodedEvent)
+_messageSerializers = {}
+
+
+def messageSerializer(category):
+    ser = _messageSerializers.get(category)
+    if ser is None:
+        def ser(e):
+            (hbuf, buf) = makeMessage(e, category)
+            return makeFrame(FRAME_MESSAGE, encodeVarint(len(hbuf)) + hbuf + buf)
+        ser = _messageSerializers.setdefault(category, ser)
+    return ser
+
+
+# FrameArena collects the buffers for one send: small items (frame headers)
+# are written into a reusable bytearray, and payloads are referenced
+# without copying. parts is the list of buffers to write, in order.
+# An arena is reused for successive sends by one thread; it is not thread-safe.
+class FrameArena(object):
+
+    def __init__(self, size=ARENA_SIZE):
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self.reset()
+
+    # reset discards the contents, keeping the buffer for reuse
+    def reset(self):
+        self._pos = 0
+        self.parts = []
+        self.nbytes = 0
+        # bytes written by the transport
+        self.sent = 0
+        # (end offset, number of messages) at each message boundary
+        self._ends = []
+        self._msgs = []
+
+    def _reserve(self, n):
+        if self._pos + n > len(self._buf):
+            # parts may still reference the old buffer, so it can't be
+            # resized; continue in a new one
+            self._buf = bytearray(max(len(self._buf) * 2, n))
+            self._view = memoryview(self._buf)
+            self._pos = 0
+
+    # add appends a buffer (bytes or bytes-like) without copying it
+    def add(self, data):
+        self.parts.append(data)
+        self.nbytes += len(data)
+
+    # write copies data into the arena
+    def write(self, data):
+        n = len(data)
+        self._reserve(n)
+        start = self._pos
+        self._view[start:start + n] = data
+        self._pos += n
+        self.add(self._view[start:self._pos])
+
+    # frameHeader writes the type and length of a frame; the caller adds
+    # the payload next
+    def frameHeader(self, frameType, length):
+        self._reserve(11)
+        buf = self._buf
+        start = pos = self._pos
+        buf[pos] = frameType
+        pos += 1
+        while length > 0x7f:
+            buf[pos] = (length & 0x7f) | 0x80
+            length >>= 7
+            pos += 1
+        buf[pos] = length
+        self._pos = pos + 1
+        self.add(self._view[start:self._pos])
+
+    # frame adds a complete frame
+    def frame(self, frameType, payload):
+        self.frameHeader(frameType, len(payload))
+        self.add(payload)
+
+    # endMessages marks the end of n messages
+    def endMessages(self, n=1):
+        self._ends.append(self.nbytes)
+        self._msgs.append((self._msgs[-1] if self._msgs else 0) + n)
+
+    # messagesIn returns the number of messages completely contained
+    # in the first nbytes of the arena
+    def messagesIn(self, nbytes):
+        i = bisect_right(self._ends, nbytes)
+        return self._msgs[i - 1] if i else 0
+
+
+# _skipField returns the position after the value of a field with wireType
+def _skipField(buf, pos, wireType):
+    if wireType == 0:
+        return decodeVarint(buf, pos)[1]
+    if wireType == 1:
+        return pos + 8
+    if wireType == 2:
+        (length, pos) = decodeVarint(buf, pos)
+        return pos + length
+    if wireType == 5:
+        return pos + 4
+    raise ValueError("unsupported protobuf wire type %d" % wireType)
+
+
+# stripFields removes top-level fields from serialized protobuf message buf
+# @param fieldNumbers set of field numbers to remove
+# Returns the message without those fields
+def stripFields(buf, fieldNumbers):
+    parts = []
+    pos = 0
+    keep = 0
+    end = len(buf)
+    while pos < end:
+        start = pos
+        (tag, pos) = decodeVarint(buf, pos)
+        pos = _skipField(buf, pos, tag & 7)
+        if (tag >> 3) in fieldNumbers:
+            if keep < start:
+                parts.append(buf[keep:start])
+            keep = pos
+    if keep == 0:
+        return buf
+    parts.append(buf[keep:end])
+    return b''.join(parts)
+
+
+# StringTable maps strings to ids for one connection
+class StringTable(object):
+
+    def __init__(self, maxsize=MAX_INTERNED_STRINGS):
+        self._ids = {}
+        self._maxsize = maxsize
+
+    # ref appends the reference for string s to out, and appends a
+    # definition frame to defs if s is new
+    def ref(self, s, out, defs):
+        i = self._ids.get(s)
+        if i is not None:
+            out += encodeVarint(i)
+            return
+        data = s.encode('utf-8')
+        if len(self._ids) < self._maxsize:
+            i = len(self._ids) + 1
+            self._ids[s] = i
+            defs.append(makeFrame(FRAME_STRING_DEF, encodeVarint(i) + data))
+            out += encodeVarint(i)
+        else:
+            out += b'\x00' + encodeVarint(len(data)) + data
+
+
+# EventFramer frames serialized Events, one FRAME_EVENT per event
+class EventFramer(object):
+
+    # frame encodes messages (Events) for a connection
+    # @param state per-connection dict for framer state
+    # Returns list of (buffer, number of events in buffer)
+    def frame(self, messages, state):
+        return [(makeFrame(FRAME_EVENT, e.SerializeToString()), 1) for e in messages]
+
+    def frameInto(self, messages, state, arena):
+        for e in messages:
+            arena.frame(FRAME_EVENT, e.SerializeToString())
+            arena.endMessages(1)
+
+
+# InterningFramer replaces the event name, target, and field keys with
+# references to strings interned per connection.
+#
+# Interned event payload:
+#   name ref | target ref | field count (varint) |
+#   for each field: key ref | len (varint) | Extra without key |
+#   remainder of Event (protobuf, without name, target, fields)
+class InterningFramer(object):
+
+    def __init__(self, maxStrings=MAX_INTERNED_STRINGS):
+        self._maxStrings = maxStrings
+
+    def frame(self, messages, state):
+        table = state.get('strings')
+        if table is None:
+            table = state['strings'] = StringTable(self._maxStrings)
+        return [(self.encode(e, table), 1) for e in messages]
+
+    def frameInto(self, messages, state, arena):
+        table = state.get('strings')
+        if table is None:
+            table = state['strings'] = StringTable(self._maxStrings)
+        for e in messages:
+            (defs, payload) = self._encode(e, table)
+            for d in defs:
+                arena.add(d)
+            arena.frame(FRAME_INTERNED_EVENT, payload)
+            arena.endMessages(1)
+
+    # encode returns the frames for one Event: any new string
+    # definitions followed by the interned event
+    def encode(self, e, table):
+        (defs, payload) = self._encode(e, table)
+        defs.append(makeFrame(FRAME_INTERNED_EVENT, payload))
+        return b''.join(defs)
+
+    # _encode returns (list of string definition frames, interned event payload)
+    def _encode(self, e, table):
+        defs = []
+        out = bytearray()
+        table.ref(e.name, out, defs)
+        table.ref(e.target, out, defs)
+        out += encodeVarint(len(e.fields))
+        for f in e.fields:
+            table.ref(f.key, out, defs)
+            extra = stripFields(f.SerializeToString(), (_EXTRA_KEY,))
+            out += encodeVarint(len(extra))
+            out += extra
+        out += stripFields(e.SerializeToString(), (_EVENT_NAME, _EVENT_TARGET, _EVENT_FIELDS))
+        return (defs, out)
+
+
+# makeBatchMessage encodes a batch of events with delta-encoded
+# timestamps and ids. Like makeMessage, it returns (header, body):
+# the header is an EventHeader for the batch (eid and tsnano of the
+# first event, category, and msglen = length of body), and the body is,
+# for each event:
+#   tstamp delta (zigzag varint) | eid delta (zigzag varint) |
+#   len (varint) | Event without tstamp and eid (protobuf)
+# Deltas are relative to the previous event, and for the first event, to
+# the header's eid and tsnano. tstamp deltas are computed on the IEEE-754
+# bits of the float timestamp.
+def makeBatchMessage(events, category):
+    header = EventHeader(category=category)
+    if events:
+        header.eid = events[0].eid
+        header.tsnano = int(events[0].tstamp * 1e9)
+    (prevTs, prevEid) = _batchBase(header)
+    body = bytearray()
+    for e in events:
+        ts = _tstampBits(e.tstamp)
+        body += encodeVarint(zigzag(ts - prevTs))
+        body += encodeVarint(zigzag(e.eid - prevEid))
+        buf = stripFields(e.SerializeToString(), (_EVENT_TSTAMP, _EVENT_EID))
+        body += encodeVarint(len(buf))
+        body += buf
+        prevTs = ts
+        prevEid = e.eid
+    body = bytes(body)
+    header.msglen = len(body)
+    header.version.major = _EVENT_SCHEMA_VERSION[0]
+    header.version.minor = _EVENT_SCHEMA_VERSION[1]
+    return (header.SerializeToString(), body)
+
+
+# _batchBase returns the (tstamp bits, eid) that the first event
+# of a batch is delta-encoded against
+def _batchBase(header):
+    return (_tstampBits(header.tsnano / 1e9), header.eid)
+
+
+# decodeBatchMessage decodes a message from makeBatchMessage
+# @param header EventHeader, or serialized EventHeader, of the batch
+# Returns list of Events
+def decodeBatchMessage(body, header):
+    if not isinstance(header, EventHeader):
+        header = EventHeader.FromString(bytes(header))
+    events = []
+    pos = 0
+    (ts, eid) = _batchBase(header)
+    end = len(body)
+    while pos < end:
+        (d, pos) = decodeVarint(body, pos)
+        ts += unzigzag(d)
+        (d, pos) = decodeVarint(body, pos)
+        eid += unzigzag(d)
+        (length, pos) = decodeVarint(body, pos)
+        e = Event.FromString(bytes(body[pos:pos + length]))
+        pos += length
+        e.tstamp = _bitsTstamp(ts)
+        e.eid = eid
+        events.append(e)
+    return events
+
+
+# DeltaBatchFramer sends each batch of events as one FRAME_DELTA_BATCH:
+#   header len (varint) | header | body    (see makeBatchMessage)
+class DeltaBatchFramer(object):
+
+    # @param category category for the batch header
+    def __init__(self, category=''):
+        self._category = category
+
+    def frame(self, messages, state):
+        (hbuf, body) = makeBatchMessage(messages, self._category)
+        payload = encodeVarint(len(hbuf)) + hbuf + body
+        return [(makeFrame(FRAME_DELTA_BATCH, payload), len(messages))]
+
+
+# FrameDecoder decodes frames received on one connection
+class FrameDecoder(object):
+
+    def __init__(self):
+        self._strings = {}
+
+    # decode returns a list of the Events in the frame; the list is
+    # empty for frames that don't contain events (such as string definitions)
+    def decode(self, frameType, payload):
+        if frameType == FRAME_EVENT:
+            return [Event.FromString(bytes(payload))]
+        if frameType == FRAME_MESSAGE:
+            (hlen, pos) = decodeVarint(payload, 0)
+            return [Event.FromString(bytes(payload[pos + hlen:]))]
+        if frameType == FRAME_STRING_DEF:
+            (i, pos) = decodeVarint(payload, 0)
+            self._strings[i] = bytes(payload[pos:]).decode('utf-8')
+            return []
+        if frameType == FRAME_INTERNED_EVENT:
+            return [self._decodeInterned(payload)]
+        if frameType == FRAME_DELTA_BATCH:
+            (hlen, pos) = decodeVarint(payload, 0)
+            return decodeBatchMessage(payload[pos + hlen:], payload[pos:pos + hlen])
+        if frameType == FRAME_COLUMN_BLOCK:
+            from .columnar import columnsToEvents, decodeColumns
+            return columnsToEvents(*decodeColumns(payload))
+        raise ValueError("unknown frame type %d" % frameType)
+
+    def _string(self, buf, pos):
+        (i, pos) = decodeVarint(buf, pos)
+        if i:
+            return (self._strings[i], pos)
+        (length, pos) = decodeVarint(buf, pos)
+        return (bytes(buf[pos:pos + length]).decode('utf-8'), pos + length)
+
+    def _decodeInterned(self, buf):
+        (name, pos) = self._string(buf, 0)
+        (target, pos) = self._string(buf, pos)
+        (nfields, pos) = decodeVarint(buf, pos)
+        fields = []
+        for i in range(nfields):
+            (key, pos) = self._string(buf, pos)
+            (length, pos) = decodeVarint(buf, pos)
+            f = Extra.FromString(bytes(buf[pos:pos + length]))
+            f.key = key
+            fields.append(f)
+            pos += length
+        e = Event.FromString(bytes(buf[pos:]))
+        e.name = name
+        e.target = target
+        e.fields.extend(fields)
+        return e
+
+    # decodeAll decodes all complete frames in buf
+    # Returns (list of Events, number of bytes consumed)
+    def decodeAll(self, buf):
+        events = []
+        pos = 0
+        while True:
+            frame = readFrame(buf, pos)
+            if frame is None:
+                return (events, pos)
+            (frameType, payload, pos) = frame
+            events.extend(self.decode(frameType, payload))
@@ -0,0 +1,112 @@
+import threading
+import unittest
+
+from eventlog.event import fieldValue
+from eventlog.histogram import Histogram
+from helpers import MemoryEventHandler
+
+
+def fieldDict(e):
+    return dict((f.key, fieldValue(f)) for f in e.fields)
+
+
+class AggregateTest(unittest.TestCase):
+
+    def test_counter(self):
+        h = MemoryEventHandler()
+        hits = h.createTrackingValue("cache_hits", "users", fields={"db": "main"},
+                                     aggregate=True)
+
+        def worker():
+            for i in range(1000):
+                hits.inc()
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        hits.inc(5, params={"db": "replica"})
+
+        # nothing sent until flush
+        self.assertEqual(len(h.events), 0)
+        self.assertEqual(hits.get(), 4005)
+
+        h.getAggregator().flush()
+        self.assertEqual(len(h.events), 2)
+        byDb = dict((fieldDict(e)["db"], e) for e in h.events)
+        main = byDb["main"]
+        self.assertEqual(main.name, "cache_hits")
+        self.assertEqual(main.target, "users")
+        self.assertEqual(main.value, 4000)
+        self.assertEqual(fieldDict(main)["count"], 4000)
+        self.assertEqual(fieldDict(main)["delta"], 4000)
+        self.assertEqual(fieldDict(byDb["replica"])["delta"], 5)
+
+        # no updates since last flush: nothing sent
+        h.getAggregator().flush()
+        self.assertEqual(len(h.events), 2)
+
+    def test_gauge_close(self):
+        h = MemoryEventHandler()
+        depth = h.createTrackingValue("queue_depth", "jobs", aggregate=True)
+        for v in (7, 3, 12, 5):
+            depth.set(v)
+
+        # close sends final summary
+        h.close()
+        self.assertEqual(len(h.events), 1)
+        e = h.events[0]
+        self.assertEqual(e.value, 5)
+        f = fieldDict(e)
+        self.assertEqual((f["min"], f["max"], f["count"]), (3, 12, 4))
+
+    def test_histogram(self):
+        h = Histogram()
+        for i in range(1, 1001):
+            h.record(i / 1000.0)
+        self.assertEqual(h.count, 1000)
+        self.assertAlmostEqual(h.sum, 500.5)
+        # log-linear buckets: within ~6%
+        self.assertAlmostEqual(h.percentile(0.5), 0.5, delta=0.5 * 0.07)
+        self.assertAlmostEqual(h.percentile(0.99), 0.99, delta=0.99 * 0.07)
+        self.assertEqual(h.percentile(1.0), 1.0)
+
+        snap = h.snapshot()
+        self.assertEqual(snap.count, 1000)
+        self.assertEqual(h.count, 0)
+        self.assertTrue(h.percentile(0.5) is None)
+
+    def test_timer(self):
+        h = MemoryEventHandler()
+        timer = h.timer("db_query", "users")
+        for i in range(10):
+            with timer:
+                pass
+        timer.record(0.25)
+
+        @h.timer("db_query", "users")
+        def query():
+            return 42
+
+        self.assertEqual(query(), 42)
+        h.getAggregator().flush()
+        self.assertEqual(len(h.events), 1)
+        e = h.events[0]
+        f = fieldDict(e)
+        self.assertEqual(f["count"], 12)
+        self.assertEqual(e.value, 12)
+        self.assertEqual(f["max"], 0.25)
+        self.assertTrue(f["p50"] < 0.25)
+        for k in ("sum", "p90", "p99"):
+            self.assertTrue(k in f)
+
+    def test_timer_and_value(self):
+        # a timer and a value with the same name and target are separate series
+        h = MemoryEventHandler()
+        h.createTrackingValue("db", "users", aggregate=True).inc()
+        h.timer("db", "users").record(0.1)
+        h.getAggregator().flush()
+        self.assertEqual(len(h.events), 2)
+        self.assertEqual(sorted(e.value for e in h.events), [1, 1])
+        self.assertEqual(sorted("delta" in fieldDict(e) for e in h.events), [False, True])
@@ -0,0 +1,39 @@
+import sys
+import unittest
+
+from eventlog import eventContext
+from eventlog.event_pb2 import HttpMethod
+from eventlog.loglevel import INFO
+from helpers import MemoryHandler
+
+PY37 = sys.version_info >= (3, 7)
+if PY37:
+    import asyncio
+    from asynchelpers import collectSend, echoApp
+    from eventlog.asgi import AsgiEventMiddleware
+
+
+@unittest.skipIf(not PY37, "requires python 3.7")
+class AsgiMiddlewareTest(unittest.TestCase):
+
+    def test_asgi(self):
+        h = MemoryHandler()
+        sent = []
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/items',
+            'query_string': b'x=2',
+            'headers': [(b'User-Agent', b'test'), (b'Referer', b'http://a/')],
+            'client': ('10.0.0.2', 5000),
+        }
+        with eventContext(user="alice"):
+            asyncio.run(AsgiEventMiddleware(echoApp(h, 201), h)(scope, None, collectSend(sent)))
+        (inside, done) = h.events
+        self.assertEqual(sent, ['http.response.start', 'http.response.body'])
+        self.assertEqual((inside.http.path, inside.http.query), ("/items", "x=2"))
+        self.assertEqual(inside.http.method, HttpMethod.Value('POST'))
+        self.assertEqual((inside.http.user_agent, inside.http.referer), ("test", "http://a/"))
+        self.assertEqual(inside.http.remote_addr, "10.0.0.2")
+        self.assertEqual(inside.user, "alice")
+        self.assertEqual((done.value, done.http.status, done.log.level), (201, 201, INFO))
@@ -0,0 +1,54 @@
+# coroutines used by the tests of asyncio support. This module requires
+# python 3.7 or later; import it only if sys.version_info >= (3, 7)
+import asyncio
+
+from eventlog import eventContext, newEvent
+from eventlog.collector import Collector
+
+
+# runCollector sends stream to a Collector, and waits until it has
+# received count events
+async def runCollector(writer, stream, count):
+    collector = Collector(writer)
+    server = await collector.start('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    (reader, w) = await asyncio.open_connection('127.0.0.1', port)
+    w.write(stream)
+    await w.drain()
+    w.close()
+    while collector.count < count:
+        await asyncio.sleep(0.01)
+    server.close()
+    await server.wait_closed()
+    collector.writer.close()
+
+
+# scopedUsers runs one task for each user, in an eventContext for the
+# user, and returns the user of an event logged by each task, decoded
+# with decode
+async def scopedUsers(users, decode):
+    async def request(user):
+        with eventContext(user=user):
+            await asyncio.sleep(0)
+            return decode(newEvent("a", "b")).user
+
+    return await asyncio.gather(*[request(user) for user in users])
+
+
+# echoApp is an ASGI application that logs an event to handler, and
+# responds with status
+def echoApp(handler, status):
+    async def app(scope, receive, send):
+        handler.logEvent(newEvent("inside", "app"))
+        await send({'type': 'http.response.start', 'status': status, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    return app
+
+
+# collectSend returns an ASGI send callable that appends message types to sent
+def collectSend(sent):
+    async def send(message):
+        sent.append(message['type'])
+
+    return send
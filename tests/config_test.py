@@ -0,0 +1,55 @@
+import os
+import signal
+import unittest
+
+from eventlog.config import Config, getConfig
+from eventlog.event import EventSettings, newEvent
+
+
+class ConfigTest(unittest.TestCase):
+
+    def test_parse(self):
+        c = Config({"EVENTLOG_PORT": "6801", "EVENTLOG_TLS_ENABLE": "yes",
+                    "EVENTLOG_SOCKET_TIMEOUT": "2.5", "EVENTLOG_DEPLOY": "stage",
+                    "EVENTLOG_HOST": ""})
+        self.assertEqual(c.port, 6801)
+        self.assertEqual(c.tls_enable, True)
+        self.assertEqual(c.socket_timeout, 2.5)
+        self.assertEqual(c.deploy, 1)
+        self.assertEqual(c.host, None)
+        self.assertEqual(c.max_send_attempts, 3)
+        self.assertEqual(c.get("EVENTLOG_HOST", "localhost"), "localhost")
+        self.assertRaises(AttributeError, getattr, c, "no_such_setting")
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Config, {"EVENTLOG_PORT": "x"})
+        self.assertRaises(ValueError, Config, {"EVENTLOG_MAX_SEND_ATTEMPTS": "0"})
+        self.assertRaises(ValueError, Config, {"EVENTLOG_COMPRESSION": "lz4"})
+        # non-strict uses the default
+        self.assertEqual(Config({"EVENTLOG_PORT": "x"}, strict=False).port, 0)
+
+        # failed reload keeps the previous settings
+        source = {"EVENTLOG_PORT": "1"}
+        c = Config(source)
+        source["EVENTLOG_PORT"] = "x"
+        self.assertRaises(ValueError, c.reload)
+        self.assertEqual(c.port, 1)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGHUP'), "requires SIGHUP")
+    def test_reload_signal(self):
+        config = getConfig()
+        previous = signal.getsignal(signal.SIGHUP)
+        saved = os.environ.get("EVENTLOG_CLUSTER")
+        try:
+            config.installReloadSignal()
+            os.environ["EVENTLOG_CLUSTER"] = "reloaded"
+            os.kill(os.getpid(), signal.SIGHUP)
+            self.assertEqual(EventSettings.cluster, "reloaded")
+            self.assertEqual(newEvent("a", "b").server.cluster, "reloaded")
+        finally:
+            signal.signal(signal.SIGHUP, previous)
+            if saved is None:
+                del os.environ["EVENTLOG_CLUSTER"]
+            else:
+                os.environ["EVENTLOG_CLUSTER"] = saved
+            config.reload()
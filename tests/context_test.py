@@ -0,0 +1,92 @@
+import sys
+import threading
+import unittest
+
+from eventlog import EventHandler, eventContext, initMiddleware, newEvent
+from eventlog import config
+from eventlog.event import encoded, eventToBuffer, fieldValue
+from eventlog.event_pb2 import Event
+from helpers import MemoryTransport
+
+PY37 = sys.version_info >= (3, 7)
+if PY37:
+    import asyncio
+    from asynchelpers import scopedUsers
+
+
+def decoded(e):
+    return Event.FromString(encoded(e).encode(eventToBuffer))
+
+
+class ContextTest(unittest.TestCase):
+
+    def test_scope(self):
+        t = MemoryTransport()
+        h = EventHandler(t)
+        with eventContext(user="alice", session="s1", labels=["web"], fields={'tenant': 7}):
+            with eventContext(session="s2", labels=["api"]):
+                h.logEvent(newEvent("a", "b"))
+            e = newEvent("a", "b")
+            e.user = "bob"
+            h.logEvent(e)
+        h.logEvent(newEvent("a", "b"))
+        (inner, outer, none) = [Event.FromString(m) for m in t.messages]
+        self.assertEqual((inner.user, inner.session), ("alice", "s2"))
+        self.assertEqual(list(inner.labels), ["web", "api"])
+        self.assertEqual([(f.key, fieldValue(f)) for f in inner.fields], [('tenant', 7)])
+        # event values take precedence
+        self.assertEqual((outer.user, outer.session), ("bob", "s1"))
+        self.assertEqual((none.user, none.session, list(none.labels)), ("", "", []))
+
+    def test_full(self):
+        with eventContext(user="alice", fields={'k': 'v'}):
+            enc = encoded(newEvent("a", "b", value=3))
+        self.assertEqual(enc.full(), decoded(enc))
+        self.assertEqual(enc.full().user, "alice")
+        self.assertEqual(enc.event.user, "")
+
+    def test_override(self):
+        t = MemoryTransport()
+        h = EventHandler(t)
+        with eventContext(labels=["web", "api"], fields={'tenant': 7, 'region': 'us'}):
+            with eventContext(labels=["web"], fields={'tenant': 8}):
+                inner = decoded(newEvent("a", "b"))
+            e = newEvent("a", "b", fields={'tenant': 9})
+            e.labels.append("api")
+            enc = encoded(e)
+            h.logEvent(e)
+        self.assertEqual(list(inner.labels), ["api", "web"])
+        self.assertEqual([(f.key, fieldValue(f)) for f in inner.fields],
+                         [('region', 'us'), ('tenant', 8)])
+        # event fields and labels are not repeated
+        for e in (enc.full(), decoded(enc), Event.FromString(t.messages[0])):
+            self.assertEqual(list(e.labels), ["web", "api"])
+            self.assertEqual([(f.key, fieldValue(f)) for f in e.fields],
+                             [('region', 'us'), ('tenant', 9)])
+
+    def test_threads(self):
+        seen = []
+
+        def other():
+            seen.append(decoded(newEvent("a", "b")).user)
+
+        with eventContext(user="alice"):
+            t = threading.Thread(target=other)
+            t.start()
+            t.join()
+        self.assertEqual(seen, [""])
+
+    @unittest.skipIf(not PY37, "requires python 3.7")
+    def test_tasks(self):
+        self.assertEqual(asyncio.run(scopedUsers(["a", "b"], decoded)), ["a", "b"])
+
+    def test_middleware_hook(self):
+        def userContext():
+            return ("carol", "s9")
+
+        initMiddleware(userContext)
+        try:
+            e = newEvent("a", "b")
+        finally:
+            config._getUserContext = None
+        self.assertEqual((e.user, e.session), ("carol", "s9"))
@@ -0,0 +1,82 @@
+import os
+import unittest
+import warnings
+
+from eventlog import counter
+from eventlog.config import Config
+from eventlog.counter import MAX_NODE_ID, AtomicCounterP, BlockCounter, SnowflakeCounter, \
+    nodeId, snowflakeParts
+from eventlog.event import EventSettings, _newIdGenerator, newEvent
+
+
+class CounterTest(unittest.TestCase):
+
+    def test_block_counter(self):
+        c = BlockCounter(100, blockSize=4)
+        self.assertEqual([c.nextVal() for i in range(6)], [100, 101, 102, 103, 104, 105])
+
+    def test_import_all(self):
+        names = {}
+        exec("from eventlog.counter import *", names)
+        for name in counter.__all__:
+            self.assertTrue(names[name] is getattr(counter, name))
+
+    def test_threads(self):
+        for clz in (AtomicCounterP, BlockCounter):
+            (kind, elapsed, unique) = counter.testCounter(4, 5000, clz, check=True)
+            self.assertTrue(unique, kind)
+
+    def test_snowflake(self):
+        now = [1600000000.0]
+        c = SnowflakeCounter(5, clock=lambda: now[0])
+        ids = [c.nextVal() for i in range(5000)]
+        # more than 4096 ids in one ms continue in the next ms
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual(snowflakeParts(ids[0]), (1600000000000, 5, 0))
+        self.assertEqual(snowflakeParts(ids[-1]), (1600000000001, 5, 5000 - 4097))
+        # clock moving backwards doesn't repeat ids
+        now[0] -= 1
+        self.assertTrue(c.nextVal() > ids[-1])
+        now[0] += 2
+        self.assertEqual(snowflakeParts(c.nextVal()), (1600000001000, 5, 0))
+        self.assertTrue(0 <= nodeId("host", 123) <= MAX_NODE_ID)
+        self.assertRaises(ValueError, SnowflakeCounter, MAX_NODE_ID + 1)
+
+    def test_node_id(self):
+        config = Config({'EVENTLOG_ID_SCHEME': 'snowflake'})
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            _newIdGenerator(config, "host", 123)
+            self.assertEqual(len(w), 1)
+            config = Config({'EVENTLOG_ID_SCHEME': 'snowflake', 'EVENTLOG_NODE_ID': '7'})
+            gen = _newIdGenerator(config, "host", 123)
+            self.assertEqual(len(w), 1)
+        self.assertEqual(snowflakeParts(gen.nextVal())[1], 7)
+
+        # the id generator is replaced when the node id changes
+        saved = (EventSettings._idgen, EventSettings._idConfig)
+        try:
+            EventSettings.configure(config)
+            self.assertEqual(snowflakeParts(newEvent("a", "b").eid)[1], 7)
+        finally:
+            (EventSettings._idgen, EventSettings._idConfig) = saved
+
+    @unittest.skipIf(not hasattr(os, 'fork'), "requires fork")
+    def test_fork(self):
+        eid = newEvent("a", "b").eid
+        (r, w) = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                e = newEvent("a", "b")
+                os.write(w, ("%d %d" % (e.eid, e.server.pid)).encode('ascii'))
+            finally:
+                os._exit(0)
+        os.close(w)
+        data = os.read(r, 100)
+        os.close(r)
+        os.waitpid(pid, 0)
+        (childEid, childPid) = [int(v) for v in data.split()]
+        # the child has its own pid and id sequence
+        self.assertEqual(childPid, pid)
+        self.assertNotEqual(childEid, eid + 1)
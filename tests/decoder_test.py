@@ -0,0 +1,84 @@
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+from eventlog.decoder import StreamDecoder, iterEvents
+from eventlog.wire import EventFramer, InterningFramer, encodeVarint
+from helpers import makeEvents
+
+# the collector requires python 3.7 or later
+PY37 = sys.version_info >= (3, 7)
+if PY37:
+    import asyncio
+    from eventlog.collector import RotatingFileWriter
+    from asynchelpers import runCollector
+
+
+class DecoderTest(unittest.TestCase):
+
+    def test_partial_frames(self):
+        events = makeEvents(20)
+        stream = b''.join(b for (b, n) in InterningFramer().frame(events, {}))
+        # small buffer, so it is compacted and grown while decoding
+        dec = StreamDecoder(bufsize=64)
+        decoded = []
+        for i in range(0, len(stream), 7):
+            dec.feed(stream[i:i + 7])
+            decoded.extend(dec.events())
+        self.assertEqual(dec.format, 'frames')
+        self.assertEqual(dec.pending(), 0)
+        self.assertEqual(decoded, events)
+
+    def test_formats(self):
+        events = makeEvents(5)
+        delimited = b''.join(encodeVarint(len(b)) + b
+                             for b in (e.SerializeToString() for e in events))
+        self.assertEqual(list(iterEvents(delimited, 'protobuf')), events)
+
+        lines = b'{"name":"a","value":1}\n\n{"name":"b","value":2}\n'
+        self.assertEqual(list(iterEvents(io.BytesIO(lines), bufsize=16)),
+                         [{"name": "a", "value": 1}, {"name": "b", "value": 2}])
+
+        # truncated stream
+        self.assertRaises(ValueError, list, iterEvents(delimited[:-3], 'protobuf'))
+
+    def test_socket(self):
+        events = makeEvents(50)
+        (a, b) = socket.socketpair()
+        for (buf, n) in EventFramer().frame(events, {}):
+            a.sendall(buf)
+        a.close()
+        self.assertEqual(list(iterEvents(b)), events)
+        b.close()
+
+    @unittest.skipIf(not PY37, "requires python 3.7")
+    def test_rotation(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "events.log")
+            w = RotatingFileWriter(path, maxBytes=10, backupCount=2)
+            for i in range(4):
+                w.write(b"0123456789")
+            w.close()
+            self.assertEqual(sorted(os.listdir(tmp)),
+                             ["events.log", "events.log.1", "events.log.2"])
+        finally:
+            shutil.rmtree(tmp)
+
+    @unittest.skipIf(not PY37, "requires python 3.7")
+    def test_collector(self):
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, "events.log")
+        events = makeEvents(10)
+        stream = b''.join(b for (b, n) in InterningFramer().frame(events, {}))
+        try:
+            run = runCollector(RotatingFileWriter(path), stream, len(events))
+            asyncio.run(asyncio.wait_for(run, 5))
+            with open(path, 'rb') as f:
+                self.assertEqual(list(iterEvents(f, 'frames')), events)
+        finally:
+            shutil.rmtree(tmp)
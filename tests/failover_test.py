@@ -1,12 +1,11 @@
 import six
-import socket
 import sys
-import threading
 import time
 import unittest
-from eventlog.transport import NetTransport, TCPSocketFactory, HEALTHCHECK_INTERVAL_SEC
 
-TEST_PORT = 6543
+from eventlog.config import getConfig
+from eventlog.testing import FakeClock, FaultSink
+from eventlog.transport import NetTransport
 
 
 def errlog(s):
@@ -18,104 +17,19 @@ def errlog(s):
     sys.stderr.flush()
 
 
-def logBlackHole(controller, host, port):
-    s = None
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.bind((host, port))
-        s.listen(1)
-    except Exception as e:
-        errlog("Test failed to restart listener: %s, exiting" % str(e))
-        if s is not None:
-            try:
-                s.close()
-                s = None
-            except:  # noqa: E722
-                pass
-        return
-    errlog("Listener thread started")
-    try:
-        controller.setSocket(s)
-        while controller.isListening():
-            conn, addr = s.accept()
-            controller.newConnection()
-            while controller.isListening():
-                data = conn.recv(1024)
-                if not data:
-                    break
-            conn.close()
-    except Exception as e:
-        errlog("Listener thread stopped with %s" % str(e))
-    finally:
-        errlog("Listen thread exiting")
-        controller.setSocket(None)
-        s.close()
-        s = None
-
-
-class Controller(object):
-
-    def __init__(self, host, port):
-        self._shouldAccept = True
-        self._connCount = 0
-        self._host = host
-        self._port = port
-        self._thread = None
-        self._socket = None
-        self._lock = threading.RLock()
-
-    def isListening(self):
-        with self._lock:
-            return self._shouldAccept
-
-    def stopListening(self):
-        with self._lock:
-            self._shouldAccept = False
-        if self._socket:
-            try:
-                self._socket.close()
-            except:     # noqa: E722
-                # ignore potential race conditions
-                # while shutting down test
-                pass
-            self._socket = None
-        self._thread = None
-
-    def startListening(self):
-        with self._lock:
-            self._shouldAccept = True
-        self._thread = threading.Thread(target=logBlackHole, args=(self, self._host, self._port))
-        self._thread.start()
-
-    def setSocket(self, sock):
-        self._socket = sock
-
-    def newConnection(self):
-        self._connCount += 1
-
-    def connectionCount(self):
-        return self._connCount
-
-
 class FailoverLogTest(unittest.TestCase):
 
     def setUp(self):
-        self._testHost = '127.0.0.1'
-        self._testPort = TEST_PORT
         self._maxAttempts = 3
-
-        self._controller = Controller(self._testHost, self._testPort)
-
-        self._controller.startListening()
-        # give receiver thread time to start
-        time.sleep(0.05)
-        factory = TCPSocketFactory(self._testHost, self._testPort)
-        self._transport = NetTransport(factory, 1, self._maxAttempts)
+        self._sink = FaultSink()
+        self._clock = FakeClock()
+        self._transport = NetTransport(self._sink.socketFactory(), 1, self._maxAttempts,
+                                       clock=self._clock.time, sleep=self._clock.sleep)
 
     def tearDown(self):
         # not strictly necessary, but when running with tracemalloc,
         # avoids errors about leaking sockets
-        self._controller.stopListening()
+        self._sink.close()
         self._transport.closePoolConnections()
         for (k, v) in self._transport.stats.get_stats():
             errlog("%s: %f" % (k, float(v)))
@@ -123,10 +37,11 @@ class FailoverLogTest(unittest.TestCase):
     def test_full(self):
 
         tx = self._transport
+        sink = self._sink
 
         buf = ['{s:"0123456"}\n']
         self.assertTrue(tx.checkStatus(), "transport good")
-        self.assertEqual(self._controller.connectionCount(), 0)
+        self.assertEqual(sink.connections, 0)
 
         # mini-pool test
         # these should all use same connection from pool
@@ -134,50 +49,96 @@ class FailoverLogTest(unittest.TestCase):
         tx.send(buf)
         tx.send(buf)
         tx.send(buf)
-        time.sleep(0.01)
-        self.assertEqual(self._controller.connectionCount(), 1)
+        self.assertTrue(sink.waitFor(3 * len(buf[0])))
+        self.assertEqual(sink.connections, 1)
 
         # test close(), then send to re-open
         tx.closePoolConnections()
         tx.send(buf)
-        time.sleep(0.01)
-        self.assertEqual(self._controller.connectionCount(), 2)
+        self.assertTrue(sink.waitFor(4 * len(buf[0])))
+        self.assertEqual(sink.connections, 2)
 
-        errlog("Stopping listener to check failure handling, sleep 5 sec")
         # test stopListening
-        self._controller.stopListening()
+        sink.refuse()
         tx.closePoolConnections()
+        stderr = six.StringIO()
+        (sys.stderr, saved) = (stderr, sys.stderr)
         try:
-            tx.send(buf)
-            tx.send(buf)
-            send_ok = True
-        except Exception:
-            send_ok = False
-        self.assertFalse(send_ok, "send to close receiver should have failed")
-
-        # give it a chance to shut down
-        try:
+            self.assertRaises(Exception, tx.send, buf)
             # send another one just to confirm
-            tx.send(buf)
-            send_ok = True
-        except:               # noqa: E722
-            send_ok = False
-        self.assertFalse(send_ok, "expect send to fail when transport stopped")
-        self.assertFalse(tx.checkStatus(), "transport stopped")
-
-        errlog("Waiting for about 60 seconds. Should see at least one Retry message")
-        time.sleep(61)
-        self.assertFalse(tx.checkStatus(), "transport stopped")
-
-        errlog("Starting listener again...")
-        self._controller.startListening()
-
-        # wait for it to be detected
-        time.sleep(HEALTHCHECK_INTERVAL_SEC + 1)
+            self.assertRaises(Exception, tx.send, buf)
+            self.assertFalse(tx.checkStatus(), "transport stopped")
+
+            # a minute passes on the health checker's clock
+            start = self._clock.time()
+            self.assertTrue(self._clock.waitUntil(start + 61))
+            self.assertFalse(tx.checkStatus(), "transport stopped")
+        finally:
+            sys.stderr = saved
+        self.assertTrue("Retry" in stderr.getvalue(), "expect at least one Retry message")
+
+        # start listener again, and wait for it to be detected
+        sink.listen()
+        start = self._clock.time()
+        while not tx.checkStatus() and self._clock.time() < start + 60:
+            time.sleep(0.001)
         self.assertTrue(tx.checkStatus(), "transport good")
+        self.assertTrue(self._clock.time() - start <= 2 * getConfig().healthcheck_interval_sec)
+
+        # test send works after re-open: one new connection,
+        # after the health checker's connection
+        deadline = time.time() + 5
+        while sink.connections < 3 and time.time() < deadline:
+            time.sleep(0.001)
+        n = sink.received
+        tx.send(buf)
+        self.assertTrue(sink.waitFor(n + len(buf[0])))
+        self.assertEqual(sink.connections, 4)
 
-        # test send works after re-open
-        x = self._controller.connectionCount()
+    def test_reset(self):
+        tx = self._transport
+        sink = self._sink
+        sink.resetAfter = 100
+        buf = [b'x' * 50] * 4
         tx.send(buf)
-        time.sleep(0.01)
-        self.assertEqual(self._controller.connectionCount(), x + 1)
+        self.assertTrue(sink.waitFor(100))
+        # the pooled connection was reset: send retries on a new one
+        deadline = time.time() + 5
+        while sink.resets == 0 and time.time() < deadline:
+            time.sleep(0.001)
+        sink.resetAfter = 0
+        tx.send(buf)
+        self.assertTrue(sink.waitFor(300))
+        self.assertEqual(sink.connections, 2)
+        errors = [v for (k, v) in tx.stats.get_stats() if 'socket_errors' in k]
+        self.assertTrue(errors[0] >= 1)
+        # retry waits use the transport's clock
+        self.assertTrue(self._clock.time() >= 0.05)
+
+    def test_partial_reads(self):
+        sink = FaultSink(keep=True)
+        sink.readSize = 7
+        sink.latency = 0.0001
+        tx = NetTransport(sink.socketFactory(), 1, self._maxAttempts)
+        try:
+            data = [(u'%04d' % i).encode('ascii') * 10 for i in range(200)]
+            tx.send(data)
+            self.assertTrue(sink.waitFor(len(b''.join(data))))
+            self.assertEqual(bytes(sink.data), b''.join(data))
+        finally:
+            sink.close()
+            tx.closePoolConnections()
+
+    def test_connect_clock(self):
+        # connect is timed with the transport's clock
+        calls = []
+
+        def clock():
+            calls.append(1)
+            return self._clock.time()
+
+        factory = self._sink.socketFactory()
+        tx = NetTransport(factory, 1, self._maxAttempts, clock=clock)
+        factory.create_socket().close()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(tx.stats._connect.get(), 1)
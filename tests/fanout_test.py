@@ -0,0 +1,154 @@
+import unittest
+
+from six import StringIO
+
+from eventlog import (ConsoleEventHandler, EventHandler, FanoutHandler, PriorityHandler,
+                      Sink, newEvent)
+from eventlog.fanout import DROP_OLDEST
+from eventlog.event_pb2 import Event
+from eventlog.loglevel import DEBUG, ERROR, INFO, WARNING
+from eventlog.stats import lookup
+from helpers import MemoryTransport
+
+
+class FanoutTest(unittest.TestCase):
+
+    def test_slow_sink(self):
+        fast = MemoryTransport()
+        slow = MemoryTransport()
+        slow.gate.clear()
+        h = FanoutHandler([Sink(fast, name="fast"),
+                           Sink(slow, name="slow", queueSize=5, batchSize=1)],
+                          name="slow-sink-test")
+        h.logEvent(newEvent("a", "b", value=0))
+        slow.sending.wait(2)
+        for i in range(1, 20):
+            h.logEvent(newEvent("a", "b", value=i))
+        # the fast sink is not delayed by the stalled one
+        h.sinks[0].flush(2)
+        self.assertEqual([Event.FromString(m).value for m in fast.messages],
+                         list(range(20)))
+        self.assertFalse(h.sinks[1].flush(0.05))
+        slow.gate.set()
+        h.close()
+        # one event was in flight when the queue filled; the rest were dropped
+        self.assertEqual(len(slow.messages), 6)
+        stats = h.sinks[1].get_stats()
+        self.assertEqual(lookup(stats, 'dropped'), 14)
+        self.assertEqual(lookup(h.get_stats(), 'events_total'), 20)
+
+    def test_drop_oldest(self):
+        t = MemoryTransport()
+        t.gate.clear()
+        sink = Sink(t, serializer=lambda e: e.value, queueSize=3, batchSize=1,
+                    overflow=DROP_OLDEST)
+        h = FanoutHandler([sink])
+        h.logEvent(newEvent("a", "b", value=0))
+        t.sending.wait(2)
+        for i in range(1, 10):
+            h.logEvent(newEvent("a", "b", value=i))
+        t.gate.set()
+        sink.close()
+        # first event was in flight; newest three were kept
+        self.assertEqual(t.messages, [0, 7, 8, 9])
+
+    def test_spill(self):
+        spill = MemoryTransport()
+        sink = Sink(MemoryTransport(fail=True), spill=spill)
+        out = StringIO()
+        h = FanoutHandler([sink, Sink(ConsoleEventHandler(out))])
+        h.logEvent(newEvent("a", "b", message="hello"))
+        h.flush()
+        self.assertEqual(len(spill.messages), 1)
+        self.assertEqual(lookup(sink.get_stats(), 'spilled'), 1)
+        self.assertTrue("hello" in out.getvalue())
+
+    def test_loops(self):
+        h1 = ConsoleEventHandler(StringIO())
+        h2 = ConsoleEventHandler(StringIO())
+        h3 = ConsoleEventHandler(StringIO())
+        h1.setReplica(h2)
+        h2.setReplica(h3)
+        self.assertRaises(Exception, h3.setReplica, h1)
+        fan = FanoutHandler([Sink(h1)])
+        loop = Sink(fan)
+        try:
+            self.assertRaises(Exception, h3.setReplica, fan)
+            self.assertRaises(Exception, fan.addSink, loop)
+            self.assertTrue(isinstance(fan, EventHandler))
+        finally:
+            # the rejected sink's worker was started by its constructor
+            loop.close()
+            fan.close()
+
+    def test_encode_once(self):
+        calls = []
+
+        def serializer(e):
+            calls.append(e.eid)
+            return e.SerializeToString()
+
+        t1 = MemoryTransport()
+        t2 = MemoryTransport()
+        t3 = MemoryTransport()
+        h = FanoutHandler([Sink(t1, serializer=serializer), Sink(t2, serializer=serializer)])
+        primary = EventHandler(transport=t3, serializer=serializer)
+        primary.setReplica(h)
+        e = newEvent("a", "b")
+        primary.logEvent(e)
+        h.flush()
+        self.assertEqual(calls, [e.eid])
+        self.assertEqual(t1.messages, t3.messages)
+        self.assertTrue(t1.messages[0] is t2.messages[0])
+
+        # replicas that are not EventHandlers are given the Event
+        class Replica(object):
+            def __init__(self):
+                self.events = []
+
+            def logEvent(self, e):
+                self.events.append(e)
+
+        replica = Replica()
+        primary.setReplica(replica)
+        h.setReplica(replica)
+        primary.logEvent(e)
+        h.logEvent(e)
+        self.assertEqual(replica.events, [e, e])
+        self.assertTrue(isinstance(replica.events[0], Event))
+        h.close()
+
+        # console handlers with the same format share their formatting
+        c1 = ConsoleEventHandler(StringIO())
+        c2 = ConsoleEventHandler(StringIO())
+        self.assertTrue(c1.getSerializer() is c2.getSerializer())
+
+    def test_priority(self):
+        high = MemoryTransport()
+        low = MemoryTransport()
+        low.gate.clear()
+        ser = lambda e: e.value
+        h = PriorityHandler([(0, Sink(low, serializer=ser, batchSize=1, name="low")),
+                             (ERROR, Sink(high, serializer=ser, batchSize=1, name="high"))],
+                            capacity=5)
+        self.assertEqual(h.lane(WARNING), 1)
+        h.logEvent(newEvent("a", "b", value=0, level=DEBUG))
+        low.sending.wait(2)
+        # queue of low lane fills up (1 in flight + 4 queued)
+        for i in range(1, 5):
+            h.logEvent(newEvent("a", "b", value=i, level=INFO))
+        # errors are not delayed by the stalled lane, and evict low events
+        h.logEvent(newEvent("a", "b", value=100, level=ERROR))
+        h.logEvent(newEvent("a", "b", value=101, level=INFO), priority=ERROR)
+        h.sinks[0].flush(2)
+        self.assertEqual(high.messages, [100, 101])
+        # capacity is full of higher priority events: new low events are dropped
+        high.gate.clear()
+        for i in range(102, 107):
+            h.logEvent(newEvent("a", "b", value=i, level=ERROR))
+        h.logEvent(newEvent("a", "b", value=5, level=INFO))
+        low.gate.set()
+        high.gate.set()
+        h.close()
+        self.assertEqual(low.messages, [0])
+        self.assertEqual(lookup(h.sinks[1].get_stats(), 'dropped'), 5)
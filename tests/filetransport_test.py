@@ -0,0 +1,166 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from eventlog import EventHandler, FileTransport, newEvent
+from eventlog.decoder import iterEvents
+from eventlog import filetransport
+from eventlog.event import eventToJson
+from eventlog.filetransport import FORMAT_JSON
+from eventlog.stats import lookup
+
+
+class FileTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "events.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_frames(self):
+        t = FileTransport(self.path, bufferSize=1 << 20, name='frames-test')
+        h = EventHandler(t)
+        for i in range(10):
+            h.logEvent(newEvent("a", "b", value=i))
+        t.send([newEvent("a", "b", value=10).SerializeToString()])
+        # buffered until flushed
+        self.assertEqual(os.path.getsize(self.path), 0)
+        t.flush()
+        with open(self.path, 'rb') as f:
+            self.assertEqual([e.value for e in iterEvents(f.read())], list(range(11)))
+        self.assertEqual(lookup(t.get_stats(), 'sent_msgs'), 11)
+        t.close()
+
+    def test_json(self):
+        t = FileTransport(self.path, fileFormat=FORMAT_JSON, flushInterval=0.01)
+        EventHandler(t).logEvent(newEvent("a", "b", message="hello"))
+        # flushed by the background thread
+        deadline = time.time() + 2
+        while os.path.getsize(self.path) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual([json.loads(line)['message'] for line in lines], ["hello"])
+        t.close()
+
+    def test_rotate(self):
+        t = FileTransport(self.path, maxBytes=500, bufferSize=1, backupCount=3,
+                          compression='gzip')
+        for i in range(100):
+            t.send([newEvent("a", "b", value=i)])
+        t.close()
+        rotated = t.rotatedFiles()
+        self.assertEqual(len(rotated), 3)
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+        self.assertTrue(all(f.endswith(".gz") for f in rotated))
+        values = []
+        for f in rotated:
+            with gzip.open(f) as g:
+                data = g.read()
+            self.assertTrue(len(data) <= 500)
+            values.extend(e.value for e in iterEvents(data))
+        with open(self.path, 'rb') as f:
+            values.extend(e.value for e in iterEvents(f.read()))
+        # oldest files were removed; the rest are in order
+        self.assertEqual(values, list(range(100 - len(values), 100)))
+
+    def test_not_event(self):
+        for fileFormat in ('frames', FORMAT_JSON):
+            t = FileTransport(self.path, fileFormat=fileFormat)
+            data = eventToJson(newEvent("a", "b", message="hello")).encode('utf-8')
+            self.assertRaises(ValueError, t.send, [data])
+            t.close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_write_error(self):
+        t = FileTransport(self.path, bufferSize=1 << 20, maxBufferSize=1000)
+        events = [newEvent("a", "b", value=i) for i in range(10)]
+        t.send(events)
+        sent = 1
+        size = len(t._buf)
+        writes = []
+        saved = os.write
+
+        # the first write is partial, then the disk is full
+        def write(fd, data):
+            if writes:
+                raise OSError(28, "No space left on device")
+            writes.append(len(data))
+            return saved(fd, data[:10].tobytes())
+
+        filetransport.os.write = write
+        try:
+            self.assertRaises(OSError, t.flush)
+            self.assertFalse(t.checkStatus())
+            # written bytes are dropped from the buffer
+            self.assertEqual(len(t._buf), size - 10)
+            while len(t._buf) < t.maxBufferSize:
+                t.send(events)
+                sent += 1
+            # the buffer is full: messages are refused
+            self.assertRaises(OSError, t.send, events)
+        finally:
+            filetransport.os.write = saved
+        # the file is writable again: the buffer is written, then the messages
+        t.send(events[:1])
+        self.assertTrue(t.checkStatus())
+        t.close()
+        with open(self.path, 'rb') as f:
+            values = [e.value for e in iterEvents(f.read())]
+        self.assertEqual(values, list(range(10)) * sent + [0])
+
+    def test_partial_rotate(self):
+        t = FileTransport(self.path, maxBytes=200, bufferSize=1 << 20)
+        events = [newEvent("a", "b", value=i) for i in range(5)]
+        t.send(events[:2])
+        t.flush()
+        t.send(events[2:3])
+        saved = os.write
+        writes = []
+
+        # the first write is partial, then the disk is full
+        def write(fd, data):
+            if writes:
+                raise OSError(28, "No space left on device")
+            writes.append(len(data))
+            return saved(fd, data[:10].tobytes())
+
+        filetransport.os.write = write
+        try:
+            self.assertRaises(OSError, t.flush)
+        finally:
+            filetransport.os.write = saved
+        # the rest of the frame is written to the same file, before rotating
+        t.send(events[3:])
+        t.flush()
+        self.assertEqual(t.rotatedFiles(), [])
+        with open(self.path, 'rb') as f:
+            self.assertEqual([e.value for e in iterEvents(f.read())], [0, 1, 2, 3, 4])
+        t.send(events[:1])
+        t.flush()
+        self.assertEqual(len(t.rotatedFiles()), 1)
+        t.close()
+
+    def test_close_error(self):
+        t = FileTransport(self.path)
+        t.send([newEvent("a", "b")])
+
+        def write(fd, data):
+            raise OSError(28, "No space left on device")
+
+        saved = os.write
+        filetransport.os.write = write
+        try:
+            self.assertRaises(OSError, t.close)
+        finally:
+            filetransport.os.write = saved
+        # the file is closed, and the thread stopped
+        self.assertTrue(t._fd is None)
+        self.assertFalse(t._thread.is_alive())
+        self.assertRaises(Exception, t.send, [newEvent("a", "b")])
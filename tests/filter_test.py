@@ -0,0 +1,64 @@
+import logging
+import unittest
+
+from eventlog import DedupFilter, LevelFilter, NameDenyFilter
+from eventlog.event import fieldValue
+from helpers import MemoryEventHandler
+
+
+class FilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loggers = []
+
+    def tearDown(self):
+        for (log, h) in self.loggers:
+            log.removeHandler(h)
+
+    def getLogger(self, name, handler):
+        log = logging.getLogger(name)
+        log.setLevel(logging.DEBUG)
+        log.propagate = False
+        log.addHandler(handler)
+        self.loggers.append((log, handler))
+        return log
+
+    def test_level(self):
+        h = MemoryEventHandler(filters=[
+            LevelFilter({'noisy': logging.WARNING, 'noisy.ok': logging.DEBUG}),
+        ])
+        self.getLogger('noisy.lib', h).info("dropped")
+        self.getLogger('noisy.lib', h).error("kept")
+        self.getLogger('noisy.ok.sub', h).debug("kept, overridden")
+        self.getLogger('quiet', h).debug("kept, default")
+        self.assertEqual([e.message for e in h.events],
+                         ["kept", "kept, overridden", "kept, default"])
+
+    def test_deny(self):
+        h = MemoryEventHandler(filters=[NameDenyFilter([r'^boto', r'\.chatty$'])])
+        self.getLogger('botocore.client', h).error("dropped")
+        self.getLogger('app.chatty', h).error("dropped")
+        self.getLogger('app.chatty.not', h).error("kept")
+        self.assertEqual([e.message for e in h.events], ["kept"])
+        self.assertEqual(h.events[0].target, "logger:app.chatty.not")
+
+    def test_dedup(self):
+        dedup = DedupFilter(window=3600)
+        h = MemoryEventHandler(filters=[dedup])
+        log = self.getLogger('dedup', h)
+
+        # records must come from the same source line to be duplicates
+        def diskFull(path):
+            log.warning("disk %s full", path)
+
+        for i in range(5):
+            diskFull("/tmp")
+        diskFull("/var")
+        self.assertEqual(len(h.events), 2)
+
+        # expire the window; next record reports suppressed count
+        dedup._window = 0
+        diskFull("/tmp")
+        self.assertEqual(len(h.events), 3)
+        fields = dict((f.key, fieldValue(f)) for f in h.events[2].fields)
+        self.assertEqual(fields.get('dedup_suppressed'), 4)
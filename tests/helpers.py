@@ -0,0 +1,56 @@
+# fixtures shared by the tests
+import threading
+
+from eventlog import EventHandler, newEvent
+from eventlog.event import encoded
+from eventlog.event_pb2 import Event
+
+
+# MemoryTransport keeps sent messages; send blocks while gate is clear
+class MemoryTransport(object):
+
+    def __init__(self, fail=False):
+        self.messages = []
+        self.fail = fail
+        self.gate = threading.Event()
+        self.gate.set()
+        # set when a send has started
+        self.sending = threading.Event()
+
+    def checkStatus(self):
+        return True
+
+    def send(self, messages):
+        self.sending.set()
+        self.gate.wait()
+        if self.fail:
+            raise Exception("send failed")
+        self.messages.extend(messages)
+
+
+# MemoryHandler keeps events logged to it, merged with their scope
+class MemoryHandler(object):
+
+    def __init__(self):
+        self.events = []
+
+    def logEvent(self, e):
+        self.events.append(encoded(e).full())
+
+
+# EventHandler that keeps serialized events in memory
+class MemoryEventHandler(EventHandler):
+
+    def __init__(self, **kwargs):
+        super(MemoryEventHandler, self).__init__(transport=None, **kwargs)
+        self.events = []
+
+    def _sendData(self, data):
+        self.events.append(Event.FromString(data))
+
+
+def makeEvents(n):
+    return [newEvent("page_view", "logger:app.views",
+                     value=i, message="hello %d" % i,
+                     fields={"path": "/a/%d" % i, "method": "GET"})
+            for i in range(n)]
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+# importTimes returns {module: cumulative import time in microseconds}
+# for the modules imported by running code in a new interpreter
+def importTimes(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    (out, err) = proc.communicate()
+    times = {}
+    for line in err.decode('utf-8').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and '|' in line:
+            parts = line[len('import time:'):].split('|')
+            try:
+                times[parts[2].strip()] = int(parts[1])
+            except ValueError:
+                pass
+    return times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "requires -X importtime and module __getattr__")
+class ImportTest(unittest.TestCase):
+
+    def test_lazy_import(self):
+        lazy = importTimes('import eventlog')
+        self.assertTrue('eventlog' in lazy)
+        for heavy in ('google.protobuf', 'prometheus_client', 'ssl', 'socket',
+                      'eventlog.event', 'eventlog.handler', 'eventlog.transport'):
+            self.assertFalse(heavy in lazy, heavy + " imported by 'import eventlog'")
+
+        eager = importTimes('import eventlog; eventlog.EventHandler; eventlog.NetTransport')
+        self.assertTrue('eventlog.transport' in eager)
+        self.assertTrue(lazy['eventlog'] < eager['eventlog'] + eager['eventlog.transport'])
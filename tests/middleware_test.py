@@ -0,0 +1,54 @@
+import unittest
+
+from eventlog import EventMiddleware, newEvent
+from eventlog.event_pb2 import HttpMethod
+from eventlog.loglevel import ERROR, WARNING
+from helpers import MemoryHandler
+
+
+class MiddlewareTest(unittest.TestCase):
+
+    def test_wsgi(self):
+        h = MemoryHandler()
+
+        def app(environ, start_response):
+            h.logEvent(newEvent("inside", "app"))
+            start_response("404 Not Found", [])
+            return [b"missing"]
+
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': '/items/1',
+            'QUERY_STRING': 'a=1',
+            'REMOTE_ADDR': '10.0.0.1',
+            'HTTP_USER_AGENT': 'test',
+            'HTTP_X_FORWARDED_FOR': '1.2.3.4',
+        }
+        statuses = []
+        body = EventMiddleware(app, h)(environ, lambda s, hdrs: statuses.append(s))
+        self.assertEqual(list(body), [b"missing"])
+        self.assertEqual(len(h.events), 1)
+        body.close()
+        (inside, done) = h.events
+        self.assertEqual(statuses, ["404 Not Found"])
+        for e in (inside, done):
+            self.assertEqual(e.http.path, "/items/1")
+            self.assertEqual(e.http.query, "a=1")
+            self.assertEqual(e.http.method, HttpMethod.Value('GET'))
+            self.assertEqual(e.http.user_agent, "test")
+            self.assertEqual(e.http.forwarded_for, "1.2.3.4")
+            self.assertEqual(e.http.remote_addr, "10.0.0.1")
+        self.assertEqual(inside.http.status, 0)
+        self.assertEqual((done.name, done.value, done.http.status), ("http_request", 404, 404))
+        self.assertEqual(done.log.level, WARNING)
+        self.assertTrue(done.duration > 0)
+
+    def test_wsgi_error(self):
+        h = MemoryHandler()
+
+        def app(environ, start_response):
+            raise ValueError("failed")
+
+        mw = EventMiddleware(app, h)
+        self.assertRaises(ValueError, mw, {'PATH_INFO': '/'}, None)
+        self.assertEqual([(e.value, e.log.level) for e in h.events], [(500, ERROR)])
@@ -1,7 +1,9 @@
 import logging
+import os
 import random
 import time
 import unittest
+from eventlog.testing import FaultSink
 from eventlog.transport import NetTransport
 
 BUNDLE_SIZE = 5
@@ -24,20 +26,23 @@ class TransportPerfTest(unittest.TestCase):
     def setUp(self):
         self.buffers = gen_buffers(BUNDLE_SIZE, 80, 160)
         self.log = logging.getLogger("perf_test")
-        self.transport = NetTransport.createFromEnv()
+        # send to an in-process sink, unless EVENTLOG_PERF_REMOTE is set:
+        # then send to the collector at EVENTLOG_HOST and EVENTLOG_PORT
+        self.sink = None
+        self.transport = None
+        if os.environ.get("EVENTLOG_PERF_REMOTE"):
+            self.transport = NetTransport.createFromEnv()
+        if self.transport is None:
+            self.sink = FaultSink()
+            self.transport = NetTransport(self.sink.socketFactory())
 
     def tearDown(self):
-        pass
+        self.transport.closePoolConnections()
+        if self.sink is not None:
+            self.sink.close()
 
     def test_send(self):
 
-        self.assertTrue(self.transport is not None,
-            "EVENTLOG_HOST and EVENTLOG_PORT required for this test")
-
-        if self.transport is None:
-            self.log.error("Network not configured. Can't run test")
-            return
-
         t0 = time.time()
         for i in range(BUNDLES):
             self.transport.send(self.buffers)
@@ -48,3 +53,42 @@ class TransportPerfTest(unittest.TestCase):
         print("time per message: %f" % (elapsed / (BUNDLE_SIZE * BUNDLES)))
 
         print("Stats: %s" % str(self.transport.get_stats()))
+
+    # throughput and send latency when the collector reads slowly,
+    # or resets connections
+    def test_faults(self):
+        buffers = [b.encode('ascii') for b in gen_buffers(BUNDLE_SIZE, 1500, 2500)]
+        total = sum(len(b) for b in buffers) * BUNDLES
+        for fault in ('slow', 'reset'):
+            sink = FaultSink()
+            if fault == 'slow':
+                sink.readSize = 512
+                sink.bandwidth = 16 * 1024 * 1024
+            tx = NetTransport(sink.socketFactory(), max_attempts=5)
+            latencies = []
+            tx.setHooks(on_send_end=lambda t, m, elapsed: latencies.append(elapsed))
+            t0 = time.time()
+            try:
+                for i in range(BUNDLES):
+                    tx.send(buffers)
+                    if fault == 'reset' and i % 10 == 9:
+                        # reset the connection mid-stream, once it's accepted
+                        deadline = time.time() + 5
+                        while sink.connections <= sink.resets and time.time() < deadline:
+                            time.sleep(0.001)
+                        sink.dropConnections()
+                if fault == 'slow':
+                    self.assertTrue(sink.waitFor(total, 30))
+                elapsed = time.time() - t0
+            finally:
+                tx.closePoolConnections()
+                sink.close()
+            latencies.sort()
+            errors = [v for (k, v) in tx.get_stats() if 'socket_errors' in k][0]
+            print("%s: %d bytes received in %f sec (%f MB/s), %d socket errors, "
+                  "send latency p50 %f p99 %f max %f" % (
+                      fault, sink.received, elapsed, sink.received / elapsed / 1e6, errors,
+                      latencies[len(latencies) // 2],
+                      latencies[len(latencies) * 99 // 100], latencies[-1]))
+            if fault == 'reset':
+                self.assertTrue(sink.resets >= 1 and errors >= 1)
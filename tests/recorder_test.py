@@ -0,0 +1,77 @@
+import logging
+import sys
+import threading
+import unittest
+
+from eventlog import FlightRecorderHandler, newEvent
+from eventlog.loglevel import DEBUG, ERROR, INFO
+from eventlog.stats import lookup
+from helpers import MemoryHandler
+
+
+class RecorderTest(unittest.TestCase):
+
+    def test_ring(self):
+        out = MemoryHandler()
+        h = FlightRecorderHandler(out, size=3, name='ring-test')
+        for i in range(5):
+            h.logEvent(newEvent("a", "b", value=i, level=DEBUG))
+        self.assertEqual(out.events, [])
+        h.logEvent(newEvent("a", "b", value=5, level=ERROR))
+        # last three events before the trigger, and the trigger
+        self.assertEqual([e.value for e in out.events], [2, 3, 4, 5])
+        stats = h.get_stats()
+        self.assertEqual(lookup(stats, 'discarded'), 2)
+        self.assertEqual(lookup(stats, 'buffered'), 0)
+
+        # ring is empty after it is sent
+        h.logEvent(newEvent("a", "b", value=6, level=ERROR))
+        self.assertEqual(out.events[-1].value, 6)
+        self.assertEqual(len(out.events), 5)
+
+    def test_per_thread(self):
+        out = MemoryHandler()
+        h = FlightRecorderHandler(out, size=10)
+        h.logEvent(newEvent("a", "main", level=INFO))
+
+        def other():
+            h.logEvent(newEvent("a", "other", level=INFO))
+            h.logEvent(newEvent("a", "other", level=ERROR))
+
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+        self.assertEqual([e.target for e in out.events], ["other", "other"])
+
+    def test_keyed(self):
+        out = MemoryHandler()
+        current = ["r1"]
+        h = FlightRecorderHandler(out, key=lambda: current[0], maxRings=2)
+        h.logEvent(newEvent("a", "r1", level=INFO))
+        current[0] = "r2"
+        h.logEvent(newEvent("a", "r2", level=INFO))
+        h.clear()
+        h.logEvent(newEvent("a", "r2", level=ERROR))
+        current[0] = "r1"
+        h.logEvent(newEvent("a", "r1", level=ERROR))
+        self.assertEqual([e.target for e in out.events], ["r2", "r1", "r1"])
+
+    def test_records(self):
+        out = MemoryHandler()
+        h = FlightRecorderHandler(out)
+        logger = logging.getLogger("recorder_test")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(h)
+        try:
+            line = sys._getframe().f_lineno + 1
+            logger.debug("one %d", 1)
+            self.assertEqual(out.events, [])
+            logger.error("failed")
+        finally:
+            logger.removeHandler(h)
+        self.assertEqual([e.message for e in out.events], ["one 1", "failed"])
+        self.assertEqual([e.log.level for e in out.events], [DEBUG, ERROR])
+        self.assertEqual(out.events[0].log.code_func, "test_records")
+        self.assertTrue(out.events[0].log.code_file.endswith("recorder_test.py"))
+        self.assertEqual(out.events[0].log.code_line, line)
@@ -0,0 +1,64 @@
+import unittest
+
+from eventlog import Route, RouterHandler, Rule, newEvent
+from eventlog.event import addLabels
+from eventlog.event_pb2 import Event, EventHeader
+from eventlog.loglevel import DEBUG, ERROR, INFO, WARNING
+from eventlog.decoder import iterEvents
+from eventlog.wire import FRAME_MESSAGE, decodeVarint, readFrame
+from helpers import MemoryTransport
+
+
+class RoutingTest(unittest.TestCase):
+
+    def test_rules(self):
+        audit = Route(MemoryTransport(), name="audit")
+        alerts = Route(MemoryTransport(), name="alerts")
+        tagged = Route(MemoryTransport(), name="tagged")
+        rest = Route(MemoryTransport(), name="rest")
+        router = RouterHandler([
+            Rule(audit, name="audit."),
+            Rule(tagged, labels=["billing", "eu"], minLevel=WARNING),
+            Rule(alerts, minLevel=ERROR),
+            Rule(rest, target="logger:app", maxLevel=INFO),
+        ], name="rules-test")
+
+        def e(name, target="", level=INFO, labels=()):
+            ev = newEvent(name, target, level=level)
+            addLabels(ev, labels)
+            return ev
+
+        self.assertEqual(router.route(e("audit.login", level=ERROR)), audit)
+        self.assertEqual(router.route(e("auditor", level=ERROR)), alerts)
+        self.assertEqual(router.route(e("x", level=ERROR, labels=["eu", "billing"])), tagged)
+        self.assertEqual(router.route(e("x", level=ERROR, labels=["eu"])), alerts)
+        self.assertEqual(router.route(e("x", level=WARNING, labels=["eu"])), None)
+        self.assertEqual(router.route(e("log", "logger:app.views", DEBUG)), rest)
+        self.assertEqual(router.route(e("log", "logger:app.views", WARNING)), None)
+        self.assertEqual(router.route(e("log", "logger:ap", DEBUG)), None)
+
+        router.logEvent(e("log", "logger:other"))
+        router.logEvent(e("audit.x"))
+        self.assertEqual(len(audit.handler.transport.messages), 1)
+        self.assertEqual(router.stats._discarded.get(), 1)
+
+    def test_category(self):
+        t = MemoryTransport()
+        router = RouterHandler([], default=Route(t, category="audit"))
+        ev = newEvent("a", "b")
+        router.logEvent(ev)
+        (frameType, payload, end) = readFrame(t.messages[0])
+        self.assertEqual(frameType, FRAME_MESSAGE)
+        (hlen, pos) = decodeVarint(payload, 0)
+        hdr = EventHeader.FromString(payload[pos:pos + hlen])
+        self.assertEqual(hdr.category, "audit")
+        self.assertEqual(hdr.eid, ev.eid)
+        self.assertEqual(Event.FromString(payload[pos + hlen:]), ev)
+        # streams of messages can be decoded
+        router.logEvent(ev)
+        self.assertEqual(list(iterEvents(b''.join(t.messages))), [ev, ev])
+
+    def test_loop(self):
+        router = RouterHandler([])
+        router2 = RouterHandler([], default=Route(router))
+        self.assertRaises(Exception, router.setReplica, router2)
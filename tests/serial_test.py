@@ -2,6 +2,7 @@ import six
 import unittest
 
 from eventlog import newEvent, EventHandler, ConsoleEventHandler, makeMessage
+from eventlog.event import fieldValue
 from logging import getLogger
 from eventlog.event_pb2 import Event, EventHeader, HttpMethod
 from google.protobuf.json_format import MessageToJson
@@ -84,3 +85,21 @@ class ConsoleLogTest(unittest.TestCase):
         self.assertEqual(hdr.eid, e.eid)
         self.assertEqual(hdr.tsnano, int(e.tstamp * 1e9))
         self.assertEqual(hdr.msglen, len(ebuf))
+
+    def test_typed_fields(self):
+        fields = {"s": u"text", "i": -42, "big": 1 << 70, "f": 2.5,
+                  "b": True, "raw": b"\x00\x01"}
+        e = newEvent("typed", "t", fields=fields)
+        e2 = Event.FromString(e.SerializeToString())
+        values = dict((f.key, fieldValue(f)) for f in e2.fields)
+        self.assertEqual(values["s"], u"text")
+        self.assertEqual(values["i"], -42)
+        self.assertEqual(values["f"], 2.5)
+        self.assertTrue(values["b"] is True)
+        if six.PY3:
+            self.assertEqual(values["raw"], b"\x00\x01")
+        # too large for int64: sent as a string
+        self.assertEqual(values["big"], str(1 << 70))
+        types = dict((f.key, f.WhichOneof('val')) for f in e2.fields)
+        self.assertEqual(types["i"], "int_value")
+        self.assertEqual(types["s"], "value")
@@ -0,0 +1,172 @@
+import socket
+import threading
+import unittest
+
+from six.moves.urllib.request import urlopen
+
+from eventlog import EventHandler
+from eventlog.stats import Counter, Gauge, lookup, startMetricsServer
+from eventlog.transport import NetTransport, TCPSocketFactory
+from eventlog.event import newEvent
+
+
+class NullTransport(object):
+
+    def checkStatus(self):
+        return True
+
+    def send(self, messages):
+        pass
+
+
+class StatsTest(unittest.TestCase):
+
+    def test_sharded_counter(self):
+        c = Counter("test_counter", "a counter")
+
+        def worker():
+            for i in range(10000):
+                c.inc()
+
+        threads = [threading.Thread(target=worker) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        c.dec(5)
+        self.assertEqual(c.val(), ("test_counter", 39995))
+        # the cells of exited threads are added to the base value
+        self.assertEqual(len(c._cells), 1)
+        c.reset()
+        self.assertEqual(c.get(), 0)
+
+        g = Gauge("test_gauge", "a gauge")
+        g.inc(3)
+        g.set(10)
+        g.dec(1)
+        self.assertEqual(g.get(), 9)
+
+    def test_multiple_transports(self):
+        # each transport has its own stats instance; creating several
+        # must not collide in the prometheus registry
+        t1 = NetTransport(TCPSocketFactory('127.0.0.1', 1), name='stats-test-a')
+        t2 = NetTransport(TCPSocketFactory('127.0.0.1', 1), name='stats-test-b')
+        t1.stats.events_sent(3)
+        self.assertEqual(lookup(t1.get_stats(), 'sent_msgs'), 3)
+        self.assertEqual(lookup(t2.get_stats(), 'sent_msgs'), 0)
+        t1.close()
+        t2.close()
+
+    def test_handler_stats(self):
+        h = EventHandler(transport=NullTransport(), name='stats-test')
+        h.logEvent(newEvent("a", "b"))
+        h.logEvent(newEvent("a", "b"))
+        stats = h.get_stats()
+        self.assertEqual(lookup(stats, 'events_total'), 2)
+        self.assertEqual(lookup(stats, 'sent_total'), 2)
+        self.assertEqual(lookup(stats, 'discarded'), 0)
+        # handlers with the same name share stats
+        h2 = EventHandler(transport=NullTransport(), name='stats-test')
+        h2.logEvent(newEvent("a", "b"))
+        self.assertEqual(lookup(h.get_stats(), 'events_total'), 3)
+        h.close()
+        h2.close()
+        # unnamed handlers have their own instances
+        h3 = EventHandler(transport=NullTransport())
+        h4 = EventHandler(transport=NullTransport())
+        h3.logEvent(newEvent("a", "b"))
+        self.assertNotEqual(h3.stats.instance, h4.stats.instance)
+        self.assertEqual(lookup(h3.get_stats(), 'events_total'), 1)
+        self.assertEqual(lookup(h4.get_stats(), 'events_total'), 0)
+        h3.close()
+        h4.close()
+
+    def test_metrics_server(self):
+        h = EventHandler(transport=NullTransport(), name='metrics-test')
+        h.logEvent(newEvent("a", "b"))
+        server = startMetricsServer(0)
+        try:
+            port = server.server_address[1]
+            url = "http://127.0.0.1:%d/metrics" % port
+            body = urlopen(url).read().decode('utf-8')
+            self.assertTrue('eventlog_log_events' in body)
+            self.assertTrue('instance="metrics-test"' in body)
+            # closed handlers are removed from the registry
+            h.close()
+            body = urlopen(url).read().decode('utf-8')
+            self.assertFalse('instance="metrics-test"' in body)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_send_hooks(self):
+        # listener that accepts and discards data
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+
+        def drain():
+            conn, addr = listener.accept()
+            while conn.recv(4096):
+                pass
+            conn.close()
+
+        t = threading.Thread(target=drain)
+        t.daemon = True
+        t.start()
+
+        calls = []
+        tx = NetTransport(TCPSocketFactory('127.0.0.1', port), 1, 1, name='hooks-test')
+        tx.setHooks(on_send_start=lambda tx, msgs: calls.append(('start', len(msgs))),
+                    on_send_end=lambda tx, msgs, elapsed: calls.append(('end', len(msgs))))
+        try:
+            tx.send([b'abc', b'defg'])
+            tx.send([b'hij'])
+        finally:
+            tx.closePoolConnections()
+            t.join(1)
+            listener.close()
+        self.assertEqual(calls, [('start', 2), ('end', 2), ('start', 1), ('end', 1)])
+        stats = tx.get_stats()
+        self.assertEqual(lookup(stats, 'sent_msgs'), 3)
+        self.assertEqual(lookup(stats, 'sent_bytes'), 10)
+        self.assertEqual(lookup(stats, 'sockets_created'), 1)
+        self.assertEqual(tx.stats._sendall.get(), 2)
+        self.assertEqual(tx.stats._connect.get(), 1)
+
+    def test_counter_factory(self):
+        # socket factories that predate setStats only count sockets
+        class CounterFactory(object):
+            def setCounter(self, ctr):
+                self.counter = ctr
+
+            def create_socket(self, timeout=None, stats=True):
+                if stats:
+                    self.counter.inc(1)
+                raise socket.error("not connected")
+
+            def info(self):
+                return "CounterFactory"
+
+        factory = CounterFactory()
+        tx = NetTransport(factory, 1, 1, name='counter-test')
+        self.assertTrue(factory.counter is tx.stats.getSocketCounter())
+        self.assertRaises(Exception, tx.send, [b'abc'])
+        self.assertEqual(lookup(tx.get_stats(), 'sockets_created'), 1)
+        tx.close()
+
+    def test_drop_hook(self):
+        # nothing listening on this port
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+        s.close()
+
+        calls = []
+        tx = NetTransport(TCPSocketFactory('127.0.0.1', port), 1, 2, name='drop-test')
+        tx.setHooks(on_retry=lambda tx, n, e: calls.append(('retry', n)),
+                    on_drop=lambda tx, msgs, n, err: calls.append(('drop', n)))
+        self.assertRaises(Exception, tx.send, [b'abc'])
+        self.assertEqual(calls, [('retry', 1), ('drop', 0)])
+        self.assertEqual(tx.stats._retry_wait.get(), 1)
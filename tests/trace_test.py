@@ -0,0 +1,110 @@
+import logging
+import sys
+import unittest
+
+import six
+
+from eventlog.event import TraceDedup, fieldValue, newEvent, newLogRecord
+
+
+class Unserializable(Exception):
+    def __init__(self):
+        super(Unserializable, self).__init__("bad")
+        self.obj = object()
+
+
+def fail(n):
+    if n == 0:
+        raise Unserializable()
+    raise ValueError("n=%d" % n)
+
+
+def excInfo(n):
+    try:
+        fail(n)
+    except Exception:
+        return sys.exc_info()
+
+
+# chained returns the exc_info of an exception raised while handling fail(n)
+def chained(n):
+    try:
+        fail(n)
+    except Exception:
+        try:
+            raise RuntimeError("while handling")
+        except RuntimeError:
+            return sys.exc_info()
+
+
+def fields(e):
+    return dict((f.key, fieldValue(f)) for f in e.fields)
+
+
+class TraceTest(unittest.TestCase):
+
+    def test_repeated(self):
+        dedup = TraceDedup(window=60)
+        events = []
+        for n in (1, 2, 1):
+            e = newEvent("log", "x")
+            dedup.addTrace(e, excInfo(n))
+            events.append(e)
+        (first, second, third) = [fields(e) for e in events]
+        self.assertTrue("Traceback" in events[0].log.stack_trace)
+        self.assertTrue("in fail" in events[0].log.stack_trace)
+        # same code path and line: same fingerprint, trace not repeated
+        self.assertEqual(first['exc_fingerprint'], second['exc_fingerprint'])
+        self.assertEqual(events[1].log.stack_trace, "ValueError: n=2\n")
+        self.assertEqual([first['exc_count'], second['exc_count'], third['exc_count']],
+                         [1, 2, 3])
+        # different line: different fingerprint
+        e = newEvent("log", "x")
+        dedup.addTrace(e, excInfo(0))
+        self.assertNotEqual(fields(e)['exc_fingerprint'], first['exc_fingerprint'])
+        self.assertTrue("Traceback" in e.log.stack_trace)
+
+    def test_window(self):
+        dedup = TraceDedup(window=0, maxsize=1)
+        for n in (1, 1):
+            e = newEvent("log", "x")
+            dedup.addTrace(e, excInfo(n))
+            self.assertEqual(fields(e)['exc_count'], 1)
+        dedup.addTrace(newEvent("log", "x"), excInfo(0))
+        self.assertEqual(len(dedup._seen), 1)
+
+    def test_suppressed(self):
+        dedup = TraceDedup(window=60)
+        for i in range(3):
+            e = newEvent("log", "x")
+            dedup.addTrace(e, excInfo(1))
+            self.assertFalse('exc_suppressed' in fields(e))
+        # the window expires: the next event reports the previous window
+        for entry in dedup._seen.values():
+            entry[0] -= 61
+        e = newEvent("log", "x")
+        dedup.addTrace(e, excInfo(1))
+        self.assertEqual((fields(e)['exc_count'], fields(e)['exc_suppressed']), (1, 2))
+        self.assertTrue("Traceback" in e.log.stack_trace)
+
+    @unittest.skipIf(six.PY2, "exceptions are not chained in python 2")
+    def test_chained(self):
+        dedup = TraceDedup(window=60)
+        prints = []
+        for n in (0, 1, 1):
+            e = newEvent("log", "x")
+            dedup.addTrace(e, chained(n))
+            prints.append(fields(e)['exc_fingerprint'])
+        # same outer frames, different chained exceptions
+        self.assertNotEqual(prints[0], prints[1])
+        self.assertEqual(prints[1], prints[2])
+
+    def test_log_record(self):
+        record = logging.LogRecord("t", logging.ERROR, __file__, 1, "failed", None,
+                                   excInfo(0))
+        e = newLogRecord(record)
+        self.assertTrue("Unserializable: bad" in e.log.stack_trace)
+        self.assertTrue('exc_fingerprint' in fields(e))
+        record = logging.LogRecord("t", logging.ERROR, __file__, 1, "failed", None,
+                                   (None, None, None))
+        self.assertEqual(newLogRecord(record).log.stack_trace, "")
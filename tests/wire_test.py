@@ -0,0 +1,205 @@
+import socket
+import sys
+import threading
+import unittest
+
+import six
+
+from eventlog import EventHandler, newEvent
+from eventlog.transport import Connection, NetTransport, TCPSocketFactory
+from eventlog.columnar import ColumnarFramer, decodeColumns, encodeColumns
+from eventlog.event_pb2 import EventHeader
+from eventlog.wire import DeltaBatchFramer, EventFramer, FrameArena, FrameDecoder, \
+    InterningFramer, decodeBatchMessage, makeBatchMessage, stripFields, unzigzag, zigzag
+from helpers import makeEvents
+
+
+# Listener accepts one connection and collects everything received
+class Collector(object):
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        self.data = bytearray()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        conn, addr = self.sock.accept()
+        while True:
+            buf = conn.recv(65536)
+            if not buf:
+                break
+            self.data += buf
+        conn.close()
+
+    def close(self):
+        self.thread.join(2)
+        self.sock.close()
+
+
+# ShortWriteSocket accepts at most 7 bytes per sendmsg
+class ShortWriteSocket(object):
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendmsg(self, buffers):
+        for b in buffers:
+            if len(b):
+                n = min(len(b), 7)
+                self.data += b[:n]
+                return n
+        return 0
+
+
+class WireTest(unittest.TestCase):
+
+    def test_strip(self):
+        e = makeEvents(1)[0]
+        buf = stripFields(e.SerializeToString(), (4, 7))
+        e2 = type(e).FromString(buf)
+        self.assertEqual(e2.name, "")
+        self.assertEqual(e2.target, "")
+        self.assertEqual(e2.message, e.message)
+        self.assertEqual(len(e2.fields), 2)
+
+    def test_interning(self):
+        events = makeEvents(10)
+        state = {}
+        framer = InterningFramer()
+        bufs = [buf for (buf, n) in framer.frame(events, state)]
+        plain = [buf for (buf, n) in EventFramer().frame(events, {})]
+        # strings are defined only in the first frame
+        self.assertTrue(len(bufs[1]) < len(plain[1]) - 20)
+
+        decoder = FrameDecoder()
+        stream = b''.join(bufs)
+        # partial frames are left for the next read
+        (decoded, used) = decoder.decodeAll(stream[:len(bufs[0]) + 5])
+        self.assertEqual(len(decoded), 1)
+        (more, used2) = decoder.decodeAll(stream[used:])
+        decoded += more
+        self.assertEqual(used + used2, len(stream))
+        self.assertEqual(decoded, events)
+
+    def test_table_full(self):
+        events = makeEvents(3)
+        bufs = [b for (b, n) in InterningFramer(maxStrings=2).frame(events, {})]
+        (decoded, used) = FrameDecoder().decodeAll(b''.join(bufs))
+        self.assertEqual(decoded, events)
+
+    def test_columnar(self):
+        events = makeEvents(20)
+        events[3].labels.extend(["a", "b"])
+        events[5].user = "alice"
+        (nrows, cols) = decodeColumns(encodeColumns(events))
+        self.assertEqual(nrows, 20)
+        self.assertEqual(list(cols['eid']), [e.eid for e in events])
+        self.assertEqual(list(cols['value']), list(range(20)))
+        self.assertEqual(cols['name'], ["page_view"] * 20)
+        self.assertEqual(cols['labels'], ["a", "b"])
+        self.assertEqual(len(cols['fields.key']), 40)
+
+        # lossless round trip through framer and decoder
+        bufs = ColumnarFramer().frame(events, {})
+        self.assertEqual(len(bufs), 1)
+        self.assertEqual(bufs[0][1], 20)
+        (decoded, used) = FrameDecoder().decodeAll(bufs[0][0])
+        self.assertEqual(decoded, events)
+
+        # a single event is sent as an event frame
+        bufs = ColumnarFramer().frame(events[:1], {})
+        self.assertEqual(bufs, EventFramer().frame(events[:1], {}))
+
+    def test_delta_batch(self):
+        for n in (0, 1, -1, 2, -2, 1 << 62, -(1 << 63)):
+            self.assertEqual(unzigzag(zigzag(n)), n)
+
+        events = makeEvents(10)
+        # out of order timestamps and ids give negative deltas
+        events[4].tstamp -= 5.0
+        events[7].eid -= 100
+        (hbuf, body) = makeBatchMessage(events, "audit")
+        hdr = EventHeader.FromString(hbuf)
+        self.assertEqual(hdr.category, "audit")
+        self.assertEqual(hdr.eid, events[0].eid)
+        self.assertEqual(hdr.msglen, len(body))
+        self.assertEqual(decodeBatchMessage(body, hbuf), events)
+        self.assertEqual(decodeBatchMessage(body, hdr), events)
+        # the first event is delta-encoded against the header
+        (hbuf, body) = makeBatchMessage(events[:1], "audit")
+        self.assertTrue(len(body) < len(events[0].SerializeToString()) - 5)
+
+        plain = sum(len(b) for (b, n) in EventFramer().frame(events, {}))
+        (buf, n) = DeltaBatchFramer("audit").frame(events, {})[0]
+        self.assertEqual(n, 10)
+        self.assertTrue(len(buf) < plain - 10 * 10)
+        (decoded, used) = FrameDecoder().decodeAll(buf)
+        self.assertEqual(decoded, events)
+
+    def test_arena(self):
+        events = makeEvents(10)
+        # tiny arena, so it moves to new buffers while framing
+        arena = FrameArena(4)
+        InterningFramer().frameInto(events, {}, arena)
+        self.assertEqual(arena.messagesIn(arena.nbytes), 10)
+        self.assertEqual(arena.messagesIn(arena.nbytes - 1), 9)
+        self.assertEqual(arena.messagesIn(0), 0)
+
+        sock = ShortWriteSocket()
+        self.assertEqual(Connection(sock).sendArena(arena), arena.nbytes)
+        (decoded, used) = FrameDecoder().decodeAll(bytes(sock.data))
+        self.assertEqual(used, arena.nbytes)
+        self.assertEqual(decoded, events)
+
+    def test_arena_empty_parts(self):
+        (a, b) = socket.socketpair()
+        try:
+            arena = FrameArena()
+            for data in (b'', b'abc', b'', b''):
+                arena.add(data)
+            self.assertEqual(Connection(a).sendArena(arena), 3)
+            self.assertEqual(b.recv(10), b'abc')
+        finally:
+            a.close()
+            b.close()
+
+    def test_transport(self):
+        collector = Collector()
+        tx = NetTransport(TCPSocketFactory('127.0.0.1', collector.port), 1, 1,
+                          framer=InterningFramer())
+        h = EventHandler(transport=tx)
+        events = makeEvents(5)
+        for e in events:
+            h.logEvent(e)
+        tx.closePoolConnections()
+        collector.close()
+        (decoded, used) = FrameDecoder().decodeAll(bytes(collector.data))
+        self.assertEqual(used, len(collector.data))
+        self.assertEqual(decoded, events)
+
+    def test_fallback_failed(self):
+        # framing transports take Events, which are reported when
+        # the fallback fails too, without masking its exception
+        class FailingTransport(object):
+            framer = EventFramer()
+
+            def checkStatus(self):
+                return True
+
+            def send(self, messages):
+                raise IOError("send failed")
+
+        h = EventHandler(transport=FailingTransport(), fallbackTx=FailingTransport())
+        stderr = six.StringIO()
+        (sys.stderr, saved) = (stderr, sys.stderr)
+        try:
+            self.assertRaises(IOError, h.logEvent, newEvent("a", "b"))
+        finally:
+            sys.stderr = saved
+        self.assertTrue("CRITICAL" in stderr.getvalue())
+        self.assertTrue("send failed" in stderr.getvalue())